@@ -0,0 +1,149 @@
+"""Benchmarks loading a large history into the prompt_toolkit shell.
+
+Fills a sqlite and a json history with synthetic commands, then measures how
+long it takes from the start of the load until the first page of strings
+reaches the prompt, which is when Up-arrow and Ctrl-R start working, and until
+the whole history is loaded. The load is compared with reading every item of
+the backend before handing the first one over, which is what the shell did
+with the sqlite backend before the items were read in chunks.
+
+Run with::
+
+    python benchmarks/bench_history_load.py [number of commands]
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import prompt_toolkit.history
+
+from deepsh.built_ins import XSH
+from deepsh.history import sqlite as xh_sqlite
+from deepsh.history.json import JsonHistory
+from deepsh.history.sqlite import SqliteHistory
+from deepsh.lib import lazyjson as xlj
+from deepsh.main import setup
+from deepsh.shells.ptk_shell.history import PagedThreadedHistory, PromptToolkitHistory
+
+WORDS = (
+    "git status commit push pull ls cd make install pytest grep find echo "
+    "docker run build python pip cat less vim ssh rsync tar curl"
+).split()
+
+
+def commands(size):
+    rng = random.Random(0)
+    for i in range(size):
+        yield " ".join(rng.choices(WORDS, k=3)) + f" {i % (size // 4)}"
+
+
+def fill_sqlite(filename, size):
+    with xh_sqlite._xh_sqlite_get_conn(filename) as conn:
+        c = conn.cursor()
+        xh_sqlite._xh_sqlite_create_history_table(c)
+        rows = ((inp, 0, float(i), "bench") for i, inp in enumerate(commands(size)))
+        c.executemany(
+            "INSERT INTO deepsh_history (inp, rtn, tsb, sessionid) "
+            "VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+
+def fill_json(data_dir, size, per_session=10_000):
+    cmds = list(commands(size))
+    for n, start in enumerate(range(0, size, per_session)):
+        session = [
+            {"inp": inp, "rtn": 0, "ts": [start + i, start + i + 0.5]}
+            for i, inp in enumerate(cmds[start : start + per_session])
+        ]
+        meta = {
+            "locked": False,
+            "sessionid": f"bench-{n}",
+            "ts": [start, start + len(session)],
+            "cmds": session,
+        }
+        filename = os.path.join(data_dir, f"deepsh-bench-{n}.json")
+        with open(filename, "w", encoding="utf-8") as f:
+            xlj.ljappend_dump(meta, f, sort_keys=True)
+        os.utime(filename, (start, start))
+
+
+class EagerHistory(PromptToolkitHistory):
+    """Reads every item of the backend before yielding the first string."""
+
+    def load_history_strings(self):
+        items = list(XSH.history.all_items(newest_first=True))
+        seen = set()
+        for item in items:
+            line = item["inp"].rstrip()
+            if line not in seen:
+                seen.add(line)
+                yield line
+
+
+def load_once(history, page_size):
+    async def consume():
+        start = time.perf_counter()
+        first_page = None
+        count = 0
+        async for _ in history.load():
+            count += 1
+            if count == page_size:
+                first_page = time.perf_counter() - start
+        total = time.perf_counter() - start
+        return first_page or total, total
+
+    return asyncio.run(consume())
+
+
+def bench(label, make_history, repeat):
+    page_size = PagedThreadedHistory.page_size
+    firsts, totals = [], []
+    for _ in range(repeat):
+        first, total = load_once(make_history(), page_size)
+        firsts.append(first)
+        totals.append(total)
+    first, total = statistics.median(firsts), statistics.median(totals)
+    print(f"{label:<16} first page {first * 1e3:9.2f} ms   all {total * 1e3:9.2f} ms")
+    return first
+
+
+def main(size=500_000, repeat=5):
+    setup(env=(("TERM", "dumb"),))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        XSH.env["DEEPSH_DATA_DIR"] = tmpdir
+        data_dir = os.path.join(tmpdir, "history_json")
+        os.makedirs(data_dir)
+        filename = os.path.join(tmpdir, "history.sqlite")
+        start = time.perf_counter()
+        fill_sqlite(filename, size)
+        fill_json(data_dir, size)
+        print(f"{size} commands written in {time.perf_counter() - start:.1f} s")
+        backends = {
+            "sqlite": lambda: SqliteHistory(filename=filename, gc=False),
+            "json": lambda: JsonHistory(
+                filename=os.path.join(tmpdir, "session.json"), gc=False
+            ),
+        }
+        for name, make_backend in backends.items():
+            XSH.history = make_backend()
+            paged = bench(
+                f"{name} paged",
+                lambda: PagedThreadedHistory(PromptToolkitHistory()),
+                repeat,
+            )
+            eager = bench(
+                f"{name} eager",
+                lambda: prompt_toolkit.history.ThreadedHistory(EagerHistory()),
+                repeat,
+            )
+            print(f"{name:<16} time to first page {eager / paged:7.1f}x faster")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
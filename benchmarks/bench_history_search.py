@@ -0,0 +1,73 @@
+"""Benchmarks searching the sqlite history for a substring.
+
+Fills a history database with synthetic commands, then compares the search
+through the FTS5 trigram index with scanning every input, which is what the
+search falls back to without the index.
+
+Run with::
+
+    python benchmarks/bench_history_search.py [number of commands]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from deepsh.history import sqlite as xh_sqlite
+from deepsh.main import setup
+
+WORDS = (
+    "git status commit push pull ls cd make install pytest grep find echo "
+    "docker run build python pip cat less vim ssh rsync tar curl"
+).split()
+
+
+def fill(filename, size):
+    rng = random.Random(0)
+    with xh_sqlite._xh_sqlite_get_conn(filename) as conn:
+        c = conn.cursor()
+        xh_sqlite._xh_sqlite_create_history_table(c)
+        rows = (
+            (" ".join(rng.choices(WORDS, k=4)) + f" {i}", 0, float(i), "bench")
+            for i in range(size)
+        )
+        c.executemany(
+            "INSERT INTO deepsh_history (inp, rtn, tsb, sessionid) "
+            "VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+
+def bench(filename, query, indexed, repeat):
+    setattr(xh_sqlite.XH_SQLITE_CACHE, xh_sqlite.XH_SQLITE_HAS_FTS, indexed)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = xh_sqlite.xh_sqlite_search(query, filename=filename, limit=100)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), len(found)
+
+
+def main(size=1_000_000, repeat=5):
+    setup(env=(("TERM", "dumb"),))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "history.sqlite")
+        start = time.perf_counter()
+        fill(filename, size)
+        print(f"{size} commands written in {time.perf_counter() - start:.1f} s")
+        for query in ("rsync tar 4242", "docker", "12345"):
+            indexed, n = bench(filename, query, True, repeat)
+            scan, _ = bench(filename, query, False, repeat)
+            print(
+                f"{query!r:<18} {n:>4} found   "
+                f"index {indexed * 1e3:9.2f} ms   "
+                f"scan {scan * 1e3:9.2f} ms   "
+                f"speedup {scan / indexed:7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
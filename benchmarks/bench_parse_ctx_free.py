@@ -0,0 +1,114 @@
+"""Benchmarks the context-free parsing phase of ``Execer``, which wraps the
+lines that are not valid Python in subprocess tokens.
+
+Compares wrapping each failing top-level statement on its own with the
+previous approach of re-parsing the whole input after wrapping every line,
+which is emulated by disabling ``Execer._split_statements()``. The inputs are
+the snippets from ``tests/parsers/test_parser.py``, the ``.xsh`` files of the
+repository and a large synthetic script of bare commands and Python.
+
+Run with::
+
+    python benchmarks/bench_parse_ctx_free.py
+"""
+
+import ast
+import glob
+import os
+import statistics
+import time
+
+from deepsh.built_ins import XSH
+from deepsh.execer import Execer
+from deepsh.main import setup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHECKS = {"check_ast", "check_stmts", "check_xonsh_ast", "check_xonsh"}
+
+
+def parser_test_inputs():
+    """Collects the literal inputs of the checks in the parser tests."""
+    fname = os.path.join(ROOT, "tests", "parsers", "test_parser.py")
+    with open(fname, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    inputs = []
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in CHECKS
+            and node.args
+            and isinstance(node.args[0], ast.Constant)
+            and isinstance(node.args[0].value, str)
+        ):
+            inp = node.args[0].value
+            inputs.append(inp if inp.endswith("\n") else inp + "\n")
+    return inputs
+
+
+def xsh_files():
+    fnames = glob.glob(os.path.join(ROOT, "**", "*.xsh"), recursive=True)
+    srcs = []
+    for fname in sorted(fnames):
+        with open(fname, encoding="utf-8") as f:
+            srcs.append(f.read())
+    return srcs
+
+
+def synthetic_script(nlines=300):
+    """Mostly bare commands, with some Python and blocks in between."""
+    lines = []
+    for i in range(nlines):
+        if i % 10 == 0:
+            lines.append(f"x{i} = {i}")
+        elif i % 10 == 5:
+            lines.append(f"if x{i - 5} > 1:\n    echo big\nelse:\n    echo small")
+        else:
+            lines.append(f"echo line {i} | grep {i % 7} > /dev/null")
+    return "\n".join(lines) + "\n"
+
+
+def parse_all(execer, srcs):
+    for src in srcs:
+        try:
+            execer._parse_ctx_free(src, mode="exec", filename="<bench>")
+        except SyntaxError:
+            pass
+
+
+def bench(label, execer, srcs, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_all(execer, srcs)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main(repeat=5):
+    setup(env=(("TERM", "dumb"),))
+    execer = XSH.execer
+    inputs = {
+        "tests/parsers inputs": parser_test_inputs(),
+        ".xsh files": xsh_files(),
+        "synthetic script": [synthetic_script()],
+    }
+    split = Execer._split_statements
+    for label, srcs in inputs.items():
+        Execer._split_statements = split
+        statements = bench(label, execer, srcs, repeat)
+        Execer._split_statements = lambda self, input: None
+        try:
+            whole = bench(label, execer, srcs, repeat)
+        finally:
+            Execer._split_statements = split
+        print(
+            f"{label:<22} {len(srcs):>5} inputs   "
+            f"per statement {statements * 1e3:9.2f} ms   "
+            f"whole input {whole * 1e3:9.2f} ms   "
+            f"speedup {whole / statements:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
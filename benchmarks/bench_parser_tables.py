@@ -0,0 +1,60 @@
+"""Benchmarks the cold start of the deepsh parser.
+
+Each run starts a fresh interpreter that creates the parser and parses one
+line, either from the binary tables written by ``deepsh --build-parser-tables``
+or from the generated ``parser_table.py`` module, which is emulated by making
+``load_binary_table()`` find nothing.
+
+Run with::
+
+    python benchmarks/bench_parser_tables.py
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import time
+start = time.perf_counter()
+import deepsh.parsers.base as base
+if {python_table}:
+    base.load_binary_table = lambda path: None
+    base.write_binary_table = lambda path, parser, signature: None
+from deepsh.parser import Parser
+Parser().parse("x = 1\\n")
+print(time.perf_counter() - start)
+"""
+
+
+def run_once(python_table):
+    code = SCRIPT.format(python_table=python_table)
+    env = dict(os.environ, PYTHONPATH=ROOT, TERM="dumb")
+    out = subprocess.check_output([sys.executable, "-c", code], env=env, cwd=ROOT)
+    return float(out)
+
+
+def bench(label, python_table, repeat):
+    times = [run_once(python_table) for _ in range(repeat)]
+    median = statistics.median(times)
+    print(f"{label:<14} {median * 1e3:9.2f} ms")
+    return median
+
+
+def main(repeat=7):
+    subprocess.check_call(
+        [sys.executable, "-m", "deepsh", "--build-parser-tables"],
+        env=dict(os.environ, PYTHONPATH=ROOT, TERM="dumb"),
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+    )
+    binary = bench("binary tables", False, repeat)
+    python = bench("python tables", True, repeat)
+    print(f"speedup {python / binary:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmarks reading the output of a running command pipeline.
+
+Measures the latency of the first line, printed after the command has been
+quiet for a while, and the total throughput of iterating
+over a captured pipeline, with the event-driven wake-ups of
+``CommandPipeline.iterraw()`` and with the previous sleep/poll loop, which is
+emulated by making ``OutputSignal.wait()`` sleep for its whole timeout.
+
+Run with::
+
+    python benchmarks/bench_pipelines.py
+"""
+
+import statistics
+import sys
+import time
+
+from deepsh.built_ins import XSH
+from deepsh.main import setup
+from deepsh.procs.readers import OutputSignal
+
+# stays quiet for a while, prints the time, then floods the pipe
+SCRIPT = (
+    "import sys, time; time.sleep({delay}); print(time.time(), flush=True); "
+    "[sys.stdout.write('x' * 79 + '\\n') for _ in range({n})]"
+)
+
+
+def _polling_wait(self, count, timeout=None):
+    time.sleep(timeout)
+    return self.count
+
+
+def run_once(cmd):
+    start = time.perf_counter()
+    first = None
+    nlines = 0
+    for line in XSH.execer.eval(cmd):
+        if first is None:
+            first = time.time() - float(line)
+        nlines += 1
+    return first, time.perf_counter() - start, nlines
+
+
+def bench(label, cmd, repeat):
+    firsts, totals = [], []
+    for _ in range(repeat):
+        first, total, nlines = run_once(cmd)
+        firsts.append(first)
+        totals.append(total)
+    first = statistics.median(firsts) * 1e3
+    total = statistics.median(totals)
+    print(
+        f"{label:<8} first line {first:8.2f} ms   total {total * 1e3:8.2f} ms   "
+        f"{nlines / total:12,.0f} lines/s"
+    )
+
+
+def main(delay=0.5, nlines=100_000, repeat=5):
+    setup(env=(("RAISE_SUBPROC_ERROR", False), ("TERM", "dumb")))
+    code = SCRIPT.format(delay=delay, n=nlines)
+    cmd = f"!({sys.executable} -c @({code!r}))"
+    bench("events", cmd, repeat)
+    wait = OutputSignal.wait
+    OutputSignal.wait = _polling_wait
+    try:
+        bench("polling", cmd, repeat)
+    finally:
+        OutputSignal.wait = wait
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Benchmarks rendering the default prompt, i.e. formatting its template and
+splitting the result at its colors, as the prompt-toolkit shell does.
+
+The fields that run subprocesses are replaced by constants, so that the time
+is spent in the formatting. Compares compiling the template and the colors
+once with parsing them on every render, which is emulated by clearing the
+caches before each one.
+
+Run with::
+
+    python benchmarks/bench_prompt_render.py
+"""
+
+import statistics
+import time
+
+from deepsh import style_tools
+from deepsh.built_ins import XSH
+from deepsh.main import setup
+from deepsh.prompt import base
+
+
+def render(formatter, fields, template):
+    fields.reset()
+    return style_tools.partial_color_tokenize(formatter(template))
+
+
+def clear_caches():
+    base.compile_template.cache_clear()
+    style_tools._compile_color_template.cache_clear()
+
+
+def bench(label, template, compiled, number=2000, repeat=7):
+    fields = XSH.env["PROMPT_FIELDS"]
+    formatter = base.PromptFormatter()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            if not compiled:
+                clear_caches()
+            render(formatter, fields, template)
+        times.append((time.perf_counter() - start) / number)
+    return statistics.median(times)
+
+
+def main():
+    setup(env=(("TERM", "dumb"),))
+    fields = XSH.env["PROMPT_FIELDS"]
+    fields["curr_branch"] = "main"
+    fields["branch_color"] = "{BOLD_INTENSE_GREEN}"
+    templates = {
+        "default prompt": base.default_prompt(),
+        "many colors": "".join(
+            f"{{{color}}}{{user}}{{RESET}} " for color in ("RED", "GREEN", "BLUE") * 8
+        ),
+    }
+    for label, template in templates.items():
+        parsed = bench(label, template, compiled=False)
+        compiled = bench(label, template, compiled=True)
+        print(
+            f"{label:<16} parsed {parsed * 1e6:8.2f} us   "
+            f"compiled {compiled * 1e6:8.2f} us   "
+            f"speedup {parsed / compiled:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
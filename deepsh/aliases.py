@@ -18,6 +18,7 @@ import deepsh.history.main as xhm
 import deepsh.coreutils.which as xxw
 from deepsh.built_ins import XSH
 from deepsh.cli_utils import Annotated, Arg, ArgParserAlias
+from deepsh.codecache import ParseCache
 from deepsh.dirstack import _get_cwd, cd, dirs, popd, pushd
 from deepsh.environ import locate_binary, make_args_env
 from deepsh.foreign_shells import foreign_shell_data
@@ -351,7 +352,13 @@ class Aliases(cabc.MutableMapping):
 
 
 class ExecAlias:
-    """Provides an exec alias for deepsh source code."""
+    """Provides an exec alias for deepsh source code.
+
+    The source is compiled the first time the alias is called, and the code
+    object is reused for later calls. As the compiled code depends on which
+    names are defined at the call site, it is kept in a ``ParseCache`` of its
+    own, which only reuses it where the names are defined in the same way.
+    """
 
     def __init__(self, src, filename="<exec-alias>"):
         """
@@ -363,23 +370,40 @@ class ExecAlias:
         self.src = src
         self.filename = filename
 
+    @property
+    def src(self):
+        return self._src
+
+    @src.setter
+    def src(self, value):
+        self._src = value
+        self._codes = ParseCache(maxsize=1, persist=False)
+
+    def _compile(self, execer, glbs, locs):
+        """Returns the code object for the call site context."""
+        key = (self.src, self.filename)
+        variant = self._codes.get_variant(key, glbs, locs)
+        if variant is not None:
+            return variant[1]
+        src = self.src if self.src.endswith("\n") else self.src + "\n"
+        execer.ctxtransformer.consulted = {}
+        code = execer.compile(src, glbs=glbs, locs=locs, filename=self.filename)
+        self._codes.put(key, execer.ctxtransformer.consulted, code)
+        return code
+
     def __call__(
         self, args, stdin=None, stdout=None, stderr=None, spec=None, stack=None
     ):
         execer = XSH.execer
         frame = stack[0][0]  # execute as though we are at the call site
+        glbs, locs = frame.f_globals, frame.f_locals
 
         alias_args = {"args": args}
         for i, a in enumerate(args):
             alias_args[f"arg{i}"] = a
 
         with XSH.env.swap(alias_args):
-            execer.exec(
-                self.src,
-                glbs=frame.f_globals,
-                locs=frame.f_locals,
-                filename=self.filename,
-            )
+            execer.exec(self._compile(execer, glbs, locs), glbs=glbs, locs=locs)
         if XSH.history is not None:
             return XSH.history.last_cmd_rtn
 
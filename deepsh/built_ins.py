@@ -712,6 +712,10 @@ class DeepshSession:
 
         if self.history is not None:
             self.history.flush(at_exit=True)
+        if self.execer is not None:
+            self.execer.parse_cache.save()
+        if self.commands_cache is not None:
+            self.commands_cache.save_predictions()
 
         self.unlink_builtins()
         delattr(builtins, "__deepsh__")
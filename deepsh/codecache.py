@@ -1,42 +1,24 @@
 """Tools for caching deepsh code."""
 
+import builtins
+import collections
+import contextlib
 import hashlib
+import importlib.util
 import marshal
 import os
+import sqlite3
 import sys
+import tempfile
+import threading
+import time
 
 from deepsh import __version__ as DEEPSH_VERSION
 from deepsh.built_ins import XSH
-from deepsh.lib.lazyasd import lazyobject
 from deepsh.platform import PYTHON_VERSION_INFO_BYTES
 from deepsh.tools import is_writable_file, print_warning
 
 
-def _splitpath(path, sofar=()):
-    folder, path = os.path.split(path)
-    if path == "":
-        return sofar[::-1]
-    elif folder == "":
-        return (sofar + (path,))[::-1]
-    else:
-        return _splitpath(folder, sofar + (path,))
-
-
-@lazyobject
-def _CHARACTER_MAP():
-    cmap = {chr(o): "_" + chr(o + 32) for o in range(65, 91)}
-    cmap.update({".": "_.", "_": "__"})
-    return cmap
-
-
-def _cache_renamer(path, code=False):
-    if not code:
-        path = os.path.realpath(path)
-    o = ["".join(_CHARACTER_MAP.get(i, i) for i in w) for w in _splitpath(path)]
-    o[-1] = f"{o[-1]}.{sys.implementation.cache_tag}"
-    return o
-
-
 def should_use_cache(execer, mode):
     """
     Return ``True`` if caching has been enabled for this mode (through command
@@ -71,28 +53,11 @@ def run_compiled_code(code, glb, loc, mode):
         return type, value, traceback
 
 
-def get_cache_filename(fname, code=True):
-    """
-    Return the filename of the cache for the given filename.
-
-    Cache filenames are similar to those used by the Mercurial DVCS for its
-    internal store.
-
-    The ``code`` switch should be true if we should use the code store rather
-    than the script store.
-    """
-    datadir = XSH.env["DEEPSH_DATA_DIR"]
-    cachedir = os.path.join(
-        datadir, "deepsh_code_cache" if code else "deepsh_script_cache"
-    )
-    cachefname = os.path.join(cachedir, *_cache_renamer(fname, code=code))
-    return cachefname
-
-
 def update_cache(ccode, cache_file_name):
     """
     Update the cache at ``cache_file_name`` to contain the compiled code
-    represented by ``ccode``.
+    represented by ``ccode``. The file is replaced atomically, so that
+    sessions writing it at the same time do not leave it truncated.
     """
     if cache_file_name is not None:
         if not is_writable_file(cache_file_name):
@@ -102,11 +67,22 @@ def update_cache(ccode, cache_file_name):
                     f"Set $DEEPSH_CACHE_SCRIPTS=0, $DEEPSH_CACHE_EVERYTHING=0 to disable cache."
                 )
             return
-        os.makedirs(os.path.dirname(cache_file_name), exist_ok=True)
-        with open(cache_file_name, "wb") as cfile:
-            cfile.write(DEEPSH_VERSION.encode() + b"\n")
-            cfile.write(bytes(PYTHON_VERSION_INFO_BYTES) + b"\n")
-            marshal.dump(ccode, cfile)
+        dirname = os.path.dirname(cache_file_name)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as cfile:
+                _write_cache_versions(cfile)
+                marshal.dump(ccode, cfile)
+            os.replace(tmp, cache_file_name)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def _write_cache_versions(cfile):
+    cfile.write(DEEPSH_VERSION.encode() + b"\n")
+    cfile.write(bytes(PYTHON_VERSION_INFO_BYTES) + b"\n")
 
 
 def _check_cache_versions(cfile):
@@ -139,55 +115,18 @@ def compile_code(filename, code, execer, glb, loc, mode):
     return ccode
 
 
-def script_cache_check(filename, cachefname):
-    """
-    Check whether the script cache for a particular file is valid.
-
-    Returns a tuple containing: a boolean representing whether the cached code
-    should be used, and the cached code (or ``None`` if the cache should not be
-    used).
-    """
-    ccode = None
-    run_cached = False
-    if os.path.isfile(cachefname):
-        if os.stat(cachefname).st_mtime >= os.stat(filename).st_mtime:
-            with open(cachefname, "rb") as cfile:
-                if not _check_cache_versions(cfile):
-                    return False, None
-                ccode = marshal.load(cfile)
-                run_cached = True
-    return run_cached, ccode
-
-
 def run_script_with_cache(filename, execer, glb=None, loc=None, mode="exec"):
     """
-    Run a script, using a cached version if it exists (and the source has not
-    changed), and updating the cache as necessary.
+    Run a script, using the code cached for its content if there is any, and
+    updating the cache as necessary.
     See run_compiled_code for the return value.
     """
-    run_cached = False
-    use_cache = should_use_cache(execer, mode)
-    cachefname = get_cache_filename(filename, code=False)
-    if use_cache:
-        run_cached, ccode = script_cache_check(filename, cachefname)
-    if not run_cached:
-        with open(filename, encoding="utf-8") as f:
-            code = f.read()
-        ccode = compile_code(filename, code, execer, glb, loc, mode)
-        if use_cache:
-            update_cache(ccode, cachefname)
+    with open(filename, encoding="utf-8") as f:
+        code = f.read()
+    ccode = _compile_with_store(filename, code, execer, glb, loc, mode)
     return run_compiled_code(ccode, glb, loc, mode)
 
 
-def code_cache_name(code):
-    """
-    Return an appropriate spoofed filename for the given code.
-    """
-    if isinstance(code, str):
-        code = code.encode()
-    return hashlib.md5(code).hexdigest()
-
-
 def code_cache_check(cachefname):
     """
     Check whether the code cache for a particular piece of code is valid.
@@ -215,13 +154,392 @@ def run_code_with_cache(
     cache as necessary.
     See run_compiled_code for the return value.
     """
+    ccode = _compile_with_store(display_filename, code, execer, glb, loc, mode)
+    return run_compiled_code(ccode, glb, loc, mode)
+
+
+def _compile_with_store(filename, code, execer, glb, loc, mode):
     use_cache = should_use_cache(execer, mode)
-    filename = code_cache_name(code)
-    cachefname = get_cache_filename(filename, code=True)
-    run_cached = False
     if use_cache:
-        run_cached, ccode = code_cache_check(cachefname)
-    if not run_cached:
-        ccode = compile_code(display_filename, code, execer, glb, loc, mode)
-        update_cache(ccode, cachefname)
-    return run_compiled_code(ccode, glb, loc, mode)
+        key = CODE_STORE.key(code, filename, mode)
+        ccode = CODE_STORE.get(key)
+        if ccode is not None:
+            return ccode
+    ccode = compile_code(filename, code, execer, glb, loc, mode)
+    if use_cache:
+        CODE_STORE.put(key, ccode)
+    return ccode
+
+
+class CodeStore:
+    """A content-addressed store of compiled code, shared by all sessions.
+
+    Code objects are kept in a single SQLite database in
+    ``$DEEPSH_CACHE_DIR``, keyed on a hash of the source, the filename, the
+    mode and the deepsh and Python versions, so an entry never needs to be
+    invalidated. The store is bounded by ``$DEEPSH_CODE_CACHE_SIZE`` bytes,
+    and the least recently used entries are evicted beyond it. Errors, e.g.
+    from a read-only or locked database, are treated as cache misses.
+    """
+
+    DB_FILE = "code-cache.sqlite"
+    ATIME_RESOLUTION = 60.0
+    """Seconds before a hit updates the access time of an entry again, so
+    that repeated commands do not write to the database each time."""
+
+    def __init__(self, db_file=None):
+        """
+        Parameters
+        ----------
+        db_file : str or None, optional
+            The database file, default ``$DEEPSH_CACHE_DIR/code-cache.sqlite``.
+        """
+        self._db_file = db_file
+        self._conn = None
+        self._conn_file = None
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self):
+        env = XSH.env
+        return 0 if env is None else env.get("DEEPSH_CODE_CACHE_SIZE", 0)
+
+    @property
+    def db_file(self):
+        """The database file, or None if there is no cache dir."""
+        if self._db_file is not None:
+            return self._db_file
+        env = XSH.env
+        if env is None or "DEEPSH_CACHE_DIR" not in env:
+            return None
+        return os.path.join(env["DEEPSH_CACHE_DIR"], self.DB_FILE)
+
+    @staticmethod
+    def key(code, filename, mode):
+        """Returns the key of the code compiled from the given source."""
+        if isinstance(code, str):
+            code = code.encode()
+        h = hashlib.sha256()
+        for part in (
+            DEEPSH_VERSION.encode(),
+            bytes(PYTHON_VERSION_INFO_BYTES),
+            mode.encode(),
+            str(filename).encode(),
+            code,
+        ):
+            h.update(len(part).to_bytes(8, "little"))
+            h.update(part)
+        return h.hexdigest()
+
+    def _connect(self):
+        db_file = self.db_file
+        if db_file is None:
+            return None
+        if self._conn is not None and self._conn_file == db_file:
+            return self._conn
+        self.close()
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        conn = sqlite3.connect(db_file, timeout=1.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS code "
+            "(key TEXT PRIMARY KEY, code BLOB NOT NULL, "
+            "size INTEGER NOT NULL, atime REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS code_atime ON code (atime)")
+        conn.commit()
+        self._conn, self._conn_file = conn, db_file
+        self._total = self._stored_size(conn)
+        return conn
+
+    @staticmethod
+    def _stored_size(conn):
+        return conn.execute("SELECT TOTAL(size) FROM code").fetchone()[0]
+
+    def get(self, key):
+        """Returns the code object stored under ``key``, or None."""
+        if self.maxsize <= 0:
+            return None
+        try:
+            with self._lock:
+                conn = self._connect()
+                if conn is None:
+                    return None
+                row = conn.execute(
+                    "SELECT code, atime FROM code WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                if now - row[1] >= self.ATIME_RESOLUTION:
+                    with conn:
+                        conn.execute(
+                            "UPDATE code SET atime = ? WHERE key = ?", (now, key)
+                        )
+            return marshal.loads(row[0])
+        except (OSError, sqlite3.Error, EOFError, ValueError, TypeError):
+            return None
+
+    def put(self, key, ccode):
+        """Stores a code object, evicting the least recently used entries
+        beyond the size limit. The size of the stored entries is tracked as
+        they are added, and only counted again from the database when it
+        goes over the limit, to account for the other sessions.
+        """
+        maxsize = self.maxsize
+        data = marshal.dumps(ccode)
+        if len(data) > maxsize:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                if conn is None:
+                    return
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO code VALUES (?, ?, ?, ?)",
+                        (key, data, len(data), time.time()),
+                    )
+                    self._total += len(data)
+                    if self._total > maxsize:
+                        self._total = self._evict(conn, maxsize)
+        except (OSError, sqlite3.Error):
+            pass
+
+    def _evict(self, conn, maxsize):
+        """Deletes the least recently used entries beyond ``maxsize`` and
+        returns the size of the remaining ones.
+        """
+        total = self._stored_size(conn)
+        if total <= maxsize:
+            return total
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM code ORDER BY atime"):
+            evicted.append((key,))
+            total -= size
+            if total <= maxsize:
+                break
+        conn.executemany("DELETE FROM code WHERE key = ?", evicted)
+        return total
+
+    def __len__(self):
+        try:
+            with self._lock:
+                conn = self._connect()
+                if conn is None:
+                    return 0
+                return conn.execute("SELECT COUNT(*) FROM code").fetchone()[0]
+        except (OSError, sqlite3.Error):
+            return 0
+
+    def close(self):
+        """Closes the database connection."""
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = self._conn_file = None
+
+
+CODE_STORE = CodeStore()
+"""The store used by ``run_script_with_cache()`` and
+``run_code_with_cache()``."""
+
+
+def module_cache_filename(filename):
+    """
+    Return the PEP 3147 style bytecode cache filename of a deepsh module, e.g.
+    ``__pycache__/mod.deepsh.cpython-311.pyc`` for ``mod.xsh``. The name
+    differs from the cache of a ``mod.py`` next to it, and honors
+    ``sys.pycache_prefix``.
+    """
+    base, _ = os.path.splitext(filename)
+    return importlib.util.cache_from_source(base + ".deepsh.py")
+
+
+def source_stamp(filename):
+    """
+    Return the stamp of a source file that a module cache is valid for.
+    """
+    st = os.stat(filename)
+    return f"{st.st_mtime_ns} {st.st_size}".encode()
+
+
+def module_cache_check(cachefname, stamp):
+    """
+    Return the cached code of a deepsh module if the cache was written by the
+    same deepsh and Python versions for a source with the given stamp, or
+    ``None`` otherwise.
+    """
+    try:
+        with open(cachefname, "rb") as cfile:
+            if not _check_cache_versions(cfile):
+                return None
+            if cfile.readline(1024).strip() != stamp:
+                return None
+            return marshal.load(cfile)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def update_module_cache(ccode, cachefname, stamp):
+    """
+    Write the bytecode cache of a deepsh module, unless
+    ``sys.dont_write_bytecode`` is set. The file is replaced atomically, and
+    failures are ignored as the cache is only an optimization.
+    """
+    if sys.dont_write_bytecode:
+        return
+    tmpfname = f"{cachefname}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cachefname), exist_ok=True)
+        with open(tmpfname, "wb") as cfile:
+            _write_cache_versions(cfile)
+            cfile.write(stamp + b"\n")
+            marshal.dump(ccode, cfile)
+        os.replace(tmpfname, cachefname)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(tmpfname)
+
+
+def context_agrees(names, found, glbs, locs):
+    """
+    Return whether each of the names is defined in the given context exactly
+    when it was found while compiling, so that the context-aware
+    transformation would produce the same code.
+    """
+    return all(
+        (name in locs or name in glbs or name in builtins.__dict__) is f
+        for name, f in zip(names, found)
+    )
+
+
+class ParseCache:
+    """A least recently used cache of the code objects compiled by
+    ``Execer.compile()``, so that repeated commands and loop bodies skip the
+    parser entirely.
+
+    Entries are keyed on the source, mode and filename. The context-aware
+    transformation depends on which names are defined, so each entry also
+    records the names it looked up in the context and whether they were
+    found, and is only reused while the context agrees on all of them.
+    The size is set by ``$DEEPSH_PARSE_CACHE_SIZE``, and with
+    ``$DEEPSH_PARSE_CACHE_PERSIST`` the cache is saved to
+    ``$DEEPSH_CACHE_DIR`` between sessions.
+    """
+
+    CACHE_FILE = "parse-cache.marshal"
+    MAX_VARIANTS = 4
+    """The max number of differently transformed entries kept per source."""
+
+    def __init__(self, maxsize=None, persist=True):
+        """
+        Parameters
+        ----------
+        maxsize : int or None, optional
+            The number of sources kept, by default ``$DEEPSH_PARSE_CACHE_SIZE``.
+        persist : bool, optional
+            Whether the cache may be saved, as set by
+            ``$DEEPSH_PARSE_CACHE_PERSIST``.
+        """
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._maxsize = maxsize
+        self._persist = persist
+        self._loaded = False
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def maxsize(self):
+        if self._maxsize is not None:
+            return self._maxsize
+        env = XSH.env
+        return 0 if env is None else env.get("DEEPSH_PARSE_CACHE_SIZE", 0)
+
+    @property
+    def cache_file(self):
+        """The file the cache is saved to, or None if it is not persisted."""
+        env = XSH.env
+        if (
+            not self._persist
+            or env is None
+            or "DEEPSH_CACHE_DIR" not in env
+            or not env.get("DEEPSH_PARSE_CACHE_PERSIST", False)
+        ):
+            return None
+        return os.path.join(env["DEEPSH_CACHE_DIR"], self.CACHE_FILE)
+
+    def get(self, key, glbs, locs):
+        """Returns the cached code object for ``key`` that was compiled in a
+        context equivalent to the given globals and locals, or None.
+        """
+        variant = self.get_variant(key, glbs, locs)
+        return None if variant is None else variant[1]
+
+    def get_variant(self, key, glbs, locs):
+        """Like ``get()``, but returns a ``(consulted, code)`` tuple, where
+        ``consulted`` maps the names looked up when compiling the code to
+        whether they were found.
+        """
+        if self.maxsize <= 0:
+            return None
+        self.load()
+        with self._lock:
+            for names, found, code in self._cache.get(key, ()):
+                if context_agrees(names, found, glbs, locs):
+                    self._cache.move_to_end(key)
+                    return dict(zip(names, found)), code
+        return None
+
+    def put(self, key, consulted, code):
+        """Caches a code object along with the names consulted in the context
+        when compiling it, see ``CtxAwareTransformer.ctxvisit()``.
+        """
+        maxsize = self.maxsize
+        if maxsize <= 0:
+            return
+        with self._lock:
+            variants = self._cache.pop(key, [])
+            variants.insert(0, (tuple(consulted), tuple(consulted.values()), code))
+            del variants[self.MAX_VARIANTS :]
+            self._cache[key] = variants
+            while len(self._cache) > maxsize:
+                self._cache.popitem(last=False)
+            self._dirty = True
+
+    def clear(self):
+        """Removes all entries."""
+        with self._lock:
+            self._cache.clear()
+            self._dirty = True
+
+    def load(self):
+        """Loads the saved cache, once."""
+        if self._loaded:
+            return
+        self._loaded = True
+        cache_file = self.cache_file
+        if cache_file is None:
+            return
+        try:
+            valid, items = code_cache_check(cache_file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return  # unreadable or corrupt, it will be overwritten
+        if not valid:
+            return
+        with self._lock:
+            for key, variants in items:
+                self._cache.setdefault(tuple(key), list(variants))
+
+    def save(self):
+        """Saves the cache if it is persisted and has changed."""
+        cache_file = self.cache_file
+        if cache_file is None or not self._dirty:
+            return
+        with self._lock:
+            items = list(self._cache.items())
+            self._dirty = False
+        update_cache(items, cache_file)
@@ -7,13 +7,23 @@ True) or must be run the foreground (returns False).
 """
 
 import argparse
+import bisect
 import collections.abc as cabc
+import hashlib
+import json
+import mmap
 import os
 import pickle
+import struct
+import sys
+import tempfile
+import threading
 import time
 import typing as tp
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from deepsh.lib.dirwatch import get_dir_watcher
 from deepsh.lib.lazyasd import lazyobject
 from deepsh.platform import ON_POSIX, ON_WINDOWS, pathbasename
 from deepsh.procs.executables import (
@@ -78,20 +88,236 @@ class _Commands(tp.NamedTuple):
     cmds: "tuple[str, ...]"
 
 
+class CommandNames:
+    """The command names sorted case-insensitively, to find the names that
+    start with a prefix with a binary search.
+
+    The names are sorted by their lowercase form, so that the names starting
+    with a prefix in any case are next to each other, and those starting with
+    it in the same case are among them.
+    """
+
+    def __init__(self):
+        self._names: list[tuple[str, str]] = []
+
+    def update(self, names: tp.Collection[str]):
+        """Makes the index hold the given names, inserting and removing the
+        differences if they are few, rather than sorting them all again.
+        """
+        current = {name for _, name in self._names}
+        added = [name for name in names if name not in current]
+        removed = current.difference(names)
+        if len(added) + len(removed) > len(self._names) // 8:
+            self._names = sorted((name.lower(), name) for name in names)
+            return
+        for name in removed:
+            del self._names[bisect.bisect_left(self._names, (name.lower(), name))]
+        for name in added:
+            bisect.insort(self._names, (name.lower(), name))
+
+    def startswith(self, prefix: str, ignore_case=False) -> tp.Iterator[str]:
+        """Yields the names starting with the prefix, in sorted order."""
+        lowered = prefix.lower()
+        names = self._names
+        start = bisect.bisect_left(names, (lowered,))
+        for i in range(start, len(names)):
+            key, name = names[i]
+            if not key.startswith(lowered):
+                break
+            if ignore_case or name.startswith(prefix):
+                yield name
+
+    def __len__(self):
+        return len(self._names)
+
+
+class CommandsIndex:
+    """The commands of the ``$PATH`` directories, saved on disk so that they
+    are shared by all the shells on the host.
+
+    Each directory has its own file, named after a hash of its path, which is
+    replaced atomically when the directory is scanned again. A file holds a
+    header with the format version, the mtime of the directory when it was
+    scanned, the time of the scan and the lengths of the path and the
+    commands, followed by the path and the NUL-separated command names.
+
+    Some changes leave the mtime of the directory as is, like a chmod of a
+    file in it, or adding a file within the resolution of the mtime. So an
+    entry is only used for ``MAX_AGE`` seconds, and not at all if the
+    directory was modified just before it was scanned.
+    """
+
+    VERSION = 2
+    HEADER = struct.Struct("<6sHddII")
+    MAGIC = b"DSHCMD"
+    MAX_AGE = 600.0
+    """Seconds after which the entries are scanned again."""
+    RACY_WINDOW = 2.0
+    """Entries scanned less than this many seconds after the directory was
+    modified are not used, as a later change may have kept the mtime."""
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+
+    def filename(self, path):
+        digest = hashlib.sha1(os.fsencode(path)).hexdigest()
+        return os.path.join(self.dirname, digest + ".idx")
+
+    def get(self, path, mtime) -> "tuple[str, ...] | None":
+        """Returns the commands of the path, or None if the path is not in
+        the index, was modified since or its entry cannot be trusted.
+        """
+        try:
+            with open(self.filename(path), "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return self._parse(data, path, mtime)
+        except (OSError, ValueError, struct.error):
+            # missing, empty or truncated
+            return None
+
+    def _parse(self, data, path, mtime):
+        header = self.HEADER.unpack_from(data)
+        magic, version, saved_mtime, scanned, pathlen, size = header
+        if magic != self.MAGIC or version != self.VERSION or saved_mtime != mtime:
+            return None
+        if time.time() - scanned > self.MAX_AGE or scanned - mtime < self.RACY_WINDOW:
+            return None
+        start = self.HEADER.size
+        if data[start : start + pathlen] != os.fsencode(path):
+            return None  # a hash collision
+        start += pathlen
+        names = data[start : start + size]
+        if len(names) != size:
+            return None
+        return tuple(os.fsdecode(name) for name in names.split(b"\0") if name)
+
+    def put(self, path, mtime, cmds):
+        """Saves the commands of the path, replacing its previous entry."""
+        bpath = os.fsencode(path)
+        names = b"\0".join(os.fsencode(cmd) for cmd in cmds)
+        header = self.HEADER.pack(
+            self.MAGIC, self.VERSION, mtime, time.time(), len(bpath), len(names)
+        )
+        try:
+            os.makedirs(self.dirname, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.dirname, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(header + bpath + names)
+                os.replace(tmp, self.filename(path))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            pass  # e.g. a read-only cache directory
+
+
+class ThreadablePredictions:
+    """Whether binaries are threadable, as found by reading them, saved on
+    disk so that new shells do not read them again.
+
+    The entries are keyed by the resolved path of the binary and are only
+    used while its inode, mtime and size are the same. New entries are kept
+    in memory until ``save()``, which the shell calls when it exits.
+    """
+
+    VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._entries: dict[str, list] | None = None
+        self._updated: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(fname):
+        try:
+            path = os.path.realpath(fname)
+            st = os.stat(path)
+        except OSError:
+            return None, None
+        return path, [st.st_ino, st.st_mtime_ns, st.st_size]
+
+    def _read(self) -> dict[str, list]:
+        try:
+            with open(self.filename, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return {}
+        entries = data.get("entries")
+        return entries if isinstance(entries, dict) else {}
+
+    @property
+    def entries(self) -> dict[str, list]:
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read()
+            return self._entries
+
+    def get(self, fname) -> bool | None:
+        """Returns whether the binary is threadable, or None if it is unknown
+        or has changed since.
+        """
+        path, stamp = self._stamp(fname)
+        entry = self.entries.get(path) if path else None
+        if not isinstance(entry, list) or entry[:3] != stamp or len(entry) != 4:
+            return None
+        return bool(entry[3])
+
+    def put(self, fname, threadable: bool):
+        """Records whether the binary is threadable, to be saved later."""
+        path, stamp = self._stamp(fname)
+        if path is None:
+            return
+        entry = stamp + [threadable]
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read()
+            self._entries[path] = self._updated[path] = entry
+
+    def save(self):
+        """Writes the new entries, along with those saved by other shells
+        since they were read.
+        """
+        with self._lock:
+            if not self._updated:
+                return
+            entries = self._read()
+            entries.update(self._updated)
+            self._entries, self._updated = entries, {}
+            data = json.dumps({"version": self.VERSION, "entries": entries})
+            dirname = os.path.dirname(self.filename)
+            try:
+                fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        f.write(data)
+                    os.replace(tmp, self.filename)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+            except OSError:
+                pass  # e.g. a read-only cache directory
+
+
 def _yield_accessible_unix_file_names(path):
     """yield file names of executable files in path."""
-    if not os.path.exists(path):
+    try:
+        entries = os.scandir(path)
+    except (FileNotFoundError, NotADirectoryError):
         return
-    for file_ in os.scandir(path):
-        if is_executable_in_posix(file_):
-            yield file_.name
+    with entries:
+        for file_ in entries:
+            # is_file() uses the file type from the directory listing, so only
+            # the files need a syscall, for the access check
+            if is_executable_in_posix(file_):
+                yield file_.name
 
 
 def _executables_in_posix(path):
-    if not os.path.exists(path):
-        return
-    else:
-        yield from _yield_accessible_unix_file_names(path)
+    yield from _yield_accessible_unix_file_names(path)
 
 
 def _executables_in_windows(path):
@@ -108,6 +334,28 @@ def _executables_in_windows(path):
         return
 
 
+def _timed_executables_in(path):
+    start = time.perf_counter()
+    cmds = tuple(executables_in(path))
+    return cmds, time.perf_counter() - start
+
+
+_SCAN_POOL: "tuple[int, ThreadPoolExecutor] | None" = None
+_SCAN_POOL_LOCK = threading.Lock()
+
+
+def _scan_pool(nthreads):
+    """Returns the thread pool that scans the ``$PATH`` directories, shared
+    by the caches of this process and started on first use.
+    """
+    global _SCAN_POOL
+    with _SCAN_POOL_LOCK:
+        if _SCAN_POOL is None or _SCAN_POOL[0] != os.getpid():
+            pool = ThreadPoolExecutor(nthreads, "commands-cache-scan")
+            _SCAN_POOL = (os.getpid(), pool)
+        return _SCAN_POOL[1]
+
+
 def executables_in(path) -> tp.Iterable[str]:
     """Returns a generator of files in path that the user could execute."""
     if ON_WINDOWS:
@@ -133,15 +381,29 @@ class CommandsCache(cabc.Mapping):
     """
 
     CACHE_FILE = "path-commands-cache.pickle"
+    INDEX_DIR = "commands-index"
+    PREDICTIONS_FILE = "threadable-predictions.json"
+    SCAN_THREADS = 8
+    """The max number of directories scanned at the same time."""
 
     def __init__(self, env, aliases=None) -> None:
         # cache commands in path by mtime
         self._paths_cache: dict[str, _Commands] = {}
+        # change counts of the watched paths when they were last scanned
+        self._paths_counts: dict[str, int] = {}
+        # $PATH, the time it was resolved and the resulting paths
+        self._resolved_paths: tuple[str, float, tuple[str, ...]] | None = None
 
         # wrap aliases and commands in one place
         self._cmds_cache: dict[str, tuple[str, bool | None]] = {}
+        # the names of _cmds_cache, updated when it is first searched after
+        # it changed
+        self._names = CommandNames()
+        self._names_of: dict | None = None
 
         self._alias_checksum: int | None = None
+        # seconds taken by the last scan of each path, for debugging
+        self.scan_timings: dict[str, float] = {}
         self.threadable_predictors = default_threadable_predictors()
 
         # Path to the cache-file where all commands/aliases are cached for pre-loading"""
@@ -153,6 +415,9 @@ class CommandsCache(cabc.Mapping):
         else:
             self.aliases = aliases
         self._cache_file = None
+        self._index: CommandsIndex | None = None
+        self._predictions: ThreadablePredictions | None = None
+        self._predictions_restored = False
 
     @property
     def cache_file(self):
@@ -170,6 +435,35 @@ class CommandsCache(cabc.Mapping):
 
         return self._cache_file
 
+    @property
+    def index(self) -> "CommandsIndex | None":
+        """The index of commands shared with the other shells, if enabled."""
+        env = self.env
+        if "DEEPSH_CACHE_DIR" not in env or not env.get("COMMANDS_CACHE_INDEX", True):
+            return None
+        dirname = os.path.join(env["DEEPSH_CACHE_DIR"], self.INDEX_DIR)
+        if self._index is None or self._index.dirname != dirname:
+            self._index = CommandsIndex(dirname)
+        return self._index
+
+    def save_predictions(self):
+        """Writes the threadable predictions made since the last time."""
+        if self._predictions is not None:
+            self._predictions.save()
+
+    @property
+    def predictions(self) -> "ThreadablePredictions | None":
+        """The saved threadable predictions of the binaries, if enabled."""
+        env = self.env
+        if "DEEPSH_CACHE_DIR" not in env or not env.get(
+            "COMMANDS_CACHE_PREDICTIONS", True
+        ):
+            return None
+        fname = os.path.join(env["DEEPSH_CACHE_DIR"], self.PREDICTIONS_FILE)
+        if self._predictions is None or self._predictions.filename != fname:
+            self._predictions = ThreadablePredictions(fname)
+        return self._predictions
+
     def __contains__(self, key):
         self.update_cache()
         return self.lazyin(key)
@@ -182,6 +476,18 @@ class CommandsCache(cabc.Mapping):
         """Wrapper for handling windows path behaviour"""
         return self.all_commands.items()
 
+    def iter_commands_with_prefix(self, prefix: str, ignore_case=False):
+        """Like ``iter_commands()``, for the commands starting with the prefix,
+        in sorted order.
+        """
+        cmds = self.all_commands
+        if self._names_of is not cmds:
+            # keys() has the original case of the names on Windows
+            self._names.update(list(cmds.keys()))
+            self._names_of = cmds
+        for name in self._names.startswith(prefix, ignore_case):
+            yield name, cmds[name]
+
     def __len__(self):
         return len(self.all_commands)
 
@@ -244,10 +550,9 @@ class CommandsCache(cabc.Mapping):
         Usage ``executables`` is preferred instead of commands_cache for cases
         where you just need to locate executable command.
         """
-        env = self.env
         # iterate backwards so that entries at the front of PATH overwrite
         # entries at the back.
-        paths = get_paths(env)
+        paths = self._get_paths()
         if self._update_and_check_changes(paths):
             all_cmds = CacheDict()
             for cmd, path in self._iter_binaries(paths):
@@ -270,8 +575,65 @@ class CommandsCache(cabc.Mapping):
                     # True -> pure alias
                     all_cmds[cmd] = (cmd, True)
             self._cmds_cache = all_cmds
+            self._restore_predictions()
         return self._cmds_cache
 
+    def _restore_predictions(self):
+        """Sets the predictors of the commands whose binaries were read by
+        previous shells, from their saved predictions, on a background
+        thread once the commands are first known. The other binaries are
+        only read when their commands are run.
+        """
+        if self._predictions_restored or not ON_POSIX:
+            return
+        self._predictions_restored = True
+        store = self.predictions
+        if store is None or not os.path.exists(store.filename):
+            return
+        thread = threading.Thread(
+            target=self._set_saved_predictors,
+            args=(store, list(self._cmds_cache.items())),
+            name="threadable-predictions",
+            daemon=True,
+        )
+        thread.start()
+
+    def _set_saved_predictors(self, store, cmds):
+        if not store.entries:
+            return
+        predictors = self.threadable_predictors
+        for name, (path, alias) in cmds:
+            if alias is not None or name in predictors:
+                continue  # aliases have their own predictors
+            if (link := self.resolve_symlink(path)) and link.endswith("coreutils"):
+                continue
+            threadable = store.get(path)
+            if threadable is not None:
+                predictor = predict_true if threadable else predict_false
+                predictors.setdefault(name, predictor)
+
+    def _watch_paths(self):
+        """Whether the paths are watched for changes, rather than checked."""
+        env = self.env
+        return env.get("ENABLE_COMMANDS_CACHE", True) and env.get(
+            "COMMANDS_CACHE_WATCH_PATHS", True
+        )
+
+    def _get_paths(self):
+        """Returns the existing paths of ``$PATH``. When the paths are watched,
+        they are only resolved again when ``$PATH`` changes, or once a
+        second, to notice directories that have been created since.
+        """
+        if not self._watch_paths():
+            return get_paths(self.env)
+        # the repr of an EnvPath shows the entries without expanding them
+        key = repr(self.env.get("PATH"))
+        now = time.monotonic()
+        resolved = self._resolved_paths
+        if resolved is None or resolved[0] != key or now - resolved[1] > 1.0:
+            resolved = self._resolved_paths = (key, now, get_paths(self.env))
+        return resolved[2]
+
     def _update_paths_cache(self, paths: tp.Sequence[str]) -> bool:
         """load cached results or update cache"""
         if (not self._paths_cache) and self.cache_file and self.cache_file.exists():
@@ -282,25 +644,88 @@ class CommandsCache(cabc.Mapping):
                 # the file is corrupt
                 self.cache_file.unlink(missing_ok=True)
 
-        updated = False
+        enabled = self.env.get("ENABLE_COMMANDS_CACHE", True)
+        watcher = get_dir_watcher() if self._watch_paths() else None
+        counts = self._paths_counts
+        outdated = {}
+        changed_paths = set()
+        removed = False
         for path in paths:
-            modified_time = os.path.getmtime(path)
+            count = None
+            if watcher is not None:
+                count = watcher.count(path)
+                if count is not None and count == counts.get(path):
+                    continue  # unchanged since it was last checked
+                # a change seen by the watcher, e.g. a chmod of a file in
+                # the directory, may leave the mtime of the directory as is
+                if count is not None and path in counts:
+                    changed_paths.add(path)
+                # watch before checking, so later changes bump the count
+                count = watcher.watch(path)
+            try:
+                modified_time = os.path.getmtime(path)
+            except OSError:
+                # removed since $PATH was resolved
+                removed |= self._paths_cache.pop(path, None) is not None
+                counts.pop(path, None)
+                continue
             if (
-                (not self.env.get("ENABLE_COMMANDS_CACHE", True))
+                (path in changed_paths)
+                or (not enabled)
                 or (path not in self._paths_cache)
                 or (self._paths_cache[path].mtime != modified_time)
             ):
-                updated = True
-                self._paths_cache[path] = _Commands(
-                    modified_time, tuple(executables_in(path))
-                )
-
+                outdated[path] = modified_time
+            if count is None:
+                counts.pop(path, None)
+            else:
+                counts[path] = count
+
+        updated = bool(outdated) or removed
+        index = self.index if updated and enabled else None
+        if index is not None:
+            # another shell may have scanned them already
+            for path, mtime in list(outdated.items()):
+                if path in changed_paths:
+                    continue  # the index entry has the same mtime
+                cmds = index.get(path, mtime)
+                if cmds is not None:
+                    self._paths_cache[path] = _Commands(mtime, cmds)
+                    del outdated[path]
+        if outdated:
+            self._scan_paths(outdated)
+            if index is not None:
+                for path, mtime in outdated.items():
+                    index.put(path, mtime, self._paths_cache[path].cmds)
         if updated and self.cache_file:
             self.cache_file.write_bytes(pickle.dumps(self._paths_cache))
         return updated
 
+    def _scan_paths(self, mtimes: dict[str, float]):
+        """Lists the executables of the paths, concurrently if there are
+        several, as most of the time is spent waiting on the file system.
+        """
+        paths = list(mtimes)
+        if len(paths) == 1:
+            results = [_timed_executables_in(paths[0])]
+        else:
+            pool = _scan_pool(self.SCAN_THREADS)
+            results = list(pool.map(_timed_executables_in, paths))
+        for path, (cmds, seconds) in zip(paths, results):
+            self._paths_cache[path] = _Commands(mtimes[path], cmds)
+            self.scan_timings[path] = seconds
+        if self.env.get("DEEPSH_DEBUG", 0) >= 2:
+            for path, (cmds, seconds) in zip(paths, results):
+                print(
+                    f"commands cache: scanned {path} in {seconds * 1e3:.2f} ms, "
+                    f"{len(cmds)} commands",
+                    file=sys.stderr,
+                )
+
     def _iter_binaries(self, paths):
         for path in paths:
+            if path not in self._paths_cache:
+                continue  # removed since $PATH was resolved
             for cmd in self._paths_cache[path].cmds:
                 yield cmd, os.path.join(path, cmd)
 
@@ -482,10 +907,25 @@ class CommandsCache(cabc.Mapping):
             """
             return failure
 
+        store = self.predictions
+        threadable = None if store is None else store.get(fname)
+        if threadable is None:
+            threadable = self._read_threadable(fname, timeout)
+            if threadable is None:
+                return failure
+            if store is not None:
+                store.put(fname, threadable)
+        return predict_true if threadable else predict_false
+
+    @staticmethod
+    def _read_threadable(fname, timeout):
+        """Returns whether the binary is threadable, by searching it for
+        terminal related symbols, or None if it could not be read in time.
+        """
         try:
             fd = os.open(fname, os.O_RDONLY | os.O_NONBLOCK)
         except Exception:
-            return failure  # opening error
+            return None  # opening error
 
         search_for = {
             (b"ncurses",): [False],
@@ -502,10 +942,10 @@ class CommandsCache(cabc.Mapping):
                 # should not occur, except e.g. if a file is deleted a a dir is
                 # created with the same name between os.path.isfile and os.open
                 os.close(fd)
-                return failure
+                return None
             if len(block) == 0:
                 os.close(fd)
-                return predict_true  # no keys of search_for found
+                return True  # no keys of search_for found
             analyzed_block = previous_block + block
             for k, v in search_for.items():
                 for i in range(len(k)):
@@ -515,9 +955,9 @@ class CommandsCache(cabc.Mapping):
                         v[i] = True
                 if all(v):
                     os.close(fd)
-                    return predict_false  # use one key of search_for
+                    return False  # use one key of search_for
         os.close(fd)
-        return failure  # timeout
+        return None  # timeout
 
 
 #
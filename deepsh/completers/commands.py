@@ -10,7 +10,6 @@ from deepsh.completer import Completer
 from deepsh.completers.tools import (
     RichCompletion,
     contextual_command_completer,
-    get_filter_function,
     non_exclusive_completer,
 )
 from deepsh.lib.modules import ModuleFinder
@@ -27,13 +26,15 @@ def complete_command(command: CommandContext):
     """
 
     cmd = command.prefix
-    show_desc = (XSH.env or {}).get("CMD_COMPLETIONS_SHOW_DESC", False)
-    for s, (path, is_alias) in XSH.commands_cache.iter_commands():
-        if get_filter_function()(s, cmd):
-            kwargs = {}
-            if show_desc:
-                kwargs["description"] = "Alias" if is_alias else path
-            yield RichCompletion(s, append_space=True, **kwargs)  # type: ignore
+    env = XSH.env or {}
+    show_desc = env.get("CMD_COMPLETIONS_SHOW_DESC", False)
+    ignore_case = not env.get("CASE_SENSITIVE_COMPLETIONS")
+    cmds = XSH.commands_cache.iter_commands_with_prefix(cmd, ignore_case)
+    for s, (path, is_alias) in cmds:
+        kwargs = {}
+        if show_desc:
+            kwargs["description"] = "Alias" if is_alias else path
+        yield RichCompletion(s, append_space=True, **kwargs)  # type: ignore
     if xp.ON_WINDOWS:
         for i in executables_in("."):
             if i.startswith(cmd):
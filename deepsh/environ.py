@@ -1260,6 +1260,27 @@ class CacheSetting(Xettings):
         type_str="str",
     )
 
+    DEEPSH_CODE_CACHE_SIZE = Var.with_default(
+        64 * 1024 * 1024,
+        "The max size in bytes of the compiled code of scripts, and of all "
+        "commands with ``$DEEPSH_CACHE_EVERYTHING``, that is kept in "
+        "``$DEEPSH_CACHE_DIR``. The least recently used code is evicted "
+        "beyond it. Set to 0 to disable the cache.",
+    )
+
+    DEEPSH_PARSE_CACHE_SIZE = Var.with_default(
+        512,
+        "The number of compiled commands kept in memory, so that commands "
+        "that are run again, e.g. in a loop or from the history, are not "
+        "parsed again. Set to 0 to disable the cache.",
+    )
+
+    DEEPSH_PARSE_CACHE_PERSIST = Var.with_default(
+        False,
+        "If enabled, the cache of compiled commands is saved in "
+        "``$DEEPSH_CACHE_DIR`` when deepsh exits and loaded in new sessions.",
+    )
+
     ENABLE_COMMANDS_CACHE = Var(
         default=True,
         doc="command names in a directory are cached when enabled. "
@@ -1275,6 +1296,32 @@ class CacheSetting(Xettings):
         "If enabled, the CommandsCache is saved between runs and can reduce the startup time.",
     )
 
+    COMMANDS_CACHE_INDEX = Var.with_default(
+        True,
+        "If enabled, the commands found in the ``$PATH`` directories are saved "
+        "in ``$DEEPSH_CACHE_DIR``, one file per directory, and shared by all "
+        "the shells on the host, so that a new shell does not scan the "
+        "directories that have not changed since.",
+    )
+
+    COMMANDS_CACHE_PREDICTIONS = Var.with_default(
+        True,
+        "If enabled, whether a binary can be run on a background thread, as "
+        "predicted by reading it, is saved in ``$DEEPSH_CACHE_DIR`` so that "
+        "new shells do not read the binary again until it changes.",
+    )
+
+    COMMANDS_CACHE_WATCH_PATHS = Var.with_default(
+        True,
+        "If enabled, the ``$PATH`` directories are watched for changes in the "
+        "background, with inotify on Linux and by polling elsewhere, so that "
+        "looking up a command does not ``stat()`` every directory. Changes may "
+        "then take a moment to be noticed. Inotify does not see the changes "
+        "made by other hosts, so directories on network filesystems, like NFS, "
+        "are still checked on every lookup. If disabled, all the directories "
+        "are checked on every lookup.",
+    )
+
 
 class ChangeDirSetting(Xettings):
     """``cd`` Behavior"""
@@ -1708,6 +1755,14 @@ class PromptHistorySetting(Xettings):
         "Save history after getting SIGINT (Ctrl+C).",
         doc_default="True",
     )
+    DEEPSH_HISTORY_SQLITE_FTS = Var.with_default(
+        True,
+        "Whether the sqlite history backend keeps a full-text index of the "
+        "commands, used by ``history search`` and by history search in the "
+        "prompt when ``$DEEPSH_HISTORY_MATCH_ANYWHERE`` is True. It requires "
+        "sqlite to be built with FTS5 and its trigram tokenizer.",
+        doc_default="True",
+    )
 
 
 class PTKSetting(PromptSetting):  # sub-classing -> sub-group
@@ -1791,6 +1846,13 @@ class AsyncPromptSetting(PTKSetting):
         "This is to group such calls into one that happens within that timeframe. "
         "The number is set in seconds.",
     )
+    ASYNC_PROMPT_FIELD_TIMEOUT = Var.with_default(
+        10.0,
+        "When ENABLE_ASYNC_PROMPT is True, the number of seconds a field may "
+        "run before it is shown as timed out. The time of a field only counts "
+        "once it gets a thread. The fields that timed out keep running in the "
+        "background and their values are shown faded in the next prompts.",
+    )
     ASYNC_PROMPT_THREAD_WORKERS = Var(
         is_int,
         to_int_or_none,
@@ -1,13 +1,15 @@
 """Implements the deepsh executer."""
 
+import ast
 import builtins
 import collections.abc as cabc
 import inspect
 import sys
 import types
 
+from deepsh.codecache import ParseCache
 from deepsh.parser import Parser
-from deepsh.parsers.ast import CtxAwareTransformer
+from deepsh.parsers.ast import CtxAwareTransformer, const_str, deepsh_call
 from deepsh.tools import (
     balanced_parens,
     ends_with_colon_token,
@@ -53,6 +55,7 @@ class Execer:
         self.scriptcache = scriptcache
         self.cacheall = cacheall
         self.ctxtransformer = CtxAwareTransformer(self.parser)
+        self.parse_cache = ParseCache()
 
     def parse(self, input, ctx, mode="exec", filename=None, transform=True):
         """Parses deepsh code in a context-aware fashion. For context-free
@@ -66,6 +69,20 @@ class Execer:
                 input, filename=filename, mode=mode, debug_level=(self.debug_level >= 2)
             )
 
+        if ctx is None:
+            ctx = set()
+        elif isinstance(ctx, cabc.Mapping):
+            ctx = set(ctx.keys())
+
+        # [Phase 0]
+        # Most input is a plain command line, such as "git status", that
+        # the phases below would end up wrapping in ![] anyway. These are
+        # recognized from their tokens and transformed directly.
+        if self.debug_level == 0:
+            tree = self._parse_command_line(input, ctx, mode=mode)
+            if tree is not None:
+                return tree
+
         # [Phase 1]
         # Parsing actually happens in a couple of phases. The first is a
         # shortcut for a context-free parser. Normally, all subprocess
@@ -95,15 +112,110 @@ class Execer:
         # (ls) is part of the execution context. If it isn't, then we will
         # assume that this line is supposed to be a subprocess line, assuming
         # it also is valid as a subprocess line.
-        if ctx is None:
-            ctx = set()
-        elif isinstance(ctx, cabc.Mapping):
-            ctx = set(ctx.keys())
         tree = self.ctxtransformer.ctxvisit(
             tree, input, ctx, mode=mode, debug_level=self.debug_level
         )
         return tree
 
+    _COMMAND_LINE_TOKENS = frozenset(
+        [
+            "NAME",
+            "NUMBER",
+            "MINUS",
+            "PLUS",
+            "DIVIDE",
+            "PERIOD",
+            "COLON",
+            "COMMA",
+            "EQUALS",
+            "TILDE",
+        ]
+    )
+
+    def _parse_command_line(self, input, ctx, mode="exec"):
+        """Transforms a single line made up of a command name and plain words,
+        like ``ls -la /tmp``, straight into its subprocess AST without going
+        through the parser. Returns None for any other input, which the
+        parser then handles as usual.
+        """
+        if mode not in ("single", "exec"):
+            return None
+        line = input[:-1] if input.endswith("\n") else input
+        if (
+            not line
+            or line != line.strip()
+            or "\n" in line
+            or "#" in line
+            or "\\" in line
+            or "__deepsh__" not in ctx
+        ):
+            return None
+        words = []
+        end = -1
+        lexer = self.parser.lexer
+        try:
+            lexer.input(line)
+            for tok in lexer:
+                if tok.type not in self._COMMAND_LINE_TOKENS:
+                    return None
+                if tok.lexpos == end:
+                    words[-1][1] += tok.value
+                else:
+                    words.append([tok.lexpos, tok.value])
+                end = tok.lexpos + len(tok.value)
+        except Exception:
+            return None
+        finally:
+            lexer.reset()
+        # the command itself must not look like an env var or an operator
+        if (
+            not words
+            or not (words[0][1][0].isalpha() or words[0][1][0] in "_./")
+            or "=" in words[0][1]
+            or [w for _, w in words] != line.split()
+        ):
+            return None
+        # Lines that are also valid Python remain Python if all of their
+        # names are in the context, see CtxAwareTransformer.visit_Expr().
+        try:
+            pytree = ast.parse(line)
+        except SyntaxError:
+            consulted = {"__deepsh__": True}
+        else:
+            if len(pytree.body) != 1 or not isinstance(pytree.body[0], ast.Expr):
+                return None
+            value = pytree.body[0].value
+            if isinstance(value, ast.Tuple) or (
+                isinstance(value, ast.BinOp) and isinstance(value.left, ast.BinOp)
+            ):
+                # the parser places these differently, leave them to it
+                return None
+            names = [n for n in ast.walk(pytree) if isinstance(n, ast.Name)]
+            if not all(isinstance(n.ctx, ast.Load) for n in names):
+                return None
+            consulted = {n.id: n.id in ctx for n in names}
+            if all(consulted.values()):
+                return None
+        # the columns match those of parsing the line wrapped in ![]
+        args = [
+            deepsh_call(
+                "__deepsh__.expand_path",
+                args=[const_str(w, lineno=1, col_offset=col + 2)],
+                lineno=1,
+                col=col + 2,
+            )
+            for col, w in words
+        ]
+        cmd = ast.List(elts=args, ctx=ast.Load(), lineno=1, col_offset=len(line) + 2)
+        call = deepsh_call(
+            "__deepsh__.subproc_captured_hiddenobject", args=[cmd], lineno=1, col=0
+        )
+        body = [ast.Expr(value=call, lineno=1, col_offset=0)]
+        self.ctxtransformer.consulted = consulted
+        if mode == "single":
+            return ast.Interactive(body=body)
+        return ast.Module(body=body, type_ignores=[])
+
     def compile(
         self,
         input,
@@ -127,6 +239,13 @@ class Execer:
                 frame = frame.f_back
             glbs = frame.f_globals if glbs is None else glbs
             locs = frame.f_locals if locs is None else locs
+        use_cache = transform and self.debug_level == 0
+        if use_cache:
+            key = (input, mode, filename)
+            variant = self.parse_cache.get_variant(key, glbs, locs)
+            if variant is not None:
+                self.ctxtransformer.consulted, code = variant
+                return code
         ctx = set(dir(builtins)) | set(glbs.keys()) | set(locs.keys())
         tree = self.parse(input, ctx, mode=mode, filename=filename, transform=transform)
         if tree is None:
@@ -146,7 +265,8 @@ class Execer:
                 )  # clamp so no invalid access due to invalid lineno can occur
                 e.text = lines[i]
             raise e
-
+        if use_cache:
+            self.parse_cache.put(key, self.ctxtransformer.consulted, code)
         return code
 
     def eval(
@@ -340,7 +460,79 @@ class Execer:
                 input = beg_spaces + input
             return tree, input
 
+        def _parse(input):
+            try:
+                return _try_parse(input, greedy=False)
+            except SyntaxError:
+                return _try_parse(input, greedy=True)
+
+        if mode != "exec" or logical_input:
+            return _parse(input)
         try:
-            return _try_parse(input, greedy=False)
-        except SyntaxError:
-            return _try_parse(input, greedy=True)
+            tree = self.parser.parse(
+                input, filename=filename, mode=mode, debug_level=(self.debug_level >= 2)
+            )
+            return tree, input
+        except SyntaxError as e:
+            lineno = None if e.loc is None else e.loc.lineno
+        # Wrapping a line and re-parsing the whole input for every subprocess
+        # line is quadratic in the length of scripts. Instead, split the input
+        # into its top-level statements. Those before the error are known to
+        # be valid, and each of the others is wrapped on its own. If any of
+        # them fails, fall back to the whole input for the right errors.
+        statements = self._split_statements(input)
+        if lineno is not None and statements is not None and len(statements) > 1:
+            start = 0
+            while start + 1 < len(statements) and statements[start + 1][0] <= lineno:
+                start += 1
+            try:
+                wrapped = [
+                    _try_parse(stmt, greedy=False)[1] for _, stmt in statements[start:]
+                ]
+            except SyntaxError:
+                pass
+            else:
+                input = "".join(stmt for _, stmt in statements[:start])
+                input += "".join(wrapped)
+        return _parse(input)
+
+    _CONTINUATION_TOKENS = frozenset(["ELSE", "ELIF", "EXCEPT", "FINALLY"])
+
+    def _split_statements(self, input):
+        """Splits the input into its top-level statements, i.e. at the
+        unindented lines which do not continue a compound statement. Returns
+        a list of (lineno, source) tuples, or None if the input cannot be
+        tokenized.
+        """
+        lexer = self.parser.lexer
+        starts = [1]
+        depth = 0
+        at_line_start = True
+        decorated = False
+        try:
+            lexer.input(input)
+            for tok in lexer:
+                if tok.type == "INDENT":
+                    depth += 1
+                elif tok.type == "DEDENT":
+                    depth -= 1
+                elif tok.type == "NEWLINE":
+                    at_line_start = True
+                elif at_line_start:
+                    at_line_start = False
+                    if depth != 0:
+                        continue
+                    if not decorated and tok.type not in self._CONTINUATION_TOKENS:
+                        if tok.lineno > starts[-1]:
+                            starts.append(tok.lineno)
+                    decorated = tok.type == "AT"
+        except Exception:
+            return None
+        finally:
+            lexer.reset()
+        lines = input.splitlines(keepends=True)
+        ends = starts[1:] + [len(lines) + 1]
+        return [
+            (start, "".join(lines[start - 1 : end - 1]))
+            for start, end in zip(starts, ends)
+        ]
@@ -1,6 +1,7 @@
 """Base class of Deepsh History backends."""
 
 import functools
+import itertools
 import re
 import types
 import uuid
@@ -146,6 +147,25 @@ class History:
         """Get all history items."""
         raise NotImplementedError
 
+    def search(self, query, newest_first=False, limit=None):
+        """Get all history items whose input contains a string.
+
+        Parameters
+        ----------
+        query: str
+            The string to look for in the inputs.
+        newest_first: bool
+            Whether to get the newest items first.
+        limit: int, optional
+            The maximum number of items to get.
+        """
+        items = (
+            item
+            for item in self.all_items(newest_first=newest_first)
+            if query in item["inp"]
+        )
+        return itertools.islice(items, limit)
+
     def info(self):
         """A collection of information about the shell history.
 
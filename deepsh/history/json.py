@@ -5,6 +5,7 @@ import collections.abc as cabc
 import os
 import re
 import sys
+import tempfile
 import threading
 import time
 
@@ -137,6 +138,142 @@ def _xhj_get_history_files(sort=True, newest_first=False):
     return files
 
 
+class JsonHistoryCatalog:
+    """A summary of the history files of all sessions, so that they need not
+    be opened to be sorted, counted or garbage collected.
+
+    The entries are keyed by the path of the history file and hold
+    ``[mtime_ns, size, number of commands, start time, end time, locked]``.
+    They are only used while the file keeps the same mtime and size. The
+    catalog is updated when a session is closed and when the history is
+    garbage collected, so the file of a running session is read again.
+    """
+
+    VERSION = 1
+    FILENAME = "catalog.json"
+
+    def __init__(self, data_dir=None):
+        if data_dir is None:
+            data_dir = _xhj_get_data_dir()
+        self.filename = os.path.join(data_dir, self.FILENAME)
+        self.entries = self._read()
+        self._updated: dict[str, list] = {}
+        self._removed: set[str] = set()
+
+    def _read(self) -> dict[str, list]:
+        try:
+            with open(self.filename, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return {}
+        entries = data.get("entries")
+        return entries if isinstance(entries, dict) else {}
+
+    @staticmethod
+    def _stamp(path):
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+
+    def get(self, path):
+        """Returns the entry of a history file, or None if it is unknown or
+        has changed since.
+        """
+        entry = self.entries.get(path)
+        if not isinstance(entry, list) or len(entry) != 6:
+            return None
+        try:
+            stamp = self._stamp(path)
+        except OSError:
+            return None
+        return entry if entry[:2] == stamp else None
+
+    def describe(self, path, boot=None):
+        """Reads the entry of a history file and adds it to the catalog. If
+        the session is locked but started before ``boot``, the computer was
+        rebooted since and the file is unlocked first.
+        """
+        stamp = self._stamp(path)
+        if stamp[1] == 0:
+            entry = stamp + [0, stamp[0] / 1e9, None, False]
+        else:
+            with xlj.LazyJSON(path, reopen=False) as lj:
+                locked = bool(lj.get("locked", False))
+                ts = _xhj_load(lj.get("ts", (0.0, None)))
+                count = len(lj.sizes["cmds"]) - 1
+            if locked and boot is not None and ts[0] < boot:
+                xlj.ljappend(path, (), update={"locked": False}, sort_keys=True)
+                stamp, locked = self._stamp(path), False
+            entry = stamp + [count, ts[0], ts[1], locked]
+        self.entries[path] = self._updated[path] = entry
+        self._removed.discard(path)
+        return entry
+
+    def remove(self, path):
+        self.entries.pop(path, None)
+        self._updated.pop(path, None)
+        self._removed.add(path)
+
+    def retain(self, paths):
+        """Removes the entries of the files that are not in ``paths``."""
+        for path in set(self.entries).difference(paths):
+            self.remove(path)
+
+    def save(self):
+        """Writes the changes to the catalog, along with those saved by other
+        shells since it was read.
+        """
+        if not (self._updated or self._removed):
+            return
+        entries = self._read()
+        entries.update(self._updated)
+        for path in self._removed:
+            entries.pop(path, None)
+        self.entries = entries
+        self._updated, self._removed = {}, set()
+        data = json.dumps({"version": self.VERSION, "entries": entries})
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.filename))
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp, self.filename)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            pass  # e.g. a read-only data directory
+
+
+def _xhj_load(value):
+    return value.load() if isinstance(value, xlj.LJNode) else value
+
+
+def _xhj_iter_cmds(filename, newest_first=False, chunk=256):
+    """Yields the commands of a history file. Files in the appendable layout
+    are read ``chunk`` commands at a time, from the end if ``newest_first``,
+    so that only the commands that are used get parsed.
+    """
+    with xlj.LazyJSON(filename, reopen=False) as lj:
+        if not lj.appendable:
+            cmds = lj.load()["cmds"]
+            yield from reversed(cmds) if newest_first else cmds
+            return
+        dloc = lj.dloc
+        offsets, sizes = lj.offsets["cmds"][:-1], lj.sizes["cmds"][:-1]
+    n = len(sizes)
+    bounds = [(i, min(i + chunk, n)) for i in range(0, n, chunk)]
+    if newest_first:
+        bounds.reverse()
+    with open(filename, "rb") as f:
+        for i, j in bounds:
+            f.seek(dloc + offsets[i])
+            data = f.read(offsets[j - 1] + sizes[j - 1] - offsets[i])
+            cmds = json.loads("[" + data.decode() + "]")
+            yield from reversed(cmds) if newest_first else cmds
+
+
 class JsonHistoryGC(threading.Thread):
     """Shell history garbage collection."""
 
@@ -180,7 +317,9 @@ class JsonHistoryGC(threading.Thread):
 
         if self.force_gc or size_over < hsize:
             i = 0
+            catalog = JsonHistoryCatalog()
             for _, _, f, _ in rm_files:
+                catalog.remove(f)
                 try:
                     os.remove(f)
                     if deepsh_debug:
@@ -192,6 +331,7 @@ class JsonHistoryGC(threading.Thread):
                 except OSError:
                     pass
                 i += 1
+            catalog.save()
         else:
             print(
                 f"Warning: History garbage collection would discard more history ({size_over} {units}) than it would keep ({hsize}).\n"
@@ -212,33 +352,25 @@ class JsonHistoryGC(threading.Thread):
         deepsh_debug = env.get("DEEPSH_DEBUG", 0)
         boot = uptime.boottime()
         fs = _xhj_get_history_files(sort=False)
+        catalog = JsonHistoryCatalog()
         files = []
         time_start = time.time()
         for f in fs:
             try:
-                cur_file_size = os.path.getsize(f)
+                entry = catalog.get(f)
+                if entry is None or (entry[5] and boot and entry[3] < boot):
+                    # unknown, changed, or maybe locked by a session
+                    # that ended with a reboot
+                    entry = catalog.describe(f, boot=boot)
+                _, cur_file_size, count, start, end, locked = entry
                 if cur_file_size == 0:
                     # collect empty files (for gc)
-                    files.append((os.path.getmtime(f), 0, f, cur_file_size))
+                    files.append((start, 0, f, cur_file_size))
                     continue
-                lj = xlj.LazyJSON(f, reopen=False)
-                if lj.get("locked", False) and lj["ts"][0] < boot:
-                    # computer was rebooted between when this history was created
-                    # and now and so this history should be unlocked.
-                    hist = lj.load()
-                    lj.close()
-                    hist["locked"] = False
-                    with open(f, "w", newline="\n") as fp:
-                        xlj.ljdump(hist, fp, sort_keys=True)
-                    lj = xlj.LazyJSON(f, reopen=False)
-                if only_unlocked and lj.get("locked", False):
+                if only_unlocked and locked:
                     continue
                 # info: file size, closing timestamp, number of commands, filename
-                ts = lj.get("ts", (0.0, None))
-                files.append(
-                    (ts[1] or ts[0], len(lj.sizes["cmds"]) - 1, f, cur_file_size)
-                )
-                lj.close()
+                files.append((end or start, count, f, cur_file_size))
                 if deepsh_debug:
                     time_lag = time.time() - time_start
                     print(
@@ -246,8 +378,10 @@ class JsonHistoryGC(threading.Thread):
                         end="",
                         file=sys.stderr,
                     )
-            except (OSError, ValueError):
+            except (OSError, ValueError, KeyError):
                 continue
+        catalog.retain(fs)
+        catalog.save()
         files.sort()  # this sorts by elements of the tuple,
         # the first of which just happens to be file mod time.
         # so sort by oldest first.
@@ -258,7 +392,16 @@ class JsonHistoryFlusher(threading.Thread):
     """Flush shell history to disk periodically."""
 
     def __init__(
-        self, filename, buffer, queue, cond, at_exit=False, skip=None, *args, **kwargs
+        self,
+        filename,
+        buffer,
+        queue,
+        cond,
+        at_exit=False,
+        skip=None,
+        set_index=None,
+        *args,
+        **kwargs,
     ):
         """Thread for flushing history."""
         super().__init__(*args, **kwargs)
@@ -269,6 +412,7 @@ class JsonHistoryFlusher(threading.Thread):
         self.cond = cond
         self.at_exit = at_exit
         self.skip = skip
+        self.set_index = set_index
         if at_exit:
             self.dump()
             queue.popleft()
@@ -286,7 +430,9 @@ class JsonHistoryFlusher(threading.Thread):
         return self is self.queue[0]
 
     def dump(self):
-        """Write the cached history to external storage."""
+        """Append the cached history to external storage. Only the new
+        commands and the trailing index of the file are written.
+        """
         opts = XSH.env.get("HISTCONTROL", "")
         last_inp = None
         cmds = []
@@ -304,19 +450,28 @@ class JsonHistoryFlusher(threading.Thread):
 
             cmds.append(cmd)
             last_inp = cmd["inp"]
-        with open(self.filename, newline="\n") as f:
-            hist = xlj.LazyJSON(f).load()
-        load_hist_len = len(hist["cmds"])
-        hist["cmds"].extend(cmds)
+        update = {}
         if self.at_exit:
-            # todo: check why this is here.
-            if "ts" in hist:
-                hist["ts"][1] = time.time()  # apply end time
-            hist["locked"] = False
+            with xlj.LazyJSON(self.filename) as lj:
+                ts = lj.get("ts")
+                if ts is not None:
+                    update["ts"] = [ts[0], time.time()]  # apply end time
+            update["locked"] = False
         if not XSH.env.get("DEEPSH_STORE_STDOUT", False):
-            [cmd.pop("out") for cmd in hist["cmds"][load_hist_len:] if "out" in cmd]
-        with open(self.filename, "w", newline="\n") as f:
-            xlj.ljdump(hist, f, sort_keys=True)
+            [cmd.pop("out") for cmd in cmds if "out" in cmd]
+        idx = xlj.ljappend(self.filename, cmds, update=update, sort_keys=True)
+        if self.set_index is not None:
+            self.set_index(idx)
+        if self.at_exit:
+            self._update_catalog()
+
+    def _update_catalog(self):
+        try:
+            catalog = JsonHistoryCatalog()
+            catalog.describe(self.filename)
+            catalog.save()
+        except (OSError, ValueError, KeyError):
+            pass  # the catalog is only a cache of the history files
 
 
 class JsonCommandField(cabc.Sequence):
@@ -365,14 +520,29 @@ class JsonCommandField(cabc.Sequence):
         queue.append(self)
         with self.hist._cond:
             self.hist._cond.wait_for(self.i_am_at_the_front)
-            with open(self.hist.filename, newline="\n") as f:
-                lj = xlj.LazyJSON(f, reopen=False)
-                rtn = lj["cmds"][key].get(self.field, self.default)
-                if isinstance(rtn, xlj.LJNode):
-                    rtn = rtn.load()
-            queue.popleft()
+            try:
+                rtn = self._load(key)
+            finally:
+                queue.popleft()
         return rtn
 
+    def _load(self, key):
+        """Loads the field of the key-th command stored in the file. With the
+        appendable layout, the command is read straight from its offset.
+        """
+        if self.hist._index is None:
+            with xlj.LazyJSON(self.hist.filename, reopen=False) as lj:
+                if not lj.appendable:
+                    rtn = lj["cmds"][key].get(self.field, self.default)
+                    return rtn.load() if isinstance(rtn, xlj.LJNode) else rtn
+                self.hist._index = {"offsets": lj.offsets, "sizes": lj.sizes}
+        offset = self.hist._index["offsets"]["cmds"][key]
+        size = self.hist._index["sizes"]["cmds"][key]
+        with open(self.hist.filename, "rb") as f:
+            f.seek(xlj.APPEND_DLOC + offset)
+            cmd = json.loads(f.read(size))
+        return cmd.get(self.field, self.default)
+
     def i_am_at_the_front(self):
         """Tests if the command field is at the front of the queue."""
         return self is self.hist._queue[0]
@@ -424,7 +594,7 @@ class JsonHistory(History):
             meta["cmds"] = []
             meta["sessionid"] = str(self.sessionid)
             with open(self.filename, "w", newline="\n") as f:
-                xlj.ljdump(meta, f, sort_keys=True)
+                xlj.ljappend_dump(meta, f, sort_keys=True)
 
             try:
                 sudo_uid = os.environ.get("SUDO_UID")
@@ -441,6 +611,7 @@ class JsonHistory(History):
         self._cond = threading.Condition()
         self._len = 0
         self._skipped = 0
+        self._index = None
         self.last_cmd_out = None
         self.last_cmd_rtn = None
         self.gc = JsonHistoryGC() if gc else None
@@ -523,6 +694,9 @@ class JsonHistory(History):
         def skip(num):
             self._skipped += num
 
+        def set_index(idx):
+            self._index = idx
+
         hf = JsonHistoryFlusher(
             self.filename,
             tuple(self.buffer),
@@ -530,6 +704,7 @@ class JsonHistory(History):
             self._cond,
             at_exit=at_exit,
             skip=skip,
+            set_index=set_index,
         )
         self.buffer = []
         return hf
@@ -551,24 +726,21 @@ class JsonHistory(History):
         """
         while self.gc and self.gc.is_alive():
             time.sleep(0.011)  # gc sleeps for 0.01 secs, sleep a beat longer
+        catalog = JsonHistoryCatalog()
         for f in _xhj_get_history_files(newest_first=newest_first):
+            entry = catalog.get(f)
+            if entry is not None and entry[2] == 0:
+                continue  # no commands to read
             try:
-                json_file = xlj.LazyJSON(f, reopen=False)
-            except ValueError:
-                # Invalid json file
-                continue
-            try:
-                commands = json_file.load()["cmds"]
-            except (JSONDecodeError, ValueError):
+                # the files are only read as the items are consumed
+                for c in _xhj_iter_cmds(f, newest_first=newest_first):
+                    yield {"inp": c["inp"].rstrip(), "ts": c["ts"][0]}
+            except (JSONDecodeError, ValueError, OSError, KeyError):
                 # file is corrupted somehow
                 if XSH.env.get("DEEPSH_DEBUG") > 0:
                     msg = "deepsh history file {0!r} is not valid JSON"
                     print(msg.format(f), file=sys.stderr)
                 continue
-            if newest_first:
-                commands = reversed(commands)
-            for c in commands:
-                yield {"inp": c["inp"].rstrip(), "ts": c["ts"][0]}
         # all items should also include session items
         yield from self.items()
 
@@ -636,13 +808,14 @@ class JsonHistory(History):
                         deleted += 1
 
                 file_content["cmds"] = commands
-                with open(f, "w") as fp:
-                    xlj.ljdump(file_content, fp)
+                with open(f, "w", newline="\n") as fp:
+                    xlj.ljappend_dump(file_content, fp, sort_keys=True)
             except (JSONDecodeError, ValueError):
                 # file is corrupted somehow
                 if XSH.env.get("DEEPSH_DEBUG") > 0:
                     msg = "deepsh history file {0!r} is not valid JSON"
                     print(msg.format(f), file=sys.stderr)
                 continue
+        self._index = None
 
         return deleted
@@ -390,6 +390,32 @@ class HistoryAlias(xcli.ArgParserAlias):
         deleted = hist.delete(pattern)
         print(f"Deleted {deleted} entries from history")
 
+    @staticmethod
+    def search(
+        query,
+        limit: tp.Optional[int] = None,
+        reverse=False,
+        null_byte=False,
+        _stdout=None,
+    ):
+        """Display the commands of all sessions that contain a string
+
+        Parameters
+        ----------
+        query:
+            the string to search for
+        limit: -n, --limit
+            display at most this many commands
+        reverse: -r, --reverse
+            display the newest commands first
+        null_byte: -0, --nb, --null-byte
+            separate commands by the null character for piping history to external filters
+        """
+        hist = XSH.history
+        end = "\0" if null_byte else "\n"
+        for item in hist.search(query, newest_first=reverse, limit=limit):
+            print(item["inp"], file=_stdout, end=end)
+
     @staticmethod
     def file(_stdout):
         """Display the current history filename"""
@@ -517,6 +543,7 @@ class HistoryAlias(xcli.ArgParserAlias):
         parser.add_command(self.on)
         parser.add_command(self.clear)
         parser.add_command(self.delete)
+        parser.add_command(self.search)
         parser.add_command(self.gc)
         parser.add_command(self.transfer)
 
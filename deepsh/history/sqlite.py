@@ -1,6 +1,7 @@
 """Implements the deepsh history backend via sqlite3."""
 
 import collections
+import contextlib
 import json
 import os
 import re
@@ -16,6 +17,8 @@ from deepsh.history.base import History
 XH_SQLITE_CACHE = threading.local()
 XH_SQLITE_TABLE_NAME = "deepsh_history"
 XH_SQLITE_CREATED_SQL_TBL = "CREATED_SQL_TABLE"
+XH_SQLITE_FTS_TABLE_NAME = "deepsh_history_fts"
+XH_SQLITE_HAS_FTS = "HAS_FTS"
 
 
 def _xh_sqlite_get_file_name():
@@ -83,21 +86,87 @@ CREATE INDEX IF NOT EXISTS  idx_inp_history
 ON {XH_SQLITE_TABLE_NAME}(inp);"""
         )
 
+        # and on tsb, so that the items are read in order without sorting
+        cursor.execute(
+            f"""\
+CREATE INDEX IF NOT EXISTS  idx_tsb_history
+ON {XH_SQLITE_TABLE_NAME}(tsb);"""
+        )
+
+        if XSH.env is None or XSH.env.get("DEEPSH_HISTORY_SQLITE_FTS", True):
+            has_fts = _xh_sqlite_create_fts_table(cursor)
+        else:
+            has_fts = False
+        setattr(XH_SQLITE_CACHE, XH_SQLITE_HAS_FTS, has_fts)
+
         # mark that this function ran for this session
         setattr(XH_SQLITE_CACHE, XH_SQLITE_CREATED_SQL_TBL, True)
 
 
-def _xh_sqlite_get_frequency(cursor, input):
-    # type: (sqlite3.Cursor, str) -> int
-    sql = f"SELECT sum(frequency) FROM {XH_SQLITE_TABLE_NAME} WHERE inp=?"
-    cursor.execute(sql, (input,))
-    return cursor.fetchone()[0] or 0
+def _xh_sqlite_create_fts_table(cursor):
+    """Create the full-text index of the inputs, kept up to date by triggers.
+
+    It is an FTS5 table with the trigram tokenizer, so that it matches any
+    substring of at least three characters. Returns False if sqlite is built
+    without them.
+    """
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+        (XH_SQLITE_FTS_TABLE_NAME,),
+    )
+    existed = cursor.fetchone() is not None
+    try:
+        cursor.execute(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {XH_SQLITE_FTS_TABLE_NAME}
+            USING fts5(inp, content='{XH_SQLITE_TABLE_NAME}', content_rowid='rowid',
+                       tokenize='trigram case_sensitive 1')
+        """
+        )
+    except sqlite3.OperationalError:
+        # no fts5 module or trigram tokenizer
+        return False
+    fts, tbl = XH_SQLITE_FTS_TABLE_NAME, XH_SQLITE_TABLE_NAME
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {tbl} BEGIN
+            INSERT INTO {fts}(rowid, inp) VALUES (new.rowid, new.inp);
+        END
+    """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {tbl} BEGIN
+            INSERT INTO {fts}({fts}, rowid, inp) VALUES ('delete', old.rowid, old.inp);
+        END
+    """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF inp ON {tbl} BEGIN
+            INSERT INTO {fts}({fts}, rowid, inp) VALUES ('delete', old.rowid, old.inp);
+            INSERT INTO {fts}(rowid, inp) VALUES (new.rowid, new.inp);
+        END
+    """
+    )
+    if not existed:
+        # index the history written before
+        cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    return True
 
 
 def _xh_sqlite_erase_dups(cursor, input):
-    freq = _xh_sqlite_get_frequency(cursor, input)
-    sql = f"DELETE FROM {XH_SQLITE_TABLE_NAME} WHERE inp=?"
-    cursor.execute(sql, (input,))
+    # type: (sqlite3.Cursor, str) -> int
+    """Deletes the previous runs of the input, returning how many times it
+    was run. The deleted rows are returned by the DELETE itself on sqlite
+    3.35 and later, instead of being summed by a query before."""
+    tbl = XH_SQLITE_TABLE_NAME
+    if sqlite3.sqlite_version_info >= (3, 35):
+        cursor.execute(f"DELETE FROM {tbl} WHERE inp=? RETURNING frequency", (input,))
+        return sum(freq or 0 for (freq,) in cursor.fetchall())
+    cursor.execute(f"SELECT sum(frequency) FROM {tbl} WHERE inp=?", (input,))
+    freq = cursor.fetchone()[0] or 0
+    cursor.execute(f"DELETE FROM {tbl} WHERE inp=?", (input,))
     return freq
 
 
@@ -145,13 +214,54 @@ def _xh_sqlite_get_count(cursor, sessionid=None):
     return cursor.fetchone()[0]
 
 
-def _xh_sqlite_get_records(cursor, sessionid=None, limit=None, newest_first=False):
+def _xh_sqlite_select_records(cursor, sessionid=None, limit=None, newest_first=False):
+    """Runs the query for the records, leaving them to be fetched from the
+    cursor.
+    """
     sql = "SELECT inp, tsb, rtn, frequency, cwd FROM deepsh_history "
     params = []
     if sessionid is not None:
         sql += "WHERE sessionid = ? "
         params.append(sessionid)
     sql += "ORDER BY tsb "
+    if newest_first:
+        sql += "DESC "
+    if limit is not None:
+        sql += "LIMIT %d " % limit
+    return cursor.execute(sql, tuple(params))
+
+
+def _xh_sqlite_get_records(cursor, sessionid=None, limit=None, newest_first=False):
+    return _xh_sqlite_select_records(
+        cursor, sessionid=sessionid, limit=limit, newest_first=newest_first
+    ).fetchall()
+
+
+def _xh_sqlite_search_records(
+    cursor, query, sessionid=None, limit=None, newest_first=False
+):
+    """Finds the records whose input contains ``query``. They are ordered by
+    rowid, i.e. in the order they were written, so that the index is read
+    in its own order and stops at the limit.
+    """
+    cols = "h.inp, h.tsb, h.rtn, h.frequency, h.cwd"
+    params: list = []
+    if len(query) >= 3 and getattr(XH_SQLITE_CACHE, XH_SQLITE_HAS_FTS, False):
+        sql = f"SELECT {cols} FROM {XH_SQLITE_FTS_TABLE_NAME} AS f "
+        sql += f"JOIN {XH_SQLITE_TABLE_NAME} AS h ON h.rowid = f.rowid "
+        sql += "WHERE f.inp MATCH ? "
+        # a phrase matches as a substring with the trigram tokenizer
+        params.append('"' + query.replace('"', '""') + '"')
+        order = "f.rowid"
+    else:
+        sql = f"SELECT {cols} FROM {XH_SQLITE_TABLE_NAME} AS h "
+        sql += "WHERE instr(h.inp, ?) > 0 "
+        params.append(query)
+        order = "h.rowid"
+    if sessionid is not None:
+        sql += "AND h.sessionid = ? "
+        params.append(str(sessionid))
+    sql += f"ORDER BY {order} "
     if newest_first:
         sql += "DESC "
     if limit is not None:
@@ -190,11 +300,32 @@ def xh_sqlite_get_count(sessionid=None, filename=None):
         return _xh_sqlite_get_count(c, sessionid=sessionid)
 
 
-def xh_sqlite_items(sessionid=None, filename=None, newest_first=False):
+def xh_sqlite_items(sessionid=None, filename=None, newest_first=False, chunk=1000):
+    """Yields the records ``chunk`` rows at a time, so that the first ones are
+    available before the whole table is read.
+    """
+    with contextlib.closing(_xh_sqlite_get_conn(filename=filename)) as conn:
+        with conn:
+            _xh_sqlite_create_history_table(conn.cursor())
+        c = _xh_sqlite_select_records(
+            conn.cursor(), sessionid=sessionid, newest_first=newest_first
+        )
+        while True:
+            rows = c.fetchmany(chunk)
+            if not rows:
+                return
+            yield from rows
+
+
+def xh_sqlite_search(
+    query, sessionid=None, filename=None, limit=None, newest_first=False
+):
     with _xh_sqlite_get_conn(filename=filename) as conn:
         c = conn.cursor()
         _xh_sqlite_create_history_table(c)
-        return _xh_sqlite_get_records(c, sessionid=sessionid, newest_first=newest_first)
+        return _xh_sqlite_search_records(
+            c, query, sessionid=sessionid, limit=limit, newest_first=newest_first
+        )
 
 
 def xh_sqlite_delete_items(size_to_keep, filename=None):
@@ -233,6 +364,89 @@ def xh_sqlite_delete_input_matching(pattern, filename=None):
                 c.execute(sql)
 
 
+class SqliteHistoryWriter(threading.Thread):
+    """Writes history items to disk on a background thread.
+
+    The thread holds one connection to the database, in WAL mode, and the
+    items appended while a transaction is being written are batched in the
+    next one.
+    """
+
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.daemon = True
+        self.name = "sqlite-history-writer"
+        self.filename = filename
+        self.pending = collections.deque()
+        self.cond = threading.Condition()
+        self.writing = False
+        self.closed = False
+        self.start()
+
+    def put(self, cmd, sessionid, store_stdout, remove_duplicates):
+        """Queues a command to be written."""
+        with self.cond:
+            self.pending.append((cmd, sessionid, store_stdout, remove_duplicates))
+            self.cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Waits until the queued commands are written. Returns False if it
+        timed out.
+        """
+        with self.cond:
+            return self.cond.wait_for(
+                lambda: self.closed or not (self.pending or self.writing), timeout
+            )
+
+    def close(self):
+        """Writes the queued commands and stops the thread."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.join()
+
+    def run(self):
+        conn = None
+        try:
+            conn = _xh_sqlite_get_conn(filename=self.filename)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.pending or self.closed)
+                    if not self.pending:
+                        return
+                    batch = list(self.pending)
+                    self.pending.clear()
+                    self.writing = True
+                try:
+                    self._write(conn, batch)
+                finally:
+                    with self.cond:
+                        self.writing = False
+                        self.cond.notify_all()
+        except sqlite3.Error as err:
+            print(f"SQLite History Backend Error: {err}")
+        finally:
+            if conn is not None:
+                conn.close()
+            with self.cond:
+                self.closed = True
+                self.cond.notify_all()
+
+    def _write(self, conn, batch):
+        try:
+            with conn:
+                c = conn.cursor()
+                _xh_sqlite_create_history_table(c)
+                for cmd, sessionid, store_stdout, remove_duplicates in batch:
+                    _xh_sqlite_insert_command(
+                        c, cmd, sessionid, store_stdout, remove_duplicates
+                    )
+        except sqlite3.OperationalError as err:
+            print(f"SQLite History Backend Error: {err}")
+
+
 class SqliteHistoryGC(threading.Thread):
     """Shell history garbage collection."""
 
@@ -278,6 +492,7 @@ class SqliteHistory(History):
         self.filename = filename
         self.last_pull_time = time.time()
         self.gc = SqliteHistoryGC() if gc else None
+        self._writer = None
         self._last_hist_inp = None
         self.inps = []
         self.rtns = []
@@ -331,19 +546,41 @@ class SqliteHistory(History):
         except KeyError:
             pass
         self._last_hist_inp = inp
+        store_stdout = envs.get("DEEPSH_STORE_STDOUT", False)
+        remove_duplicates = "erasedups" in opts
+        if self._writer is None:
+            self._writer = SqliteHistoryWriter(self.filename)
+        if not self._writer.closed:
+            self._writer.put(
+                dict(cmd), str(self.sessionid), store_stdout, remove_duplicates
+            )
+            return
+        # after the writer is closed at exit
         try:
             xh_sqlite_append_history(
                 cmd,
                 str(self.sessionid),
-                store_stdout=envs.get("DEEPSH_STORE_STDOUT", False),
+                store_stdout=store_stdout,
                 filename=self.filename,
-                remove_duplicates=("erasedups" in opts),
+                remove_duplicates=remove_duplicates,
             )
         except sqlite3.OperationalError as err:
             print(f"SQLite History Backend Error: {err}")
 
+    def flush(self, at_exit=False, **_):
+        """Waits until the appended commands are written to disk. At exit,
+        the writer thread is also stopped.
+        """
+        if self._writer is None:
+            return
+        if at_exit:
+            self._writer.close()
+        else:
+            self._writer.flush()
+
     def all_items(self, newest_first=False, session_id=None):
         """Display all history items."""
+        self.flush()
         for inp, ts, rtn, freq, cwd in xh_sqlite_items(
             filename=self.filename, newest_first=newest_first, sessionid=session_id
         ):
@@ -353,11 +590,25 @@ class SqliteHistory(History):
         """Display history items of current session."""
         yield from self.all_items(newest_first, session_id=str(self.sessionid))
 
+    def search(self, query, newest_first=False, limit=None):
+        """Finds the history items whose input contains ``query``, through the
+        full-text index when there is one.
+        """
+        self.flush()
+        for inp, ts, rtn, freq, cwd in xh_sqlite_search(
+            query,
+            filename=self.filename,
+            limit=limit,
+            newest_first=newest_first,
+        ):
+            yield {"inp": inp, "ts": ts, "rtn": rtn, "frequency": freq, "cwd": cwd}
+
     def info(self):
         data = collections.OrderedDict()
         data["backend"] = "sqlite"
         data["sessionid"] = str(self.sessionid)
         data["filename"] = self.filename
+        self.flush()
         data["session items"] = xh_sqlite_get_count(
             sessionid=self.sessionid, filename=self.filename
         )
@@ -371,6 +622,7 @@ class SqliteHistory(History):
             print(f"Shell type {XSH.shell.shell} is not supported.")
             return 0
 
+        self.flush()
         cnt = 0
         for r in xh_sqlite_pull(
             self.filename, self.last_pull_time, str(self.sessionid)
@@ -383,6 +635,7 @@ class SqliteHistory(History):
         return cnt
 
     def run_gc(self, size=None, blocking=True, **_):
+        self.flush()
         self.gc = SqliteHistoryGC(wait_for_shell=False, size=size)
         if blocking:
             while self.gc.is_alive():
@@ -397,10 +650,12 @@ class SqliteHistory(History):
         self.tss = []
         self.cwds = []
 
+        self.flush()
         xh_sqlite_wipe_session(sessionid=self.sessionid, filename=self.filename)
 
     def delete(self, pattern):
         """Deletes all entries in the database where the input matches a pattern."""
+        self.flush()
         xh_sqlite_delete_input_matching(
             pattern=re.compile(pattern), filename=self.filename
         )
@@ -13,6 +13,12 @@ from importlib.abc import Loader, MetaPathFinder, SourceLoader
 from importlib.machinery import ModuleSpec
 
 from deepsh.built_ins import XSH
+from deepsh.codecache import (
+    module_cache_check,
+    module_cache_filename,
+    source_stamp,
+    update_module_cache,
+)
 from deepsh.events import events
 from deepsh.execer import Execer
 from deepsh.lib.lazyasd import lazyobject
@@ -105,11 +111,17 @@ class DeepshImportHook(MetaPathFinder, SourceLoader):
         if filename is None:
             msg = f"deepsh file {fullname!r} could not be found"
             raise ImportError(msg)
+        stamp = source_stamp(filename)
+        cachefname = module_cache_filename(filename)
+        code = module_cache_check(cachefname, stamp)
+        if code is not None:
+            return code
         src = self.get_source(fullname)
         execer = self._execer
         execer.filename = filename
         ctx = {}  # dummy for modules
         code = execer.compile(src, glbs=ctx, locs=ctx)
+        update_module_cache(code, cachefname, stamp)
         return code
 
     def get_source(self, fullname):
@@ -0,0 +1,273 @@
+"""Watches directories for changes to the files in them.
+
+Each watched directory has a change count, which is bumped by a background
+thread whenever a file is created, deleted, renamed or has its attributes
+changed in the directory. Callers remember the count they last saw, so that
+checking a directory for changes is a dict lookup rather than a ``stat()``.
+
+On Linux, the changes are reported by inotify. Elsewhere, or if inotify is
+not available, the directories are polled for changes of their mtime.
+Inotify does not see the changes made by other hosts to a network
+filesystem, so directories on those are not watched by inotify, and the
+callers check them themselves.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import re
+import struct
+import sys
+import threading
+
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+GONE_MASK = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+
+EVENT_HEADER = struct.Struct("iIII")
+
+NETWORK_FILESYSTEMS = frozenset(
+    [
+        "9p",
+        "afs",
+        "ceph",
+        "cifs",
+        "fuse.glusterfs",
+        "fuse.s3fs",
+        "fuse.sshfs",
+        "glusterfs",
+        "gpfs",
+        "lustre",
+        "ncpfs",
+        "nfs",
+        "nfs4",
+        "smb3",
+        "smbfs",
+    ]
+)
+
+
+class DirWatcher:
+    """Base class for the directory watchers."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def watch(self, path):
+        """Starts watching a directory, if it is not watched yet. Returns its
+        change count, or None if it cannot be watched.
+        """
+        with self._lock:
+            if path in self._counts:
+                return self._counts[path]
+            if not self._add(path):
+                return None
+            self._counts[path] = 0
+            return 0
+
+    def count(self, path):
+        """Returns the change count of a directory, or None if it is not
+        watched, e.g. because it was removed.
+        """
+        return self._counts.get(path)
+
+    def _add(self, path):
+        raise NotImplementedError
+
+    def _changed(self, path):
+        with self._lock:
+            if path in self._counts:
+                self._counts[path] += 1
+
+    def _unwatch(self, path):
+        with self._lock:
+            self._counts.pop(path, None)
+
+
+class InotifyWatcher(DirWatcher):
+    """Watches directories with inotify, reading its events on a background
+    thread.
+    """
+
+    def __init__(self, libc):
+        super().__init__()
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths = {}  # one directory may be watched under several paths
+        self._mounts = read_mounts()
+        self.thread = threading.Thread(target=self.run, name="dir-watcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _add(self, path):
+        if mount_fstype(path, self._mounts) in NETWORK_FILESYSTEMS:
+            return False
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            return False
+        self._paths.setdefault(wd, set()).add(path)
+        return True
+
+    def run(self):
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except InterruptedError:
+                continue
+            except OSError:
+                return
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                wd, mask, _, size = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size + size
+                if mask & IN_Q_OVERFLOW:
+                    for path in list(self._counts):
+                        self._changed(path)
+                    continue
+                if mask & GONE_MASK:
+                    paths = self._paths.pop(wd, ())
+                    update = self._unwatch
+                else:
+                    paths = self._paths.get(wd, ())
+                    update = self._changed
+                for path in list(paths):
+                    update(path)
+
+
+class PollingWatcher(DirWatcher):
+    """Watches directories by checking their mtime on a background thread."""
+
+    def __init__(self, interval=1.0):
+        """
+        Parameters
+        ----------
+        interval : float, optional
+            The time in seconds between checks.
+        """
+        super().__init__()
+        self.interval = interval
+        self._mtimes = {}
+        self._closed = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="dir-watcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _add(self, path):
+        try:
+            self._mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        return True
+
+    def close(self):
+        """Stops the polling thread."""
+        self._closed.set()
+
+    def run(self):
+        while not self._closed.wait(self.interval):
+            for path, mtime in list(self._mtimes.items()):
+                try:
+                    new = os.stat(path).st_mtime_ns
+                except OSError:
+                    del self._mtimes[path]
+                    self._unwatch(path)
+                    continue
+                if new != mtime:
+                    self._mtimes[path] = new
+                    self._changed(path)
+
+
+def read_mounts(filename="/proc/self/mounts"):
+    """Returns the ``(mount point, filesystem type)`` pairs of the mounted
+    filesystems, the longest mount points first, or an empty list if they
+    cannot be read.
+    """
+    mounts = []
+    try:
+        with open(filename, encoding="utf-8", errors="surrogateescape") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # spaces and the like are escaped as octal numbers, e.g. \040
+                point = re.sub(
+                    r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[1]
+                )
+                mounts.append((point, fields[2]))
+    except OSError:
+        return []
+    mounts.sort(key=lambda mount: len(mount[0]), reverse=True)
+    return mounts
+
+
+def mount_fstype(path, mounts):
+    """Returns the type of the filesystem of the path, or None if it is not
+    under any of the mounts given by ``read_mounts()``.
+    """
+    path = os.path.realpath(path)
+    for point, fstype in mounts:
+        if path == point or path.startswith(point.rstrip("/") + "/"):
+            return fstype
+    return None
+
+
+def _inotify_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_DIR_WATCHER: "DirWatcher | None" = None
+_DIR_WATCHER_LOCK = threading.Lock()
+
+
+def get_dir_watcher():
+    """Returns the directory watcher shared by this process, starting it on
+    first use. It uses inotify when available and polling otherwise.
+    """
+    global _DIR_WATCHER
+    with _DIR_WATCHER_LOCK:
+        if _DIR_WATCHER is None or _DIR_WATCHER.pid != os.getpid():
+            libc = _inotify_libc()
+            watcher = None
+            if libc is not None:
+                try:
+                    watcher = InotifyWatcher(libc)
+                except OSError:
+                    pass  # e.g. out of inotify instances
+            _DIR_WATCHER = PollingWatcher() if watcher is None else watcher
+        return _DIR_WATCHER
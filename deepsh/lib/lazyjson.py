@@ -100,6 +100,115 @@ def ljdump(obj, fp, sort_keys=False):
     fp.write(s)
 
 
+# Appendable layout: the data comes first and the index and locations trail
+# it, so that new items can be added to one sequence by rewriting only the tail.
+APPEND_HEAD = '{"data": '
+APPEND_DLOC = len(APPEND_HEAD)
+APPEND_LOCS_FORMAT = ' "locs": [{iloc:>10}, {ilen:>10}, {dloc:>10}, {dlen:>10}]}}\n'
+APPEND_LOCS_SIZE = len(APPEND_LOCS_FORMAT.format(iloc=0, ilen=0, dloc=0, dlen=0))
+
+
+def _appendable(key, items, obj, offsets=None, sizes=None, sort_keys=False):
+    """Computes the text of an appendable JSON file from the point where
+    ``items`` are added to the ``key`` sequence to the end of the file.
+
+    Returns the position (relative to the data) where the text should be
+    written, the text itself, and the new index.
+    """
+    head = "{" + json.dumps(key) + ": ["
+    if offsets is None:
+        s = head
+        offsets = {key: [len(head) - 1]}
+        sizes = {key: [0]}
+        start = j = 0
+    else:
+        offsets = {key: offsets[key][:]}
+        sizes = {key: sizes[key][:]}
+        s = ""
+        n = len(sizes[key]) - 1
+        start = j = offsets[key][-2] + sizes[key][-2] if n > 0 else len(head)
+    j += len(s)
+    seq_offsets, seq_sizes = offsets[key], sizes[key]
+    for item in items:
+        sep = ",\n" if len(seq_sizes) > 1 else "\n"
+        s_x = json.dumps(item, sort_keys=sort_keys)
+        n_x = len(s_x.encode())
+        seq_offsets.insert(-1, j + len(sep))
+        seq_sizes.insert(-1, n_x)
+        s += sep + s_x
+        j += len(sep) + n_x
+    s += "\n]"
+    j += 2
+    seq_sizes[-1] = j - seq_offsets[-1]
+    others = sorted(obj.items()) if sort_keys else obj.items()
+    for k, val in others:
+        if k == key:
+            continue
+        s_k = ", " + json.dumps(k) + ": "
+        j += len(s_k)
+        s_v, o_v, n_v, size_v = _to_json_with_size(val, offset=j, sort_keys=sort_keys)
+        offsets[k] = o_v
+        sizes[k] = size_v
+        s += s_k + s_v
+        j += n_v
+    s += "}"
+    j += 1
+    offsets["__total__"] = 0
+    sizes["__total__"] = j
+    idx = {"offsets": offsets, "sizes": sizes}
+    jdx = json.dumps(idx, sort_keys=sort_keys)
+    index_head = ',\n "index": '
+    iloc = APPEND_DLOC + j + len(index_head)
+    s += index_head + jdx + ",\n"
+    s += APPEND_LOCS_FORMAT.format(iloc=iloc, ilen=len(jdx), dloc=APPEND_DLOC, dlen=j)
+    return start, s, idx
+
+
+def ljappend_dump(obj, fp, key="cmds", sort_keys=False):
+    """Dumps a mapping to a JSON file in the appendable layout, where the
+    ``key`` sequence may later be extended with ``ljappend()``.
+    Returns the index of the file.
+    """
+    _, s, idx = _appendable(key, obj.get(key, ()), obj, sort_keys=sort_keys)
+    fp.write(APPEND_HEAD + s)
+    return idx
+
+
+def ljappend(filename, items, key="cmds", update=None, sort_keys=False):
+    """Appends ``items`` to the ``key`` sequence of a lazy JSON file. Only the
+    new items and the trailing index are written. The other top-level values
+    may be replaced with the ``update`` mapping. Files in the original layout
+    are rewritten in full into the appendable one.
+
+    Returns the new index of the file.
+    """
+    with LazyJSON(filename, reopen=False) as lj:
+        appendable = lj.appendable
+        if appendable:
+            offsets, sizes = lj.offsets, lj.sizes
+            seq_end = offsets[key][-1] + sizes[key][-1]
+            with lj._open() as f:
+                f.seek(lj.dloc + seq_end)
+                rest = f.read(lj.dlen - seq_end).lstrip(",").lstrip()
+            obj = json.loads("{" + rest)
+        else:
+            obj = lj.load()
+    if update:
+        obj.update(update)
+    if not appendable:
+        obj[key] = list(obj.get(key, ())) + list(items)
+        with open(filename, "w", newline="\n") as fp:
+            return ljappend_dump(obj, fp, key=key, sort_keys=sort_keys)
+    start, s, idx = _appendable(
+        key, items, obj, offsets=offsets, sizes=sizes, sort_keys=sort_keys
+    )
+    with open(filename, "r+b") as fp:
+        fp.seek(APPEND_DLOC + start)
+        fp.write(s.encode())
+        fp.truncate()
+    return idx
+
+
 class LJNode(cabc.Mapping, cabc.Sequence):
     """A proxy node for JSON nodes. Acts as both sequence and mapping."""
 
@@ -233,11 +342,21 @@ class LazyJSON(LJNode):
             yield self._f
 
     def _load_index(self):
-        """Loads the index from the start of the file."""
+        """Loads the index from the start, or for appendable files the end,
+        of the file.
+        """
         with self._open(newline="\n") as f:
             # read in the location data
-            f.seek(9)
-            locs = f.read(48)
+            f.seek(0)
+            self.appendable = f.read(APPEND_DLOC) == APPEND_HEAD
+            if self.appendable:
+                f.seek(0, io.SEEK_END)
+                f.seek(f.tell() - APPEND_LOCS_SIZE)
+                locs = f.read(APPEND_LOCS_SIZE)
+                locs = locs[locs.index("[") : locs.rindex("]") + 1]
+            else:
+                f.seek(9)
+                locs = f.read(48)
             locs = json.loads(locs)
             self.iloc, self.ilen, self.dloc, self.dlen = locs
             # read in the index
@@ -206,6 +206,15 @@ def parser():
         action="store_false",
         default=True,
     )
+    p.add_argument(
+        "--build-parser-tables",
+        help="Generate the binary parser tables next to the deepsh package "
+        "and exit. This is useful for packagers, as the tables otherwise get "
+        "written the first time deepsh starts.",
+        dest="build_parser_tables",
+        action="store_true",
+        default=False,
+    )
     p.add_argument(
         "--cache-everything",
         help="Use a cache, even for interactive commands.",
@@ -393,6 +402,12 @@ def premain(argv=None):
     if args.help:
         parser.print_help()
         parser.exit()
+    if args.build_parser_tables:
+        from deepsh.parser import build_tables
+
+        for path in build_tables():
+            print(path)
+        parser.exit()
     shell_kwargs = {
         "shell_type": args.shell_type,
         "completer": False,
@@ -1,5 +1,7 @@
 """Implements the deepsh parser."""
 
+import os
+
 from deepsh.lib.lazyasd import lazyobject
 from deepsh.platform import PYTHON_VERSION_INFO
 
@@ -17,3 +19,22 @@ def Parser():
     else:
         from deepsh.parsers.v36 import Parser as p
     return p
+
+
+def build_tables(outputdir=None):
+    """Generates the parser and completion parser tables, validating or
+    regenerating them against the grammar, and writes their binary versions.
+    Returns the paths of the binary tables.
+    """
+    from deepsh.parsers.base import binary_table_path
+    from deepsh.parsers.completion_context import CompletionContextParser
+
+    parser = Parser(yacc_optimize=False, outputdir=outputdir)
+    parser.wait_for_parser()
+    CompletionContextParser(yacc_optimize=False, outputdir=outputdir)
+    if outputdir is None:
+        outputdir = os.path.dirname(os.path.realpath(__file__))
+    return [
+        binary_table_path({"tabmodule": name, "outputdir": outputdir})
+        for name in ("parser_table", "completion_parser_table")
+    ]
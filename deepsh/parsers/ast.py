@@ -383,6 +383,7 @@ class CtxAwareTransformer(NodeTransformer):
         self._nwith = 0
         self.filename = "<deepsh-code>"
         self.debug_level = 0
+        self.consulted = {}
 
     def ctxvisit(self, node, inp, ctx, mode="exec", filename=None, debug_level=0):
         """Transforms the node in a context-dependent way.
@@ -404,11 +405,16 @@ class CtxAwareTransformer(NodeTransformer):
         -------
         node : ast.AST
             The transformed node.
+
+        After the visit, ``consulted`` maps each name that was looked up in
+        the root context to whether it was found there. The transformation
+        is the same for any root context that agrees on these names.
         """
         self.filename = self.filename if filename is None else filename
         self.debug_level = debug_level
         self.lines = inp.splitlines()
         self.contexts = [ctx, set()]
+        self.consulted = {}
         self.mode = mode
         self._nwith = 0
         node = self.visit(node)
@@ -427,6 +433,8 @@ class CtxAwareTransformer(NodeTransformer):
     def ctxremove(self, value):
         """Removes a value the most recent context."""
         for ctx in reversed(self.contexts):
+            if ctx is self.contexts[0]:
+                self.consulted.setdefault(value, value in ctx)
             if value in ctx:
                 ctx.remove(value)
                 break
@@ -499,6 +507,9 @@ class CtxAwareTransformer(NodeTransformer):
             return True
         inscope = False
         for ctx in reversed(self.contexts):
+            if ctx is self.contexts[0]:
+                for name in names:
+                    self.consulted.setdefault(name, name in ctx)
             names -= ctx
             if not names:
                 inscope = True
@@ -1,10 +1,11 @@
 """Implements the base deepsh parser."""
 
 import itertools
+import marshal
 import os
 import re
 import textwrap
-import time
+import types
 import typing as tp
 from ast import parse as pyparse
 from collections.abc import Iterable, Mapping, Sequence
@@ -218,6 +219,102 @@ def raise_parse_error(
     raise err
 
 
+BINARY_TABLE_KEYS = (
+    "_tabversion",
+    "_lr_method",
+    "_lr_signature",
+    "_lr_action",
+    "_lr_goto",
+    "_lr_productions",
+)
+
+
+def binary_table_path(yacc_kwargs):
+    """Path of the binary parser tables, which sit next to the ``tabmodule``
+    Python module in the output directory."""
+    name = yacc_kwargs["tabmodule"].rpartition(".")[2]
+    return os.path.join(yacc_kwargs["outputdir"], name + ".marshal")
+
+
+def load_binary_table(path):
+    """Loads binary parser tables into a module that yacc can read, or returns
+    None if they are missing or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            tables = marshal.load(f)
+        tabmodule = types.ModuleType(os.path.basename(path))
+        tabmodule.__file__ = path
+        for key in BINARY_TABLE_KEYS:
+            setattr(tabmodule, key, tables[key])
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        return None
+    return tabmodule
+
+
+def grammar_signature(yacc_kwargs):
+    """The signature yacc uses to tell whether tables match the grammar."""
+    module = yacc_kwargs["module"]
+    pdict = {k: getattr(module, k) for k in dir(module)}
+    if "start" in yacc_kwargs:
+        pdict["start"] = yacc_kwargs["start"]
+    pinfo = yacc.ParserReflect(pdict, log=yacc.NullLogger())
+    pinfo.get_all()
+    return pinfo.signature()
+
+
+def write_binary_table(path, parser, signature):
+    """Writes the tables of a yacc parser in the binary format. The file is
+    replaced atomically so that concurrent sessions never read a partial one.
+    """
+    tables = {
+        "_tabversion": yacc.__tabversion__,
+        "_lr_method": "LALR",
+        "_lr_signature": signature,
+        "_lr_action": parser.action,
+        "_lr_goto": parser.goto,
+        "_lr_productions": [
+            (
+                p.str,
+                p.name,
+                p.len,
+                p.func,
+                p.file and os.path.basename(p.file),
+                p.line,
+            )
+            for p in parser.productions
+        ],
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        marshal.dump(tables, f)
+    os.replace(tmp, path)
+
+
+def load_parser(yacc_kwargs):
+    """Creates the yacc parser, preferring the binary tables, which load much
+    faster than the generated Python table module. When they are missing or
+    do not match the grammar, they are written after the parser has been
+    built the usual way. The signature of the binary tables is checked even
+    when the parser is optimized, so that stale tables are never used.
+    """
+    path = binary_table_path(yacc_kwargs)
+    tabmodule = load_binary_table(path)
+    if tabmodule is None:
+        parser = yacc.yacc(**yacc_kwargs)
+    else:
+        kwargs = dict(
+            yacc_kwargs, tabmodule=tabmodule, write_tables=False, optimize=False
+        )
+        parser = yacc.yacc(**kwargs)
+        if parser.action is tabmodule._lr_action:
+            return parser
+    try:
+        write_binary_table(path, parser, grammar_signature(yacc_kwargs))
+    except OSError:
+        pass
+    return parser
+
+
 class YaccLoader(Thread):
     """Thread to load (but not shave) the yacc parser."""
 
@@ -229,7 +326,7 @@ class YaccLoader(Thread):
         self.start()
 
     def run(self):
-        self.parser.parser = yacc.yacc(**self.yacc_kwargs)
+        self.parser.parser = load_parser(self.yacc_kwargs)
 
 
 class BaseParser:
@@ -462,10 +559,11 @@ class BaseParser:
         yacc_kwargs["outputdir"] = outputdir
         if yacc_debug:
             # create parser on main thread
-            self.parser = yacc.yacc(**yacc_kwargs)
+            self.parser = load_parser(yacc_kwargs)
+            self._yacc_loader = None
         else:
             self.parser = None
-            YaccLoader(self, yacc_kwargs)
+            self._yacc_loader = YaccLoader(self, yacc_kwargs)
 
         # Keeps track of the last token given to yacc (the lookahead token)
         self._last_yielded_token = None
@@ -500,8 +598,7 @@ class BaseParser:
         self.reset()
         self._source = s
         self.lexer.fname = filename
-        while self.parser is None:
-            time.sleep(0.01)  # block until the parser is ready
+        self.wait_for_parser()
         tree = self.parser.parse(input=s, lexer=self.lexer, debug=debug_level)
         if self._error is not None:
             self._parse_error(self._error[0], self._error[1])
@@ -515,6 +612,13 @@ class BaseParser:
                 tree = ast.Interactive(body=tree.body)
         return tree
 
+    def wait_for_parser(self):
+        """Blocks until the loader thread has created the yacc parser."""
+        if self.parser is None:
+            self._yacc_loader.join()
+        if self.parser is None:
+            raise RuntimeError("the deepsh parser tables could not be loaded")
+
     def _lexer_errfunc(self, msg, line, column):
         self._parse_error(msg, self.currloc(line, column))
 
@@ -18,7 +18,7 @@ from typing import (
 )
 
 from deepsh.lib.lazyasd import lazyobject
-from deepsh.parsers.base import Location, raise_parse_error
+from deepsh.parsers.base import Location, load_parser, raise_parse_error
 from deepsh.parsers.lexer import Lexer
 from deepsh.parsers.ply import yacc
 from deepsh.tools import check_for_partial_string, get_line_continuation
@@ -367,7 +367,7 @@ class CompletionContextParser:
         yacc_kwargs["outputdir"] = outputdir
 
         # create parser on main thread, it's small and should be fast
-        self.parser = yacc.yacc(**yacc_kwargs)
+        self.parser = load_parser(yacc_kwargs)
 
     def parse(
         self,
@@ -14,7 +14,12 @@ import deepsh.platform as xp
 import deepsh.procs.jobs as xj
 import deepsh.tools as xt
 from deepsh.built_ins import XSH
-from deepsh.procs.readers import ConsoleParallelReader, NonBlockingFDReader, safe_fdclose
+from deepsh.procs.readers import (
+    ConsoleParallelReader,
+    NonBlockingFDReader,
+    OutputSignal,
+    safe_fdclose,
+)
 
 
 @xl.lazyobject
@@ -80,6 +85,16 @@ def safe_readable(handle):
     return status
 
 
+# the chunks, of up to 64 kb each, that a reader of a running pipeline
+# queues before it stops reading until they are consumed
+MAX_QUEUED_CHUNKS = 64
+
+
+def _close_readers(readers):
+    for reader in readers:
+        reader.close()
+
+
 def update_process_group(pipeline_group, background):
     if not xp.ON_POSIX:
         return False
@@ -248,6 +263,9 @@ class CommandPipeline:
         if proc is None:
             return
         timeout = XSH.env.get("DEEPSH_PROC_FREQUENCY")
+        # threads producing the output set this signal when there is
+        # something to read, so that we can wait on it instead of polling.
+        signal = getattr(proc, "output_signal", None) or OutputSignal()
         # get the correct stdout
         stdout = proc.stdout
         if (
@@ -256,8 +274,14 @@ class CommandPipeline:
             stdout = spec.captured_stdout
         if hasattr(stdout, "buffer"):
             stdout = stdout.buffer
+        # the readers made here are closed once the process is over, so that
+        # the writers left behind, if any, see a broken pipe
+        readers = []
         if stdout is not None and not isinstance(stdout, self.nonblocking):
-            stdout = NonBlockingFDReader(stdout.fileno(), timeout=timeout)
+            stdout = NonBlockingFDReader(
+                stdout.fileno(), timeout=timeout, signal=signal
+            )
+            readers.append(stdout)
         if (
             not stdout
             or self.captured == "stdout"
@@ -282,7 +306,12 @@ class CommandPipeline:
                     b = stdout.read()
                     s = self._decode_uninew(b, universal_newlines=True)
                     self.lines = s.splitlines(keepends=True)
+                _close_readers(readers)
             return
+        # from here on the output is read while the process runs, so the
+        # readers may hold back a writer that is faster than we are
+        for reader in readers:
+            reader.max_queued = MAX_QUEUED_CHUNKS
         # get the correct stderr
         stderr = proc.stderr
         if (
@@ -292,11 +321,18 @@ class CommandPipeline:
         if hasattr(stderr, "buffer"):
             stderr = stderr.buffer
         if stderr is not None and not isinstance(stderr, self.nonblocking):
-            stderr = NonBlockingFDReader(stderr.fileno(), timeout=timeout)
+            stderr = NonBlockingFDReader(
+                stderr.fileno(),
+                timeout=timeout,
+                signal=signal,
+                max_queued=MAX_QUEUED_CHUNKS,
+            )
+            readers.append(stderr)
         # read from process while it is running
         check_prev_done = len(self.procs) == 1
         prev_end_time = None
         i = j = cnt = 1
+        count = signal.count
         while proc.poll() is None:
             if getattr(proc, "suspended", False) or self._procs_suspended() is not None:
                 self.suspended = True
@@ -340,12 +376,14 @@ class CommandPipeline:
                     # next-to-last proc has finished, wait a bit to make
                     # sure we have fully started up, etc.
                     check_prev_done = True
-            # this is for CPU usage
+            # wait for more output or for the process to end. The timeout
+            # only backs up the checks above that nothing signals.
             if i + j == 0:
                 cnt = min(cnt + 1, 1000)
+                count = signal.wait(count, timeout * cnt)
             else:
                 cnt = 1
-            time.sleep(timeout * cnt)
+                count = signal.count
         # read from process now that it is over
         yield from safe_readlines(stdout)
         self.stream_stderr(safe_readlines(stderr))
@@ -353,6 +391,7 @@ class CommandPipeline:
         self._endtime()
         yield from safe_readlines(stdout)
         self.stream_stderr(safe_readlines(stderr))
+        _close_readers(readers)
         if self.captured == "object":
             self.end(tee_output=False)
 
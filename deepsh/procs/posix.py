@@ -18,6 +18,7 @@ from deepsh.procs.jobs import proc_untraced_waitpid
 from deepsh.procs.readers import (
     BufferedFDParallelReader,
     NonBlockingFDReader,
+    OutputSignal,
     safe_fdclose,
 )
 
@@ -126,6 +127,8 @@ class PopenThread(threading.Thread):
             self.stderr = io.BytesIO()
         self.suspended = False
         self.prevs_are_closed = False
+        # set when output is written to the buffers and when the run ends
+        self.output_signal = OutputSignal()
         # This is so the thread will use the same swapped values as the origin one.
         self.original_swapped_values = XSH.env.get_swapped_values()
         self.start()
@@ -149,21 +152,23 @@ class PopenThread(threading.Thread):
             origin = BufferedFDParallelReader(origfd, buffer=stdin)
         else:
             origin = None
-        # get non-blocking stdout
+        # get non-blocking stdout and stderr, which set the signal when they
+        # have read something so that we don't need to poll them.
+        signal = OutputSignal()
         stdout = self.stdout.buffer if self.universal_newlines else self.stdout
         capout = spec.captured_stdout
         if capout is None:
             procout = None
         else:
-            procout = NonBlockingFDReader(capout.fileno(), timeout=self.timeout)
-        # get non-blocking stderr
+            procout = NonBlockingFDReader(capout.fileno(), timeout=0, signal=signal)
         stderr = self.stderr.buffer if self.universal_newlines else self.stderr
         caperr = spec.captured_stderr
         if caperr is None:
             procerr = None
         else:
-            procerr = NonBlockingFDReader(caperr.fileno(), timeout=self.timeout)
+            procerr = NonBlockingFDReader(caperr.fileno(), timeout=0, signal=signal)
         # initial read from buffer
+        count = signal.count
         self._read_write(procout, stdout, sys.__stdout__)
         self._read_write(procerr, stderr, sys.__stderr__)
         # loop over reads while process is running.
@@ -179,28 +184,23 @@ class PopenThread(threading.Thread):
                         file=sys.stderr,
                     )
 
-            # this is here for CPU performance reasons.
-            if i + j == 0:
-                cnt = min(cnt + 1, 1000)
-                tout = self.timeout * cnt
-                if procout is not None:
-                    procout.timeout = tout
-                if procerr is not None:
-                    procerr.timeout = tout
-            elif cnt == 1:
-                pass
-            else:
+            # wait for more output. Once the outputs are closed the process
+            # is about to end, so keep checking on it without backing off.
+            if i + j != 0 or (
+                (procout is None or procout.closed)
+                and (procerr is None or procerr.closed)
+            ):
                 cnt = 1
-                if procout is not None:
-                    procout.timeout = self.timeout
-                if procerr is not None:
-                    procerr.timeout = self.timeout
+            else:
+                cnt = min(cnt + 1, 1000)
+            count = signal.wait(count, self.timeout * cnt)
             # redirect some output!
             i = self._read_write(procout, stdout, sys.__stdout__)
             j = self._read_write(procerr, stderr, sys.__stderr__)
             if self.suspended:
                 break
         if self.suspended:
+            self.output_signal.set()
             return
         # close files to send EOF to non-blocking reader.
         # capout & caperr seem to be needed only by Windows, while
@@ -216,11 +216,13 @@ class PopenThread(threading.Thread):
         while (procout is not None and not procout.is_fully_read()) or (
             procerr is not None and not procerr.is_fully_read()
         ):
+            count = signal.wait(count, self.timeout)
             self._read_write(procout, stdout, sys.__stdout__)
             self._read_write(procerr, stderr, sys.__stderr__)
         # kill the process if it is still alive. Happens when piping.
         if proc.poll() is None:
             proc.terminate()
+        self.output_signal.set()
 
     def _wait_and_getattr(self, name):
         """make sure the instance has a certain attr, and return it."""
@@ -241,6 +243,7 @@ class PopenThread(threading.Thread):
         if i >= 0:
             writer.flush()
             stdbuf.flush()
+            self.output_signal.set()
         return i + 1
 
     def _alt_mode_switch(self, chunk, membuf, stdbuf):
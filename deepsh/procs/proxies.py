@@ -438,10 +438,16 @@ class ProcProxyThread(threading.Thread):
             )
         else:
             sp_stdin = sys.stdin
+        # The pipeline closes the handles of all but the last proc, so those
+        # must not be closed again when the wrappers are garbage collected,
+        # by which time the descriptors may have been reused.
+        closefd = last_in_pipeline or xp.ON_WINDOWS
         # stdout
         if self.c2pwrite != -1:
             sp_stdout = io.TextIOWrapper(
-                open(self.c2pwrite, "wb", -1), encoding=enc, errors=err
+                open(self.c2pwrite, "wb", -1, closefd=closefd),
+                encoding=enc,
+                errors=err,
             )
         else:
             sp_stdout = sys.stdout
@@ -450,7 +456,9 @@ class ProcProxyThread(threading.Thread):
             sp_stderr = sp_stdout
         elif self.errwrite != -1:
             sp_stderr = io.TextIOWrapper(
-                open(self.errwrite, "wb", -1), encoding=enc, errors=err
+                open(self.errwrite, "wb", -1, closefd=closefd),
+                encoding=enc,
+                errors=err,
             )
         else:
             sp_stderr = sys.stderr
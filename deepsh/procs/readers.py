@@ -1,21 +1,49 @@
 """File handle readers and related tools."""
 
 import ctypes
+import functools
 import io
 import os
 import queue
+import selectors
 import sys
 import threading
 import time
 
 import deepsh.lib.lazyimps as xli
 from deepsh.built_ins import XSH
+from deepsh.platform import ON_WINDOWS
+
+
+class OutputSignal:
+    """Wakes up a thread consuming process output whenever a producer has
+    new data or a stream or process has ended. This allows the consumer to
+    block until something happens, rather than polling.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.count = 0
+
+    def set(self):
+        """Signals that something happened."""
+        with self.cond:
+            self.count += 1
+            self.cond.notify_all()
+
+    def wait(self, count, timeout=None):
+        """Blocks until the signal has been set since ``count`` was observed,
+        or the timeout expires. Returns the current count.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.count != count, timeout)
+            return self.count
 
 
 class QueueReader:
     """Provides a file-like interface to reading from a queue."""
 
-    def __init__(self, fd, timeout=None):
+    def __init__(self, fd, timeout=None, signal=None):
         """
         Parameters
         ----------
@@ -23,9 +51,12 @@ class QueueReader:
             A file descriptor
         timeout : float or None, optional
             The queue reading timeout.
+        signal : OutputSignal or None, optional
+            Set whenever data is queued or the reader is closed.
         """
         self.fd = fd
         self.timeout = timeout
+        self.signal = signal
         self.closed = False
         self.queue = queue.Queue()
         self.thread = None
@@ -33,6 +64,17 @@ class QueueReader:
     def close(self):
         """close the reader"""
         self.closed = True
+        self.notify()
+
+    def put(self, chunk):
+        """Puts a chunk of bytes onto the queue."""
+        self.queue.put(chunk)
+        self.notify()
+
+    def notify(self):
+        """Sets the signal, if any."""
+        if self.signal is not None:
+            self.signal.set()
 
     def is_fully_read(self):
         """Returns whether or not the queue is fully read and the reader is
@@ -120,28 +162,29 @@ class QueueReader:
 
 def populate_fd_queue(reader, fd, queue):
     """Reads 1 kb of data from a file descriptor into a queue.
-    If this ends or fails, it flags the calling reader object as closed.
+    If this ends or fails, it flags the calling reader object as closed and
+    queues an empty chunk to wake up any blocked readers.
     """
     while True:
         try:
             c = os.read(fd, 1024)
         except OSError:
-            reader.closed = True
-            break
-        if c:
+            c = b""
+        if not c:
             queue.put(c)
-        else:
-            reader.closed = True
+            reader.close()
             break
+        reader.put(c)
 
 
 class NonBlockingFDReader(QueueReader):
-    """A class for reading characters from a file descriptor on a background
-    thread. This has the advantages that the calling thread can close the
-    file and that the reading does not block the calling thread.
+    """A class for reading characters from a file descriptor in the
+    background, on the shared ``FDReactor`` thread where possible. This has
+    the advantages that the calling thread can close the file and that the
+    reading does not block the calling thread.
     """
 
-    def __init__(self, fd, timeout=None):
+    def __init__(self, fd, timeout=None, signal=None, max_queued=None):
         """
         Parameters
         ----------
@@ -149,15 +192,212 @@ class NonBlockingFDReader(QueueReader):
             A file descriptor
         timeout : float or None, optional
             The queue reading timeout.
+        signal : OutputSignal or None, optional
+            Set whenever data is read or the reader is closed.
+        max_queued : int or None, optional
+            The number of chunks that may wait in the queue before the reactor
+            stops reading, until some of them are read. None is unbounded.
         """
-        super().__init__(fd, timeout=timeout)
-        # start reading from stream
-        self.thread = threading.Thread(
-            target=populate_fd_queue, args=(self, self.fd, self.queue)
-        )
+        super().__init__(fd, timeout=timeout, signal=signal)
+        self.max_queued = max_queued
+        self.paused = False
+        self.reactor = None
+        if not ON_WINDOWS:
+            try:
+                get_fd_reactor().register(self, fd)
+                return
+            except OSError:
+                pass  # the fd could not be copied
+        self.read_on_thread()
+
+    def read_on_thread(self, fd=None):
+        """Reads from the file descriptor on a thread of its own, as the
+        reactor cannot poll it, e.g. for a regular file. ``fd`` is a copy
+        to read instead, which is closed once it is fully read.
+        """
+        self.reactor = None
+
+        def populate():
+            try:
+                populate_fd_queue(self, self.fd if fd is None else fd, self.queue)
+            finally:
+                if fd is not None:
+                    os.close(fd)
+
+        self.thread = threading.Thread(target=populate)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def is_full(self):
+        """Returns whether the queue holds as many chunks as it may."""
+        return self.max_queued is not None and self.queue.qsize() >= self.max_queued
+
+    def read_queue(self):
+        chunk = super().read_queue()
+        reactor = self.reactor
+        if self.paused and reactor is not None and not self.is_full():
+            reactor.resume(self)
+        return chunk
+
+    def close(self):
+        """Stops reading, closing the reactor's copy of the file descriptor,
+        and closes the reader.
+        """
+        if self.reactor is not None:
+            self.reactor.stop(self)
+            self.reactor = None
+        super().close()
+
+
+class FDReactor:
+    """Reads from the file descriptors of many ``NonBlockingFDReader`` objects
+    on a single background thread, rather than one thread per descriptor.
+
+    Each registered descriptor is duplicated, so the reactor keeps reading
+    until the writing end is closed even if the owner of the original
+    descriptor closes it first, just like a thread blocked in ``os.read()``.
+    The copy is closed as soon as the reader is closed, so that writers see
+    a broken pipe once nobody reads their output. A reader whose queue is
+    full is paused until its consumer catches up.
+    """
+
+    def __init__(self, chunksize=65536):
+        """
+        Parameters
+        ----------
+        chunksize : int, optional
+            The max size of each read, default 64 kb, i.e. a full pipe buffer.
+        """
+        self.chunksize = chunksize
+        self.pid = os.getpid()
+        self.selector = selectors.DefaultSelector()
+        self._fds = {}  # reader -> the duplicated fd
+        self._paused = set()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self.run, name="fd-reactor")
         self.thread.daemon = True
         self.thread.start()
 
+    def register(self, reader, fd):
+        """Starts reading from a copy of ``fd`` into ``reader``. If the copy
+        cannot be polled, the reader is told to read it on a thread of its
+        own instead.
+        """
+        fd = os.dup(fd)
+        reader.reactor = self
+        self._request(functools.partial(self._register, fd=fd), reader)
+
+    def resume(self, reader):
+        """Starts reading for a paused reader again."""
+        self._request(self._resume, reader)
+
+    def stop(self, reader):
+        """Stops reading for a reader and closes its copy of the fd."""
+        self._request(self._stop, reader)
+
+    def wake(self):
+        """Interrupts the current select so that new registrations are seen."""
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass  # already awake
+
+    def run(self):
+        """Dispatches reads until the process exits."""
+        while True:
+            woken = False
+            for key, _ in self.selector.select():
+                if key.fd == self._wake_r:
+                    woken = True
+                else:
+                    self._read(key)
+            if woken:
+                try:
+                    os.read(self._wake_r, 4096)
+                except BlockingIOError:
+                    pass
+                self._run_pending()
+
+    def _request(self, func, reader):
+        # the selector is only changed on the reactor thread
+        with self._lock:
+            self._pending.append((func, reader))
+        self.wake()
+
+    def _run_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for func, reader in pending:
+            func(reader)
+
+    def _read(self, key):
+        reader = key.data
+        try:
+            chunk = os.read(key.fd, self.chunksize)
+        except OSError:
+            chunk = b""
+        if chunk:
+            reader.put(chunk)
+            if reader.is_full():
+                self.selector.unregister(key.fd)
+                self._paused.add(reader)
+                reader.paused = True
+                if not reader.is_full():
+                    # the consumer caught up before it could see the pause
+                    self._resume(reader)
+            return
+        self._close_fd(reader)
+        reader.reactor = None
+        reader.queue.put(chunk)
+        reader.close()
+
+    def _register(self, reader, fd):
+        try:
+            self.selector.register(fd, selectors.EVENT_READ, reader)
+        except (OSError, ValueError):
+            reader.read_on_thread(fd)
+        else:
+            self._fds[reader] = fd
+
+    def _resume(self, reader):
+        if reader in self._paused:
+            self._paused.discard(reader)
+            reader.paused = False
+            self.selector.register(self._fds[reader], selectors.EVENT_READ, reader)
+
+    def _stop(self, reader):
+        if reader in self._fds:
+            self._close_fd(reader)
+            reader.paused = False
+
+    def _close_fd(self, reader):
+        fd = self._fds.pop(reader)
+        if reader in self._paused:
+            self._paused.discard(reader)
+        else:
+            self.selector.unregister(fd)
+        os.close(fd)
+
+
+_FD_REACTOR: "FDReactor | None" = None
+_FD_REACTOR_LOCK = threading.Lock()
+
+
+def get_fd_reactor():
+    """Returns the reactor shared by all non-blocking readers of this process,
+    starting it on first use.
+    """
+    global _FD_REACTOR
+    with _FD_REACTOR_LOCK:
+        if _FD_REACTOR is None or _FD_REACTOR.pid != os.getpid():
+            _FD_REACTOR = FDReactor()
+        return _FD_REACTOR
+
 
 def populate_buffer(reader, fd, buffer, chunksize):
     """Reads bytes from the file descriptor and copies them into a buffer.
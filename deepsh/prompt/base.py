@@ -1,15 +1,18 @@
 """Base prompt, provides PROMPT_FIELDS and prompt related functions"""
 
+import functools
 import itertools
 import os
 import re
 import socket
 import sys
+import time
 import typing as tp
 
 import deepsh.platform as xp
 import deepsh.tools as xt
 from deepsh.built_ins import XSH
+from deepsh.events import events
 
 if tp.TYPE_CHECKING:
     from deepsh.built_ins import DeepshSession
@@ -22,6 +25,22 @@ def DEFAULT_PROMPT():
     return default_prompt()
 
 
+_COMMANDS_RUN = 0
+
+
+@events.on_postcommand
+def _count_command(**_):
+    global _COMMANDS_RUN
+    _COMMANDS_RUN += 1
+
+
+def commands_run() -> int:
+    """The number of commands run in this session, as running one may change
+    what the prompt fields show, e.g. the files in the work tree.
+    """
+    return _COMMANDS_RUN
+
+
 class _ParsedToken(tp.NamedTuple):
     """It can either be a literal value alone or a field and its resultant value"""
 
@@ -29,6 +48,14 @@ class _ParsedToken(tp.NamedTuple):
     field: tp.Optional[str] = None
 
 
+@functools.lru_cache(maxsize=64)
+def compile_template(template: str) -> "tuple[tuple[str, str, str, str], ...]":
+    """Parses a prompt template into ``(literal, field, spec, conversion)``
+    tuples once, so that formatting it again only gets the values of its
+    fields."""
+    return tuple(xt.FORMATTER.parse(template))
+
+
 class ParsedTokens(tp.NamedTuple):
     tokens: list[_ParsedToken]
     template: tp.Union[str, tp.Callable]
@@ -75,9 +102,17 @@ class PromptFormatter:
     uses the ``PROMPT_FIELDS`` envvar (no color formatting).
     """
 
+    timings: "dict[str, float]"
+    """The seconds taken to get the value of each field in the last prompt."""
+
+    def __init__(self):
+        self.timings = {}
+
     def __call__(self, template=DEFAULT_PROMPT, fields=None, **kwargs) -> str:
         """Formats a deepsh prompt template string."""
 
+        self.timings = {}
+        start = time.perf_counter()
         if fields is None:
             self.fields = XSH.env["PROMPT_FIELDS"]  # type: ignore
         else:
@@ -101,12 +136,21 @@ class PromptFormatter:
                 f"Failed to format prompt `{template}`-> {type(ex)}:{ex}"
             )
             return _failover_template_format(template)
+        if XSH.env.get("DEEPSH_DEBUG", 0) >= 2:
+            self._print_timings(time.perf_counter() - start)
         return prompt
 
+    def _print_timings(self, total):
+        fields = ", ".join(
+            f"{field} {secs * 1e3:.2f} ms"
+            for field, secs in sorted(self.timings.items(), key=lambda x: -x[1])
+        )
+        print(f"prompt: formatted in {total * 1e3:.2f} ms: {fields}", file=sys.stderr)
+
     def _format_prompt(self, template=DEFAULT_PROMPT, **kwargs) -> ParsedTokens:
         tmpl = template() if callable(template) else template
         toks = []
-        for literal, field, spec, conv in xt.FORMATTER.parse(tmpl):
+        for literal, field, spec, conv in compile_template(tmpl):
             if literal:
                 toks.append(_ParsedToken(literal))
             entry = self._format_field(field, spec, conv, idx=len(toks), **kwargs)
@@ -129,12 +173,15 @@ class PromptFormatter:
             return "{" + field + "}"
 
     def _get_field_value(self, field, **_):
+        start = time.perf_counter()
         try:
             return self.fields.pick(field)
         except Exception:  # noqa
             print(f"prompt: error: on field {field!r}" "", file=sys.stderr)
             xt.print_exception()
             value = f"{{BACKGROUND_RED}}{{ERROR:{field}}}{{RESET}}"
+        finally:
+            self.timings[field] = time.perf_counter() - start
         return value
 
 
@@ -272,6 +319,12 @@ class PromptFields(tp.MutableMapping[str, "FieldType"]):
         self._cache: dict[str, str | FieldType] = {}
         """for callbacks this will catch the value and should be cleared between prompts"""
 
+        self._cache_keys: dict[str, tuple[tuple[str, ...], float | None]] = {}
+        """the keys and time to live of the fields declared with ``cache_on()``"""
+
+        self._kept: dict[str, tuple[tuple | None, float | None, tp.Any]] = {}
+        """the values kept across prompts, with their key and expiry time"""
+
         self.xsh = xsh
         if init:
             self.load_initial()
@@ -296,6 +349,10 @@ class PromptFields(tp.MutableMapping[str, "FieldType"]):
 
     def __delitem__(self, key):
         del self._items[key]
+        self._kept.clear()  # fields may use the values of others
+
+    def __contains__(self, key):
+        return key in self._items
 
     def __iter__(self):
         yield from self._items
@@ -305,6 +362,7 @@ class PromptFields(tp.MutableMapping[str, "FieldType"]):
 
     def __setitem__(self, key, value):
         self._items[key] = value
+        self._kept.clear()
 
     def get_fields(self, module):
         """Find and load all instances of PromptField from the given module.
@@ -365,6 +423,74 @@ class PromptFields(tp.MutableMapping[str, "FieldType"]):
         for val in self.get_fields(gitstatus):
             self[val.name] = val
 
+        self.cache_on(
+            "env_name",
+            "$VIRTUAL_ENV",
+            "$VIRTUAL_ENV_PROMPT",
+            "$VIRTUAL_ENV_DISABLE_PROMPT",
+            "$CONDA_DEFAULT_ENV",
+        )
+        for name in ("curr_branch", "branch_color", "branch_bg_color"):
+            # the files may also be changed from outside the shell
+            self.cache_on(name, "cwd", "cmd", ttl=5)
+
+    def cache_on(self, name: str, *keys: str, ttl: "float | None" = None):
+        """Keep the value of a field across prompts, until one of the keys
+        changes or ``ttl`` seconds have passed.
+
+        Parameters
+        ----------
+        name : str
+            name of the field
+        keys : str
+            ``"cwd"`` for the current directory, ``"cmd"`` for the number of
+            commands run, ``"$NAME"`` for an environment variable, e.g.
+            ``"$LAST_RETURN_CODE"`` for the return code of the last command
+        ttl : float, optional
+            the number of seconds the value is kept, or None to keep it
+            while the keys are the same
+        """
+        self._cache_keys[name] = (keys, ttl)
+        self._kept.pop(name, None)
+
+    def _cache_spec(self, name, value):
+        spec = self._cache_keys.get(name)
+        if spec is None and isinstance(value, BasePromptField):
+            if value.cache_keys or value.cache_ttl is not None:
+                spec = (value.cache_keys, value.cache_ttl)
+        return spec
+
+    def _cache_key(self, keys) -> tuple:
+        from deepsh.dirstack import _get_cwd
+
+        env = self.xsh.env
+        vals: list = []
+        for key in keys:
+            if key == "cwd":
+                vals.append(_get_cwd())
+            elif key == "cmd":
+                vals.append(commands_run())
+            elif key.startswith("$"):
+                vals.append(env.get(key[1:]) if env is not None else None)
+            else:
+                raise ValueError(f"unknown prompt field cache key: {key!r}")
+        return tuple(vals)
+
+    def _restore(self, name) -> bool:
+        """Put the value kept from a previous prompt in the cache, if it is
+        still valid."""
+        kept = self._kept.get(name)
+        if kept is None:
+            return False
+        key, expires, value = kept
+        spec = self._cache_spec(name, self._items[name])
+        if spec is None or key != self._cache_key(spec[0]):
+            return False
+        if expires is not None and time.monotonic() >= expires:
+            return False
+        self._cache[name] = value
+        return True
+
     def pick(self, key: "str|FieldType") -> "str | FieldType | None":
         """Get the value of the prompt-field
 
@@ -377,7 +503,9 @@ class PromptFields(tp.MutableMapping[str, "FieldType"]):
         if name not in self._items:
             return None
         value = self._items[name]
-        if name not in self._cache:
+        if name not in self._cache and not self._restore(name):
+            spec = self._cache_spec(name, value)
+            cache_key = None if spec is None else self._cache_key(spec[0])
             if isinstance(value, BasePromptField):
                 value.update(self)
             elif callable(value):
@@ -385,6 +513,10 @@ class PromptFields(tp.MutableMapping[str, "FieldType"]):
 
             # store in cache
             self._cache[name] = value
+            if spec is not None:
+                ttl = spec[1]
+                expires = None if ttl is None else time.monotonic() + ttl
+                self._kept[name] = (cache_key, expires, value)
         return self._cache[name]
 
     def pick_val(self, key):
@@ -394,7 +526,7 @@ class PromptFields(tp.MutableMapping[str, "FieldType"]):
 
     def needs_calling(self, name) -> bool:
         """check if we can offload the work"""
-        if name in self._cache or (name not in self._items):
+        if name in self._cache or (name not in self._items) or self._restore(name):
             return False
 
         value = self[name]
@@ -407,6 +539,7 @@ class PromptFields(tp.MutableMapping[str, "FieldType"]):
     def reset_key(self, key):
         """remove a single key from the cache (if it exists)"""
         self._cache.pop(key, None)
+        self._kept.pop(key, None)
 
 
 class BasePromptField:
@@ -417,6 +550,12 @@ class BasePromptField:
     updator: "tp.Callable[[FieldType, PromptFields], None] | None" = None
     """this is a callable that needs to update the value or any of the attribute of the field"""
 
+    cache_keys: "tuple[str, ...]" = ()
+    """keep the value across prompts while these are the same, see ``cache_on``"""
+
+    cache_ttl: "float | None" = None
+    """the number of seconds the value is kept across prompts"""
+
     def __init__(
         self,
         **kwargs,
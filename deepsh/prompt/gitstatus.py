@@ -52,9 +52,16 @@ See some examples below,
 
 import contextlib
 import os
+import re
 import subprocess
+import typing as tp
 
-from deepsh.prompt.base import MultiPromptField, PromptField, PromptFields
+from deepsh.prompt.base import (
+    MultiPromptField,
+    PromptField,
+    PromptFields,
+    commands_run,
+)
 
 
 def _get_sp_output(xsh, *args: str, **kwargs) -> str:
@@ -160,11 +167,6 @@ def get_stash_count(gitdir: str):
     return 0
 
 
-@GitStatusPromptField.wrap(prefix="⚑")
-def stash_count(fld: PromptField, ctx: PromptFields):
-    fld.value = get_stash_count(ctx.pick_val(repo_path))
-
-
 def get_operations(gitdir: str):
     """get the current git operation e.g. MERGE/REBASE..."""
     for file, name in (
@@ -189,10 +191,131 @@ def operations(fld, ctx: PromptFields) -> None:
         fld.value = ""
 
 
-@GitStatusPromptField.wrap()
+_GIT_VERSION: "tuple[int, ...] | None" = None
+
+
+def _git_version(xsh) -> "tuple[int, ...]":
+    """The version of git, which is only asked once."""
+    global _GIT_VERSION
+    if _GIT_VERSION is None:
+        out = _get_sp_output(xsh, "git", "--version")
+        match = re.search(r"(\d+)\.(\d+)", out)
+        if match is None:
+            return (0, 0)  # e.g. timed out, ask again next time
+        _GIT_VERSION = tuple(map(int, match.groups()))
+    return _GIT_VERSION
+
+
+def _repo_stamp(gitdir: str):
+    """The state of the files git updates when the index, HEAD or the refs
+    change, along with the number of commands run, or None if the state
+    cannot be known. The files of the work tree are not in it, as they may
+    be changed by any command, hence the number of commands run.
+    """
+    gitdir = os.path.abspath(gitdir)
+    try:
+        with open(os.path.join(gitdir, "HEAD")) as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+    commondir = gitdir
+    with contextlib.suppress(OSError):
+        # a linked work tree shares the refs of the main one
+        with open(os.path.join(gitdir, "commondir")) as f:
+            commondir = os.path.join(gitdir, f.read().strip())
+    files = [
+        os.path.join(gitdir, "HEAD"),
+        os.path.join(gitdir, "index"),
+        os.path.join(gitdir, "logs", "HEAD"),
+        os.path.join(commondir, "packed-refs"),
+        os.path.join(commondir, "FETCH_HEAD"),
+        os.path.join(commondir, "logs", "refs", "stash"),
+    ]
+    if head.startswith("ref: "):
+        files.append(os.path.join(commondir, head[len("ref: ") :]))
+    stamp: list = [gitdir, head, commands_run()]
+    for fname in files:
+        try:
+            st = os.stat(fname)
+        except OSError:
+            stamp.append(None)
+        else:
+            stamp.append((st.st_mtime_ns, st.st_size, st.st_ino))
+    return tuple(stamp)
+
+
+def _parse_porcelain_v2(status: str) -> dict:
+    """Parses the output of ``git status --porcelain=v2 --branch --show-stash``.
+    A detached HEAD is shown by its short hash, from the ``branch.oid`` header.
+    """
+    info: dict[str, tp.Any] = {
+        "branch": "",
+        "ahead": 0,
+        "behind": 0,
+        "untracked": 0,
+        "changed": 0,
+        "deleted": 0,
+        "conflicts": 0,
+        "staged": 0,
+        "stash": 0,
+    }
+    oid = ""
+    for line in status.splitlines():
+        kind, _, rest = line.partition(" ")
+        if kind == "#":
+            header, _, val = rest.partition(" ")
+            if header == "branch.oid":
+                oid = val
+            elif header == "branch.head":
+                info["branch"] = val if val != "(detached)" else None
+            elif header == "branch.ab":
+                ahead, behind = val.split()
+                info["ahead"] = _parse_int(ahead.lstrip("+"))
+                info["behind"] = _parse_int(behind.lstrip("-"))
+            elif header == "stash":
+                info["stash"] = _parse_int(val)
+        elif kind == "?":
+            info["untracked"] += 1
+        elif kind == "u":
+            info["conflicts"] += 1
+        elif kind in ("1", "2") and len(rest) > 1:
+            if rest[1] == "M":
+                info["changed"] += 1
+            elif rest[1] == "D":
+                info["deleted"] += 1
+            if rest[0] != ".":
+                info["staged"] += 1
+    if info["branch"] is None:
+        info["branch"] = oid[:7]
+    return info
+
+
+@GitStatusPromptField.wrap(_stamp=None)
 def porcelain(fld, ctx: PromptFields):
-    """Return parsed values from ``git status --porcelain``"""
+    """Return parsed values from ``git status --porcelain``.
+
+    Git is run again after each command, and when the index, HEAD or the
+    refs changed. So it still runs once per command, and the result is only
+    reused when the same prompt is formatted again, e.g. when it is redrawn.
+    """
+    gitdir = ctx.pick_val(repo_path)
+    stamp = _repo_stamp(gitdir)
+    if stamp is not None and stamp == fld._stamp and fld.value is not None:
+        return
+    if _git_version(ctx.xsh) >= (2, 35):
+        status = _get_sp_output(
+            ctx.xsh, "git", "status", "--porcelain=v2", "--branch", "--show-stash"
+        )
+        fld.value = _parse_porcelain_v2(status)
+    else:
+        fld.value = _parse_porcelain_v1(ctx, gitdir)
+    fld._stamp = stamp
+
 
+def _parse_porcelain_v1(ctx: PromptFields, gitdir: str) -> dict:
+    """Runs and parses ``git status --porcelain --branch``, for versions of git
+    before 2.35, which cannot show the stash count.
+    """
     status = _get_sp_output(ctx.xsh, "git", "status", "--porcelain", "--branch")
     branch = ""
     ahead, behind = 0, 0
@@ -229,7 +352,7 @@ def porcelain(fld, ctx: PromptFields):
             elif len(line) > 0 and line[0] != " ":
                 staged += 1
 
-    fld.value = {
+    return {
         "branch": branch,
         "ahead": ahead,
         "behind": behind,
@@ -238,6 +361,7 @@ def porcelain(fld, ctx: PromptFields):
         "deleted": deleted,
         "conflicts": conflicts,
         "staged": staged,
+        "stash": get_stash_count(gitdir),
     }
 
 
@@ -263,6 +387,7 @@ changed = _GSInfo(prefix="{BLUE}+", suffix="{RESET}", info="changed")
 deleted = _GSInfo(prefix="{RED}-", suffix="{RESET}", info="deleted")
 conflicts = _GSInfo(prefix="{RED}×", suffix="{RESET}", info="conflicts")
 staged = _GSInfo(prefix="{RED}●", suffix="{RESET}", info="staged")
+stash_count = _GSInfo(prefix="⚑", info="stash")
 
 
 @GitStatusPromptField.wrap()
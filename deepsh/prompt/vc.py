@@ -14,6 +14,7 @@ import deepsh.tools as xt
 from deepsh.built_ins import XSH
 from deepsh.lib.lazyasd import LazyObject
 from deepsh.procs.executables import locate_executable
+from deepsh.prompt.base import commands_run
 
 RE_REMOVE_ANSI = LazyObject(
     lambda: re.compile(r"(?:\x1B[@-_]|[\x80-\x9F])[0-?]*[ -/]*[@-~]"),
@@ -65,23 +66,35 @@ def get_git_branch():
     return branch
 
 
-def _get_hg_root(q):
-    _curpwd = XSH.env["PWD"]
-    while True:
-        if not os.path.isdir(_curpwd):
-            return False
-        try:
-            dot_hg_is_in_curwd = any([b.name == ".hg" for b in os.scandir(_curpwd)])
-        except OSError:
-            return False
-        if dot_hg_is_in_curwd:
-            q.put(_curpwd)
+_VC_ROOTS: dict = {}
+
+
+def find_vc_root(path, *markers):
+    """Walks up from ``path`` to the first directory that contains one of the
+    ``markers``, e.g. ``".hg"``. Returns ``(root, marker)``, or None if there
+    is none. The cache is keyed on ``commands_run()``, so it does not outlive
+    the current prompt; it only saves the repeated walks of a single render.
+    """
+    key = (str(path), markers)
+    stamp = commands_run()
+    cached = _VC_ROOTS.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    if len(_VC_ROOTS) > 256:
+        _VC_ROOTS.clear()
+    found = None
+    curr = os.path.abspath(path)
+    while found is None:
+        for marker in markers:
+            if os.path.lexists(os.path.join(curr, marker)):
+                found = (curr, marker)
+                break
+        parent = os.path.dirname(curr)
+        if parent == curr:
             break
-        else:
-            _oldpwd = _curpwd
-            _curpwd = os.path.split(_curpwd)[0]
-            if _oldpwd == _curpwd:
-                return False
+        curr = parent
+    _VC_ROOTS[key] = (stamp, found)
+    return found
 
 
 def get_hg_branch(root=None):
@@ -89,15 +102,12 @@ def get_hg_branch(root=None):
     return None if not in a repo or subprocess.TimeoutExpired if timed out.
     """
     env = XSH.env
-    timeout = env["VC_BRANCH_TIMEOUT"]
-    q = queue.Queue()
-    t = threading.Thread(target=_get_hg_root, args=(q,))
-    t.start()
-    t.join(timeout=timeout)
-    try:
-        root = pathlib.Path(q.get_nowait())
-    except queue.Empty:
-        return None
+    if root is None:
+        found = find_vc_root(env["PWD"], ".hg")
+        if found is None:
+            return None
+        root = found[0]
+    root = pathlib.Path(root)
     if env.get("VC_HG_SHOW_BRANCH"):
         # get branch name
         branch_path = root / ".hg" / "branch"
@@ -132,10 +142,48 @@ def _run_fossil_cmd(cmd):
     return result
 
 
+def _read_fossil_branch(root, checkout_db):
+    """Reads the branch of a fossil checkout from its database and the
+    repository it was opened from. Returns None if they cannot be read.
+    """
+    import sqlite3
+    import urllib.parse
+
+    def _connect_readonly(path):
+        uri = "file:" + urllib.parse.quote(os.path.abspath(path)) + "?mode=ro"
+        return contextlib.closing(sqlite3.connect(uri, uri=True))
+
+    try:
+        with _connect_readonly(os.path.join(root, checkout_db)) as db:
+            vvar = dict(
+                db.execute(
+                    "SELECT name, value FROM vvar "
+                    "WHERE name IN ('checkout', 'repository')"
+                )
+            )
+        with _connect_readonly(os.path.join(root, vvar["repository"])) as db:
+            row = db.execute(
+                "SELECT tagxref.value FROM tagxref JOIN tag USING (tagid) "
+                "WHERE tag.tagname = 'branch' AND tagxref.tagtype > 0 "
+                "AND tagxref.rid = ?",
+                (int(vvar["checkout"]),),
+            ).fetchone()
+    except (sqlite3.Error, KeyError, TypeError, ValueError):
+        return None
+    return row[0] if row else None
+
+
 def get_fossil_branch():
     """Attempts to find the current fossil branch. If this could not
     be determined (timeout, not in a fossil checkout, etc.) then this returns None.
     """
+    # .fslckout on Unix, _FOSSIL_ on Windows
+    found = find_vc_root(XSH.env["PWD"], ".fslckout", "_FOSSIL_")
+    if found is None:
+        return None
+    branch = _read_fossil_branch(*found)
+    if branch:
+        return branch
     # from fossil branch --help: "fossil branch current: Print the name of the branch for the current check-out"
     cmd = "fossil branch current".split()
     try:
@@ -208,13 +256,60 @@ def _git_dirty_working_directory(q, include_untracked):
         q.put(None)
 
 
+def _git_dir(path):
+    """Finds the git directory of the work tree ``path`` is in, without
+    running git. Returns None if it is not found.
+    """
+    found = find_vc_root(path, ".git")
+    if found is None:
+        return None
+    gitdir = os.path.join(found[0], ".git")
+    if os.path.isfile(gitdir):
+        # worktrees and submodules have a "gitdir: <path>" file instead
+        try:
+            with open(gitdir) as f:
+                line = f.readline().strip()
+        except OSError:
+            return None
+        if not line.startswith("gitdir:"):
+            return None
+        gitdir = os.path.join(found[0], line[len("gitdir:") :].strip())
+    return gitdir
+
+
+def _git_index_stamp(gitdir):
+    """Changes whenever the index or HEAD is written, or a command is run."""
+    stamp: list = [commands_run()]
+    for name in ("HEAD", "index"):
+        try:
+            st = os.stat(os.path.join(gitdir, name))
+        except OSError:
+            stamp.append(None)
+        else:
+            stamp.append((st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+_GIT_DIRTY: dict = {}
+
+
 def git_dirty_working_directory():
     """Returns whether or not the git directory is dirty. If this could not
     be determined (timeout, file not found, etc.) then this returns None.
+
+    The result is reused as long as the index and HEAD are unchanged and no
+    command was run.
     """
     env = XSH.env
     timeout = env.get("VC_BRANCH_TIMEOUT")
     include_untracked = env.get("VC_GIT_INCLUDE_UNTRACKED")
+    gitdir = None if "GIT_DIR" in env else _git_dir(env["PWD"])
+    if gitdir is not None:
+        key = (gitdir, include_untracked)
+        stamp = _git_index_stamp(gitdir)
+        cached = _GIT_DIRTY.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
     q = queue.Queue()
     t = threading.Thread(
         target=_git_dirty_working_directory, args=(q, include_untracked)
@@ -222,9 +317,12 @@ def git_dirty_working_directory():
     t.start()
     t.join(timeout=timeout)
     try:
-        return q.get_nowait()
+        dirty = q.get_nowait()
     except queue.Empty:
         return None
+    if gitdir is not None and dirty is not None:
+        _GIT_DIRTY[key] = (stamp, dirty)
+    return dirty
 
 
 def hg_dirty_working_directory():
@@ -34,7 +34,6 @@ from deepsh.color_tools import (
     RE_BACKGROUND,
     RE_DEEPSH_COLOR,
     find_closest_color,
-    iscolor,
     make_palette,
     warn_deprecated_no_color,
 )
@@ -49,10 +48,13 @@ from deepsh.platform import (
 )
 from deepsh.procs.executables import locate_executable
 from deepsh.pygments_cache import add_custom_style, get_style_by_name
-from deepsh.style_tools import DEFAULT_STYLE_DICT, norm_name
+from deepsh.style_tools import (
+    DEFAULT_STYLE_DICT,
+    compile_color_template,
+    norm_name,
+)
 from deepsh.tools import (
     ANSICOLOR_NAMES_MAP,
-    FORMATTER,
     ON_WINDOWS,
     PTK_NEW_OLD_COLOR_MAP,
     hardcode_colors_for_win10,
@@ -278,41 +280,11 @@ def partial_color_tokenize(template):
 
 
 def _partial_color_tokenize_main(template, styles):
-    bopen = "{"
-    bclose = "}"
-    colon = ":"
-    expl = "!"
-    color = Color.DEFAULT
-    fg = bg = None
-    value = ""
-    toks = []
-    for literal, field, spec, conv in FORMATTER.parse(template):
-        if field is None:
-            value += literal
-        elif iscolor(field):
-            value += literal
-            next_color, fg, bg = color_by_name(field, fg, bg)
-            if next_color is not color:
-                if len(value) > 0:
-                    toks.append((color, value))
-                    if styles is not None:
-                        styles[color]  # ensure color is available
-                color = next_color
-                value = ""
-        elif field is not None:
-            parts = [literal, bopen, field]
-            if conv is not None and len(conv) > 0:
-                parts.append(expl)
-                parts.append(conv)
-            if spec is not None and len(spec) > 0:
-                parts.append(colon)
-                parts.append(spec)
-            parts.append(bclose)
-            value += "".join(parts)
-        else:
-            value += literal
-    toks.append((color, value))
-    return toks, color
+    toks, color = compile_color_template(template, color_by_name, Color.DEFAULT)
+    if styles is not None:
+        for tok_color, _ in toks[:-1]:
+            styles[tok_color]  # ensure color is available
+    return list(toks), color
 
 
 class CompoundColorMap(MutableMapping):
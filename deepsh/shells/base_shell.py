@@ -8,12 +8,9 @@ import time
 from deepsh.ansi_colors import ansi_partial_color_format
 from deepsh.built_ins import XSH
 from deepsh.codecache import (
-    code_cache_check,
-    code_cache_name,
-    get_cache_filename,
+    CODE_STORE,
     run_compiled_code,
     should_use_cache,
-    update_cache,
 )
 from deepsh.completer import Completer
 from deepsh.events import events
@@ -500,10 +497,9 @@ class BaseShell:
         """
         _cache = should_use_cache(self.execer, "single")
         if _cache:
-            codefname = code_cache_name(src)
-            cachefname = get_cache_filename(codefname, code=True)
-            usecache, code = code_cache_check(cachefname)
-            if usecache:
+            cachekey = CODE_STORE.key(src, "<stdin>", "single")
+            code = CODE_STORE.get(cachekey)
+            if code is not None:
                 self.reset_buffer()
                 return src, code
         lincont = get_line_continuation()
@@ -519,8 +515,8 @@ class BaseShell:
                 filename="<stdin>",
                 compile_empty_tree=False,
             )
-            if _cache:
-                update_cache(code, cachefname)
+            if _cache and code is not None:
+                CODE_STORE.put(cachekey, code)
             self.reset_buffer()
         except SyntaxError:
             partial_string_info = check_for_partial_string(src)
@@ -12,7 +12,6 @@ from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
 from prompt_toolkit.clipboard import InMemoryClipboard
 from prompt_toolkit.enums import EditingMode
 from prompt_toolkit.formatted_text import PygmentsTokens, to_formatted_text
-from prompt_toolkit.history import ThreadedHistory
 from prompt_toolkit.key_binding.bindings.emacs import (
     load_emacs_shift_selection_bindings,
 )
@@ -33,7 +32,11 @@ from deepsh.shell import transform_command
 from deepsh.shells.base_shell import BaseShell
 from deepsh.shells.ptk_shell.completer import PromptToolkitCompleter
 from deepsh.shells.ptk_shell.formatter import PTKPromptFormatter
-from deepsh.shells.ptk_shell.history import PromptToolkitHistory, _cust_history_matches
+from deepsh.shells.ptk_shell.history import (
+    PagedThreadedHistory,
+    PromptToolkitHistory,
+    _cust_history_matches,
+)
 from deepsh.shells.ptk_shell.key_bindings import load_deepsh_bindings
 from deepsh.style_tools import DEFAULT_STYLE_DICT, _TokenType, partial_color_tokenize
 from deepsh.tools import carriage_return, print_exception, print_warning
@@ -198,7 +201,7 @@ class PromptToolkitShell(BaseShell):
         if ON_WINDOWS:
             winutils.enable_virtual_terminal_processing()
         self._first_prompt = True
-        self.history = ThreadedHistory(PromptToolkitHistory())
+        self.history = PagedThreadedHistory(PromptToolkitHistory())
         self.push = self._push
 
         ptk_args.setdefault("history", self.history)
@@ -3,6 +3,7 @@
 import prompt_toolkit.history
 
 from deepsh.built_ins import XSH
+from deepsh.history.base import History
 
 
 class PromptToolkitHistory(prompt_toolkit.history.History):
@@ -19,16 +20,19 @@ class PromptToolkitHistory(prompt_toolkit.history.History):
         pass
 
     def load_history_strings(self):
-        """Loads synchronous history strings"""
+        """Loads synchronous history strings, newest first. Only the newest
+        occurrence of each input is kept.
+        """
         if not self.load_prev:
             return
         hist = XSH.history
         if hist is None:
             return
+        seen = set()
         for cmd in hist.all_items(newest_first=True):
             line = cmd["inp"].rstrip()
-            strs = self.get_strings()
-            if len(strs) == 0 or line != strs[-1]:
+            if line not in seen:
+                seen.add(line)
                 yield line
 
     def __getitem__(self, index):
@@ -41,13 +45,87 @@ class PromptToolkitHistory(prompt_toolkit.history.History):
         return iter(self.get_strings())
 
 
+class PagedThreadedHistory(prompt_toolkit.history.ThreadedHistory):
+    """Loads the history strings on a background thread, like
+    ``ThreadedHistory``, but hands them over ``page_size`` at a time. The
+    prompt can use the first page while the rest is loading, and the loader
+    takes the lock and wakes the prompt once per page rather than once per
+    string.
+    """
+
+    page_size = 1000
+
+    def _in_load_thread(self):
+        try:
+            # strings appended before the load are in the history already
+            self._loaded_strings = []
+            page = []
+            for item in self.history.load_history_strings():
+                page.append(item)
+                if len(page) >= self.page_size:
+                    self._add_page(page)
+                    page = []
+            self._add_page(page)
+        finally:
+            with self._lock:
+                self._loaded = True
+            for event in self._string_load_events:
+                event.set()
+
+    def _add_page(self, page):
+        with self._lock:
+            self._loaded_strings.extend(page)
+        for event in self._string_load_events:
+            event.set()
+
+
+MIN_INDEXED_QUERY = 3
+"""Shorter search texts are matched line by line, as they match too much of
+the history for its index to help."""
+
+MAX_INDEXED_MATCHES = 10_000
+"""The most inputs taken from the search of the history backend. Past that,
+the lines are matched one by one."""
+
+
+def _indexed_history_matches(buffer, text):
+    """The inputs that contain ``text``, as found by the search of the
+    history backend, or None if it only scans the items, the text is short
+    or it matches too many inputs. They are cached on the buffer while the
+    search text stays the same.
+    """
+    hist = XSH.history
+    if hist is None or type(hist).search is History.search:
+        return None
+    if len(text) < MIN_INDEXED_QUERY:
+        return None
+    key = (text, len(buffer._working_lines))
+    cached = getattr(buffer, "_deepsh_history_matches", None)
+    if cached is None or cached[0] != key:
+        items = list(
+            hist.search(text, newest_first=True, limit=MAX_INDEXED_MATCHES + 1)
+        )
+        if len(items) > MAX_INDEXED_MATCHES:
+            matches = None
+        else:
+            matches = {item["inp"].rstrip() for item in items}
+        cached = buffer._deepsh_history_matches = (key, matches)
+    return cached[1]
+
+
 def _cust_history_matches(self, i):
     """Custom history search method for prompt_toolkit that matches previous
     commands anywhere on a line, not just at the start.
 
     This gets monkeypatched into the prompt_toolkit prompter if
     ``DEEPSH_HISTORY_MATCH_ANYWHERE=True``"""
-    return (
-        self.history_search_text is None
-        or self.history_search_text in self._working_lines[i]
-    )
+    text = self.history_search_text
+    if text is None:
+        return True
+    line = self._working_lines[i]
+    # the last working line is the one being edited, the others are history
+    if i < len(self._working_lines) - 1:
+        matches = _indexed_history_matches(self, text)
+        if matches is not None:
+            return line in matches
+    return text in line
@@ -2,7 +2,9 @@
 
 import concurrent.futures
 import threading
+import time
 import typing as tp
+import weakref
 
 from prompt_toolkit import PromptSession
 from prompt_toolkit.formatted_text import PygmentsTokens
@@ -11,9 +13,18 @@ from deepsh.built_ins import XSH
 from deepsh.prompt.base import ParsedTokens
 from deepsh.style_tools import partial_color_tokenize, style_as_faded
 
+TIMED_OUT = style_as_faded("…")
+"""Shown in place of the fields that run longer than $ASYNC_PROMPT_FIELD_TIMEOUT"""
+
 
 class Executor:
-    """Caches thread results across prompts."""
+    """Caches thread results across prompts.
+
+    A field used by several prompts, e.g. the left and right ones, is only run
+    once per prompt. Each prompt is a new generation, and the fields of the
+    previous ones are cancelled if they have not started yet, or their
+    results are only kept for showing faded in the next prompts.
+    """
 
     def __init__(self):
         self.thread_pool = concurrent.futures.ThreadPoolExecutor(
@@ -24,9 +35,42 @@ class Executor:
         # This caches results from callback alone by field name.
         self.thread_results = {}
 
+        self.generation = 0
+        # the futures of the current generation by field name
+        self.running: dict[str, concurrent.futures.Future] = {}
+        # the generation of the results in thread_results
+        self._results_generation: dict[str, int] = {}
+        # when the futures started running
+        self.started: weakref.WeakKeyDictionary[concurrent.futures.Future, float] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def new_generation(self):
+        """Start a new prompt, cancelling the fields of the previous one."""
+        with self._lock:
+            self.generation += 1
+            for future in self.running.values():
+                future.cancel()
+            self.running.clear()
+
+    def cancel(self, future: concurrent.futures.Future):
+        """Cancel a future, unless other prompts of this generation use it."""
+        with self._lock:
+            if future not in self.running.values():
+                future.cancel()
+
     def submit(self, func: tp.Callable, field: str):
-        future = self.thread_pool.submit(self._run_func, func, field)
         place_holder = "{" + field + "}"
+        with self._lock:
+            running = self.running.get(field)
+            if running is not None and not running.cancelled():
+                future = running
+            else:
+                future = self.thread_pool.submit(
+                    self._run_func, func, field, self.generation
+                )
+                self.running[field] = future
 
         return (
             future,
@@ -38,12 +82,24 @@ class Executor:
             place_holder,
         )
 
-    def _run_func(self, func, field):
+    def _run_func(self, func, field, generation=None):
         """Run the callback and store the result."""
+        if generation is not None and generation != self.generation:
+            # a new prompt started before this one got a thread
+            raise concurrent.futures.CancelledError()
+        with self._lock:
+            future = self.running.get(field)
+            if future is not None and generation == self.generation:
+                self.started[future] = time.monotonic()
         result = func()
-        self.thread_results[field] = (
-            result if result is None else style_as_faded(result)
-        )
+        with self._lock:
+            if generation is None or generation >= self._results_generation.get(
+                field, -1
+            ):
+                self._results_generation[field] = generation or 0
+                self.thread_results[field] = (
+                    result if result is None else style_as_faded(result)
+                )
         return result
 
 
@@ -88,32 +144,73 @@ class AsyncPrompt:
         if not self.tokens:
             print(f"Warn: AsyncPrompt is created without tokens - {self.name}")
             return
-        for fut in concurrent.futures.as_completed(self.futures):
-            try:
-                val = fut.result()
-            except concurrent.futures.CancelledError:
-                continue
-
-            if fut not in self.futures:
-                # rare case where the future is completed but the container is already cleared
-                # because new prompt is called
-                continue
-
-            placeholder, idx, spec, conv = self.futures[fut]
-            # example: placeholder="{field}", idx=10, spec="env: {}"
+        timeout = XSH.env.get("ASYNC_PROMPT_FIELD_TIMEOUT")
+        pending = set(self.futures)
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending,
+                timeout=self._wait_time(pending, timeout),
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for fut in done:
+                try:
+                    val = fut.result()
+                except concurrent.futures.CancelledError:
+                    continue
+
+                if fut not in self.futures:
+                    # rare case where the future is completed but the container is already cleared
+                    # because new prompt is called
+                    continue
+
+                self._update_token(val, *self.futures[fut])
+
+                # calling invalidate in less period is inefficient
+                self.invalidate()
+
+            # show that the fields that are still running timed out
+            timed_out = {fut for fut in pending if self._timed_out(fut, timeout)}
+            for fut in timed_out:
+                if fut in self.futures:
+                    self._update_token(TIMED_OUT, *self.futures[fut])
+            if timed_out:
+                self.invalidate()
+            # the futures of a stopped prompt are not waited for
+            pending = {fut for fut in pending - timed_out if fut in self.futures}
 
-            if isinstance(idx, int):
-                self.tokens.update(idx, val, spec, conv)
-            else:  # when the function is called outside shell.
-                for idx, ptok in enumerate(self.tokens.tokens):
-                    if placeholder in ptok.value:
-                        val = ptok.value.replace(placeholder, val)
-                        self.tokens.update(idx, val, spec, conv)
+        on_complete(self.name)
 
-            # calling invalidate in less period is inefficient
-            self.invalidate()
+    def _timed_out(self, fut, timeout) -> bool:
+        start = self.executor.started.get(fut)
+        return (
+            timeout is not None
+            and start is not None
+            and time.monotonic() - start >= timeout
+        )
 
-        on_complete(self.name)
+    def _wait_time(self, pending, timeout) -> tp.Optional[float]:
+        """Seconds until the first of the pending fields times out. The
+        fields waiting for a thread are checked again after ``timeout``, as
+        their time only counts once they start."""
+        if timeout is None:
+            return None
+        now = time.monotonic()
+        waits = [timeout]
+        for fut in pending:
+            start = self.executor.started.get(fut)
+            if start is not None:
+                waits.append(max(0.0, start + timeout - now))
+        return min(waits)
+
+    def _update_token(self, val, placeholder, idx, spec, conv):
+        # example: placeholder="{field}", idx=10, spec="env: {}"
+        if isinstance(idx, int):
+            self.tokens.update(idx, val, spec, conv)
+        else:  # when the function is called outside shell.
+            for idx, ptok in enumerate(self.tokens.tokens):
+                if placeholder in ptok.value:
+                    val = ptok.value.replace(placeholder, val)
+                    self.tokens.update(idx, val, spec, conv)
 
     def invalidate(self):
         """Create a timer to update the prompt. The timing can be configured through env variables.
@@ -138,7 +235,7 @@ class AsyncPrompt:
     def stop(self):
         """Stop any running threads"""
         for fut in self.futures:
-            fut.cancel()
+            self.executor.cancel(fut)
         self.futures.clear()
 
     def submit_section(
@@ -165,12 +262,17 @@ class PromptUpdator:
         self.executor = Executor()
         self.futures = {}
         self.attrs_loaded = None
+        # whether the prompts were started, so the next one added is a new prompt
+        self.started = False
 
     def add(self, prompt_name: tp.Optional[str]) -> tp.Optional[AsyncPrompt]:
         # clear out old futures from the same prompt
         if prompt_name is None:
             return None
 
+        if self.started:
+            self.started = False
+            self.executor.new_generation()
         self.stop(prompt_name)
 
         self.prompts[prompt_name] = AsyncPrompt(
@@ -185,6 +287,7 @@ class PromptUpdator:
 
     def start(self):
         """after ptk prompt is created, update it in background."""
+        self.started = True
         if not self.attrs_loaded:
             self.attrs_loaded = self.executor.thread_pool.submit(self.add_attrs)
 
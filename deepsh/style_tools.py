@@ -1,5 +1,6 @@
 """Deepsh color styling tools that simulate pygments, when it is unavailable."""
 
+import functools
 from collections import defaultdict
 
 from deepsh.color_tools import RE_BACKGROUND, iscolor, warn_deprecated_no_color
@@ -83,11 +84,35 @@ def partial_color_tokenize(template):
 
 
 def _partial_color_tokenize_main(template, styles):
+    toks, color = compile_color_template(template)
+    if styles is not None:
+        for tok_color, _ in toks[:-1]:
+            styles[tok_color]  # ensure color is available
+    return list(toks), color
+
+
+@functools.lru_cache(maxsize=256)
+def compile_color_template(template, by_name=None, default=None):
+    """Splits a template at its colors, returning a tuple of ``(color,
+    string)`` tokens and the last color. The results are cached, as prompts
+    are mostly the same from one to the next.
+
+    Parameters
+    ----------
+    template : str
+        The template, with colors like ``{RED}``.
+    by_name : callable, optional
+        Replaces ``color_by_name()``, e.g. to get pygments tokens and register
+        their styles.
+    default : optional
+        The color of the start of the template, ``Color.RESET`` by default.
+    """
+    by_name = color_by_name if by_name is None else by_name
     bopen = "{"
     bclose = "}"
     colon = ":"
     expl = "!"
-    color = Color.RESET
+    color = Color.RESET if default is None else default
     fg = bg = None
     value = ""
     toks = []
@@ -96,12 +121,10 @@ def _partial_color_tokenize_main(template, styles):
             value += literal
         elif iscolor(field):
             value += literal
-            next_color, fg, bg = color_by_name(field, fg, bg)
+            next_color, fg, bg = by_name(field, fg, bg)
             if next_color is not color:
                 if len(value) > 0:
                     toks.append((color, value))
-                    if styles is not None:
-                        styles[color]  # ensure color is available
                 color = next_color
                 value = ""
         elif field is not None:
@@ -117,7 +140,7 @@ def _partial_color_tokenize_main(template, styles):
         else:
             value += literal
     toks.append((color, value))
-    return toks, color
+    return tuple(toks), color
 
 
 def color_by_name(name, fg=None, bg=None):
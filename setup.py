@@ -17,6 +17,8 @@ TABLES = [
     "deepsh/lexer_table.py",
     "deepsh/parser_table.py",
     "deepsh/completion_parser_table.py",
+    "deepsh/parser_table.marshal",
+    "deepsh/completion_parser_table.marshal",
 ]
 
 
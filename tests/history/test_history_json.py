@@ -2,12 +2,16 @@
 
 # pylint: disable=protected-access
 
+import os
 import shlex
 
 import pytest
 
+from deepsh.history import json as xhj
 from deepsh.history.json import (
     JsonHistory,
+    JsonHistoryCatalog,
+    JsonHistoryGC,
     _xhj_gc_bytes_to_rmfiles,
     _xhj_gc_commands_to_rmfiles,
     _xhj_gc_files_to_rmfiles,
@@ -162,6 +166,23 @@ def test_cmd_field(hist, xession):
     assert hist.outs[-1] is None
 
 
+def test_hist_flush_appends(hist, xession):
+    """Verify that consecutive flushes append to the history file."""
+    xession.env["HISTCONTROL"] = set()
+    for i, cmd in enumerate(CMDS):
+        hist.append({"inp": cmd, "rtn": i})
+        hf = hist.flush()
+        while hf.is_alive():
+            pass
+    with LazyJSON(hist.filename) as lj:
+        assert lj.appendable
+        assert [c["inp"] for c in lj["cmds"]] == CMDS
+        assert lj["here"] == "yup"
+    assert list(hist.inps) == CMDS
+    assert hist.rtns[3] == 3
+    assert hist.inps[-1] == CMDS[-1]
+
+
 @pytest.mark.parametrize(
     "inp, commands, offset",
     [
@@ -611,3 +632,82 @@ def test_hist_on_cmd(hist, xession, capsys, tmpdir):
         hist.append({"inp": cmd, "rtn": 0, "ts": (ts + 1, ts + 1.5)})
 
     assert len(xession.history) == 6
+
+
+@pytest.fixture
+def data_dir(xession, tmp_path):
+    xession.env["DEEPSH_DATA_DIR"] = str(tmp_path)
+    xession.env["HISTCONTROL"] = set()
+    data_dir = tmp_path / "history_json"
+    data_dir.mkdir()
+    return data_dir
+
+
+def _session_file(data_dir, name, cmds, ts):
+    hist = JsonHistory(
+        filename=str(data_dir / f"deepsh-{name}.json"),
+        sessionid=name,
+        buffersize=len(cmds) + 1,
+        gc=False,
+        ts=[ts, None],
+        locked=True,
+    )
+    for i, inp in enumerate(cmds):
+        hist.append({"inp": inp, "rtn": 0, "ts": [ts + i, ts + i + 0.5]})
+    hist.flush(at_exit=True)
+    return hist.filename
+
+
+def test_catalog_updated_at_exit(hist, xession):
+    xession.env["HISTCONTROL"] = set()
+    for ts, cmd in enumerate(CMDS):
+        hist.append({"inp": cmd, "rtn": 0, "ts": (ts + 1, ts + 1.5)})
+    hist.flush(at_exit=True)
+    entry = JsonHistoryCatalog().get(hist.filename)
+    assert entry[2] == len(CMDS)
+    assert entry[5] is False  # unlocked at exit
+
+    hist.append({"inp": "ls", "rtn": 0, "ts": (10, 11)})
+    assert JsonHistoryCatalog().get(hist.filename) == entry  # not flushed yet
+    hist.flush().join()
+    # only updated when the session is closed
+    assert JsonHistoryCatalog().entries[hist.filename] == entry
+    hist.append({"inp": "pwd", "rtn": 0, "ts": (12, 13)})
+    hist.flush(at_exit=True)
+    assert JsonHistoryCatalog().get(hist.filename)[2] == len(CMDS) + 2
+
+
+def test_gc_uses_and_updates_catalog(data_dir, monkeypatch):
+    old = _session_file(data_dir, "old", ["ls", "pwd"], 1)
+    new = _session_file(data_dir, "new", ["make"], 100)
+    gc = JsonHistoryGC(wait_for_shell=False, size=(1, "commands"), force=True)
+    gc.join()
+    assert not (data_dir / "deepsh-old.json").exists()
+    catalog = JsonHistoryCatalog()
+    assert catalog.get(old) is None
+    assert catalog.get(new)[2] == 1
+
+    # the files are not read again while they are unchanged
+    monkeypatch.setattr(xhj.xlj, "LazyJSON", None)
+    assert [f[1:3] for f in gc.files()] == [(1, new)]
+
+
+def test_all_items_reads_newest_files_first(data_dir, monkeypatch):
+    old = _session_file(data_dir, "old", ["ls", "pwd"], 1)
+    _session_file(data_dir, "new", [f"echo {i}" for i in range(600)], 100)
+    hist = JsonHistory(filename=str(data_dir / "deepsh-cur.json"), gc=False)
+    os.utime(old, (1, 1))
+
+    opened = []
+    iter_cmds = xhj._xhj_iter_cmds
+
+    def spy(filename, *args, **kwargs):
+        opened.append(filename)
+        return iter_cmds(filename, *args, **kwargs)
+
+    monkeypatch.setattr(xhj, "_xhj_iter_cmds", spy)
+    items = hist.all_items(newest_first=True)
+    assert [next(items)["inp"] for _ in range(2)] == ["echo 599", "echo 598"]
+    assert old not in opened
+    assert [item["inp"] for item in items][-3:] == ["echo 0", "pwd", "ls"]
+    assert [item["inp"] for item in hist.all_items()][:3] == ["ls", "pwd", "echo 0"]
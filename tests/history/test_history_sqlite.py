@@ -28,6 +28,7 @@ def hist(tmpdir):
         gc=False,
     )
     yield h
+    h.flush(at_exit=True)
 
 
 def _clean_up(h):
@@ -350,3 +351,105 @@ def test_hist_store_cwd(hist, xession):
     assert cmds[1]["cwd"] is None
 
     _clean_up(hist)
+
+
+@skipwin311
+def test_hist_writer_batches(hist, xession):
+    xession.env["HISTCONTROL"] = set()
+    for i in range(50):
+        hist.append({"inp": f"echo {i}", "rtn": 0, "ts": [i, i + 1]})
+    assert hist._writer.is_alive()
+    assert [item["inp"] for item in hist.all_items()] == [
+        f"echo {i}" for i in range(50)
+    ]
+    with _xh_sqlite_get_conn(hist.filename) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+@skipwin311
+def test_hist_flush_at_exit(hist, xession):
+    xession.env["HISTCONTROL"] = set()
+    hist.append({"inp": "ls", "rtn": 0, "ts": [1, 2]})
+    hist.flush(at_exit=True)
+    assert not hist._writer.is_alive()
+    # written synchronously once the writer is stopped
+    hist.append({"inp": "pwd", "rtn": 0, "ts": [3, 4]})
+    assert [item["inp"] for item in hist.all_items()] == ["ls", "pwd"]
+
+
+@skipwin311
+def test_hist_items_read_in_chunks(hist, xession):
+    from deepsh.history.sqlite import xh_sqlite_items
+
+    xession.env["HISTCONTROL"] = set()
+    for i in range(5):
+        hist.append({"inp": f"echo {i}", "rtn": 0, "ts": [i, i + 1]})
+    hist.flush()
+    items = xh_sqlite_items(filename=hist.filename, newest_first=True, chunk=2)
+    assert next(items)[0] == "echo 4"
+    assert [row[0] for row in items] == [f"echo {i}" for i in range(3, -1, -1)]
+
+
+@skipwin311
+def test_hist_search(hist, xession):
+    xession.env["HISTCONTROL"] = set()
+    for ts, cmd in enumerate(["git status", "ls -l", "git log -p", "Git"]):
+        hist.append({"inp": cmd, "rtn": 0, "ts": [ts, ts + 1]})
+    assert [i["inp"] for i in hist.search("git")] == ["git status", "git log -p"]
+    assert [i["inp"] for i in hist.search("git", newest_first=True, limit=1)] == [
+        "git log -p"
+    ]
+    # shorter than a trigram
+    assert [i["inp"] for i in hist.search("-l")] == ["ls -l"]
+    assert list(hist.search('"')) == []
+
+
+@skipwin311
+def test_hist_search_indexes_existing_history(tmpdir, xession):
+    from deepsh.history import sqlite as xh_sqlite
+
+    filename = str(tmpdir / "hist.sqlite")
+    xession.env["HISTCONTROL"] = set()
+    xession.env["DEEPSH_HISTORY_SQLITE_FTS"] = False
+    setattr(xh_sqlite.XH_SQLITE_CACHE, xh_sqlite.XH_SQLITE_CREATED_SQL_TBL, False)
+    xh_sqlite.xh_sqlite_append_history(
+        {"inp": "make install", "rtn": 0}, "1", False, filename=filename
+    )
+    with _xh_sqlite_get_conn(filename) as conn:
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    assert "deepsh_history_fts" not in names
+
+    xession.env["DEEPSH_HISTORY_SQLITE_FTS"] = True
+    hist = SqliteHistory(filename=filename, gc=False)
+    assert [i["inp"] for i in hist.search("install")] == ["make install"]
+    hist.flush(at_exit=True)
+
+
+@skipwin311
+def test_hist_search_cmd(hist, xession, capsys):
+    xession.history = hist
+    xession.env["HISTCONTROL"] = set()
+    for ts, cmd in enumerate(CMDS):
+        hist.append({"inp": cmd, "rtn": 0, "ts": (ts + 1, ts + 1.5)})
+    history_main(["search", "s"])
+    out, _ = capsys.readouterr()
+    assert out.splitlines() == [cmd for cmd in CMDS if "s" in cmd]
+
+
+@skipwin311
+@pytest.mark.parametrize("version", [(3, 34, 1), (3, 35, 0)])
+def test_erase_dups_counts_previous_runs(tmpdir, monkeypatch, version):
+    from deepsh.history import sqlite as xh_sqlite
+
+    if version >= (3, 35) > xh_sqlite.sqlite3.sqlite_version_info:
+        pytest.skip("DELETE ... RETURNING needs sqlite 3.35")
+    monkeypatch.setattr(xh_sqlite.sqlite3, "sqlite_version_info", version)
+    with _xh_sqlite_get_conn(str(tmpdir / "hist.sqlite")) as conn:
+        c = conn.cursor()
+        c.execute("CREATE TABLE deepsh_history (inp TEXT, frequency INTEGER)")
+        c.executemany(
+            "INSERT INTO deepsh_history (inp, frequency) VALUES (?, ?)",
+            [("ls", 2), ("make", 1), ("ls", None), ("ls", 1)],
+        )
+        assert xh_sqlite._xh_sqlite_erase_dups(c, "ls") == 3
+        assert c.execute("SELECT inp FROM deepsh_history").fetchall() == [("make",)]
@@ -0,0 +1,82 @@
+"""Tests the directory watchers."""
+
+import os
+import time
+
+import pytest
+
+from deepsh.lib.dirwatch import (
+    InotifyWatcher,
+    PollingWatcher,
+    _inotify_libc,
+    get_dir_watcher,
+    mount_fstype,
+    read_mounts,
+)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture(params=["default", "polling"])
+def watcher(request):
+    if request.param == "polling":
+        watcher = PollingWatcher(interval=0.05)
+        yield watcher
+        watcher.close()
+    else:
+        yield get_dir_watcher()
+
+
+def test_watch_counts_changes(watcher, tmp_path):
+    path = str(tmp_path)
+    assert watcher.watch(path) == 0
+    assert watcher.watch(path) == 0
+    time.sleep(0.01)  # mtime granularity of the polling watcher
+    (tmp_path / "new").touch()
+    assert wait_for(lambda: watcher.count(path) > 0)
+
+
+def test_watch_removed_dir(watcher, tmp_path):
+    path = tmp_path / "sub"
+    path.mkdir()
+    assert watcher.watch(str(path)) == 0
+    path.rmdir()
+    assert wait_for(lambda: watcher.count(str(path)) is None)
+
+
+def test_watch_missing_dir(watcher, tmp_path):
+    assert watcher.watch(str(tmp_path / "missing")) is None
+    assert watcher.count(str(tmp_path / "missing")) is None
+
+
+def test_read_mounts(tmp_path):
+    mounts = tmp_path / "mounts"
+    mounts.write_text(
+        "/dev/sda1 / ext4 rw 0 0\n"
+        "server:/home /home nfs4 rw 0 0\n"
+        "/dev/sdb1 /home/local\\040disk ext4 rw 0 0\n"
+    )
+    mounts = read_mounts(str(mounts))
+    assert mounts[0] == ("/home/local disk", "ext4")
+    assert mount_fstype("/home/user/bin", mounts) == "nfs4"
+    assert mount_fstype("/home/local disk/bin", mounts) == "ext4"
+    assert mount_fstype("/homer", mounts) == "ext4"
+    assert mount_fstype("/usr/bin", []) is None
+    assert read_mounts(str(tmp_path / "missing")) == []
+
+
+def test_inotify_skips_network_filesystems(tmp_path):
+    libc = _inotify_libc()
+    if libc is None:
+        pytest.skip("inotify is not available")
+    watcher = InotifyWatcher(libc)
+    watcher._mounts = [(os.path.realpath(tmp_path), "nfs")]
+    assert watcher.watch(str(tmp_path / ".")) is None
+    os.close(watcher.fd)
@@ -1,8 +1,16 @@
 """Tests lazy json functionality."""
 
+import json
 from io import StringIO
 
-from deepsh.lib.lazyjson import LazyJSON, LJNode, index, ljdump
+from deepsh.lib.lazyjson import (
+    LazyJSON,
+    LJNode,
+    index,
+    ljappend,
+    ljappend_dump,
+    ljdump,
+)
 
 
 def test_index_int():
@@ -171,3 +179,41 @@ def test_lazy_dict_dict_int():
     assert 42 == lj["wakka"]["jawaka"]
     assert 1 == len(lj)
     assert x == lj.load()
+
+
+def test_lazy_appendable_dump():
+    x = {"cmds": [{"inp": "ls"}], "wakka": {"jawaka": 42}}
+    f = StringIO()
+    ljappend_dump(x, f)
+    assert x == json.loads(f.getvalue())["data"]
+    f.seek(0)
+    lj = LazyJSON(f)
+    assert lj.appendable
+    assert 1 == len(lj["cmds"])
+    assert {"inp": "ls"} == lj["cmds"][0]
+    assert 42 == lj["wakka"]["jawaka"]
+    assert x == lj.load()
+
+
+def test_lazy_append(tmp_path):
+    fname = str(tmp_path / "lj.json")
+    with open(fname, "w") as f:
+        ljappend_dump({"cmds": [], "locked": True}, f)
+    ljappend(fname, [{"inp": "ls"}, {"inp": "pwd"}])
+    ljappend(fname, [{"inp": "cd"}], update={"locked": False})
+    with open(fname) as f:
+        assert ["ls", "pwd", "cd"] == [c["inp"] for c in json.load(f)["data"]["cmds"]]
+    with LazyJSON(fname) as lj:
+        assert 3 == len(lj["cmds"])
+        assert {"inp": "pwd"} == lj["cmds"][1]
+        assert lj["locked"] is False
+
+
+def test_lazy_append_converts_layout(tmp_path):
+    fname = str(tmp_path / "lj.json")
+    with open(fname, "w") as f:
+        ljdump({"cmds": [{"inp": "ls"}], "wakka": 42}, f)
+    ljappend(fname, [{"inp": "pwd"}])
+    with LazyJSON(fname) as lj:
+        assert lj.appendable
+        assert {"cmds": [{"inp": "ls"}, {"inp": "pwd"}], "wakka": 42} == lj.load()
@@ -0,0 +1,63 @@
+"""Tests the binary parser tables."""
+
+import marshal
+
+from deepsh.parsers.base import binary_table_path, load_binary_table
+from deepsh.parsers.completion_context import CompletionContextParser
+
+
+def _table_path(outputdir):
+    kwargs = {"tabmodule": "deepsh.completion_parser_table", "outputdir": outputdir}
+    return binary_table_path(kwargs)
+
+
+def test_binary_table_written_and_loaded(tmp_path):
+    first = CompletionContextParser(outputdir=str(tmp_path))
+    path = _table_path(str(tmp_path))
+    tabmodule = load_binary_table(path)
+    assert tabmodule is not None
+    assert tabmodule._lr_action == first.parser.action
+
+    second = CompletionContextParser(outputdir=str(tmp_path))
+    assert second.parser.action == first.parser.action
+    assert second.parse("ls -l", 5) == first.parse("ls -l", 5)
+
+
+def test_binary_table_regenerated_when_stale(tmp_path):
+    CompletionContextParser(outputdir=str(tmp_path))
+    path = _table_path(str(tmp_path))
+    with open(path, "rb") as f:
+        tables = marshal.load(f)
+    signature = tables["_lr_signature"]
+    tables["_lr_signature"] = "stale"
+    tables["_lr_action"] = {}
+    with open(path, "wb") as f:
+        marshal.dump(tables, f)
+
+    parser = CompletionContextParser(yacc_optimize=False, outputdir=str(tmp_path))
+    assert parser.parser.action
+    assert load_binary_table(path)._lr_signature == signature
+
+
+def test_stale_binary_table_not_used_when_optimized(tmp_path):
+    first = CompletionContextParser(yacc_optimize=False, outputdir=str(tmp_path))
+    path = _table_path(str(tmp_path))
+    with open(path, "rb") as f:
+        tables = marshal.load(f)
+    tables["_lr_signature"] = "stale"
+    tables["_lr_action"] = {}
+    with open(path, "wb") as f:
+        marshal.dump(tables, f)
+
+    parser = CompletionContextParser(outputdir=str(tmp_path))
+    assert parser.parser.action == first.parser.action
+    assert load_binary_table(path)._lr_signature != "stale"
+
+
+def test_load_binary_table_invalid(tmp_path):
+    path = tmp_path / "parser_table.marshal"
+    assert load_binary_table(str(path)) is None
+    path.write_bytes(b"not a table")
+    assert load_binary_table(str(path)) is None
+    path.write_bytes(marshal.dumps({"_lr_action": {}}))
+    assert load_binary_table(str(path)) is None
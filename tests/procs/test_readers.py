@@ -0,0 +1,97 @@
+"""Tests for the process output readers."""
+
+import os
+import threading
+import time
+
+import pytest
+
+from deepsh.procs.readers import NonBlockingFDReader, OutputSignal
+from deepsh.pytest.tools import skip_if_on_windows
+
+
+def test_output_signal_wait_times_out():
+    signal = OutputSignal()
+    assert signal.wait(signal.count, timeout=0.01) == 0
+
+
+def test_output_signal_wait_returns_new_count():
+    signal = OutputSignal()
+    signal.set()
+    assert signal.wait(0, timeout=0.01) == 1
+
+
+@skip_if_on_windows
+def test_fd_reader_sets_signal():
+    signal = OutputSignal()
+    r, w = os.pipe()
+    reader = NonBlockingFDReader(r, timeout=0, signal=signal)
+    assert signal.wait(0, timeout=0.01) == 0
+    count = 0
+    os.write(w, b"hello")
+    count = signal.wait(count, timeout=5)
+    assert count > 0
+    os.close(w)
+    while not reader.closed:
+        count = signal.wait(count, timeout=5)
+    assert reader.read() == b"hello"
+    os.close(r)
+
+
+@skip_if_on_windows
+def test_fd_readers_share_reactor_thread():
+    threads = threading.active_count()
+    pipes = [os.pipe() for _ in range(5)]
+    readers = [NonBlockingFDReader(r, timeout=5) for r, _ in pipes]
+    assert all(reader.thread is None for reader in readers)
+    assert threading.active_count() <= threads + 1
+    for i, (r, w) in enumerate(pipes):
+        os.write(w, b"line %d\n" % i)
+        os.close(w)
+        os.close(r)
+    for i, reader in enumerate(readers):
+        assert reader.readlines() == [b"line %d\n" % i]
+        assert reader.is_fully_read()
+
+
+def test_fd_reader_regular_file(tmp_path):
+    f = tmp_path / "data.txt"
+    f.write_bytes(b"hello\nworld\n")
+    with open(f, "rb") as fobj:
+        reader = NonBlockingFDReader(fobj.fileno(), timeout=5)
+        assert reader.read() == b"hello\nworld\n"
+    # the reactor cannot poll a file, so it is read on a thread
+    assert reader.reactor is None
+    reader.thread.join(5)
+    assert not reader.thread.is_alive()
+
+
+@skip_if_on_windows
+def test_fd_reader_close_breaks_pipe():
+    r, w = os.pipe()
+    reader = NonBlockingFDReader(r, timeout=5)
+    os.close(r)
+    reader.close()
+    with pytest.raises(BrokenPipeError):
+        for _ in range(500):
+            os.write(w, b"x")  # until the reactor closed its copy
+            time.sleep(0.01)
+    os.close(w)
+
+
+@skip_if_on_windows
+def test_fd_reader_pauses_when_full():
+    r, w = os.pipe()
+    reader = NonBlockingFDReader(r, timeout=5, max_queued=1)
+    os.write(w, b"first")
+    while not reader.paused:
+        time.sleep(0.01)
+    os.write(w, b"second")
+    time.sleep(0.05)
+    assert reader.queue.qsize() == 1
+    assert reader.read_queue() == b"first"
+    assert reader.read_queue() == b"second"
+    os.close(w)
+    os.close(r)
+    assert reader.read_queue() == b""
+    assert reader.is_fully_read()
@@ -1,10 +1,19 @@
+import collections
 import functools
+import time
 from unittest.mock import Mock
 
 import pytest
 
+from deepsh import style_tools
+from deepsh.prompt import base as prompt_base
 from deepsh.prompt import env as prompt_env
-from deepsh.prompt.base import PromptField, PromptFields, PromptFormatter
+from deepsh.prompt.base import (
+    PromptField,
+    PromptFields,
+    PromptFormatter,
+    compile_template,
+)
 
 
 @pytest.fixture
@@ -275,3 +284,90 @@ def test_promptformatter_clears_cache(formatter):
     formatter(template, fields)
 
     assert spam.call_count == 2
+
+
+def test_prompt_fields_cache_on(xession, monkeypatch):
+    fields = PromptFields(xession, init=False)
+    spam = Mock(return_value="spam")
+    fields["spam"] = spam
+    fields.cache_on("spam", "$SPAM", "cmd")
+    xession.env["SPAM"] = "a"
+
+    for _ in range(2):
+        fields.reset()
+        assert fields.pick("spam") == "spam"
+    assert spam.call_count == 1
+    assert not fields.needs_calling("spam")
+
+    xession.env["SPAM"] = "b"
+    fields.reset()
+    assert fields.needs_calling("spam")
+    fields.pick("spam")
+    assert spam.call_count == 2
+
+    monkeypatch.setattr(prompt_base, "_COMMANDS_RUN", prompt_base._COMMANDS_RUN + 1)
+    fields.reset()
+    fields.pick("spam")
+    assert spam.call_count == 3
+
+    fields.reset_key("spam")
+    fields.pick("spam")
+    assert spam.call_count == 4
+
+
+def test_prompt_field_cache_ttl(xession):
+    fields = PromptFields(xession, init=False)
+    field = PromptField(updator=Mock(), cache_ttl=0.2)
+    fields["spam"] = field
+    fields.pick("spam")
+    fields.reset()
+    fields.pick("spam")
+    assert field.updator.call_count == 1
+    time.sleep(0.2)
+    fields.reset()
+    fields.pick("spam")
+    assert field.updator.call_count == 2
+
+
+def test_prompt_fields_cache_cleared_on_change(xession):
+    fields = PromptFields(xession, init=False)
+    spam = Mock(return_value="spam")
+    fields["spam"] = spam
+    fields.cache_on("spam", "cwd")
+    fields.pick("spam")
+    fields["eggs"] = "eggs"  # spam may use the other fields
+    fields.reset()
+    fields.pick("spam")
+    assert spam.call_count == 2
+
+
+def test_promptformatter_timings(formatter, xession, capsys):
+    formatter("{spam} {eggs}", {"spam": lambda: "spam", "eggs": "eggs"})
+    assert set(formatter.timings) == {"spam", "eggs"}
+    formatter._print_timings(0.5)
+    assert capsys.readouterr().err.startswith("prompt: formatted in 500.00 ms: ")
+
+
+def test_template_compiled_once(formatter, xession):
+    compile_template.cache_clear()
+    fields = {"a_string": "cat"}
+    for _ in range(2):
+        assert formatter("{RED}my {a_string}", fields) == "{RED}my cat"
+    info = compile_template.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+
+
+def test_partial_color_tokenize_styles(xession, monkeypatch):
+    styles = collections.defaultdict(str)
+    shell = Mock()
+    shell.shell.styler.styles = styles
+    monkeypatch.setattr(xession, "shell", shell)
+    monkeypatch.setattr(style_tools, "HAS_PYGMENTS", True)
+    template = "{RED}my {GREEN}cat{RESET}"
+    style_tools.compile_color_template.cache_clear()
+    for _ in range(2):
+        styles.clear()
+        toks = style_tools.partial_color_tokenize(template)
+        Color = style_tools.Color
+        assert toks == [(Color.RED, "my "), (Color.GREEN, "cat"), (Color.RESET, "")]
+        assert set(styles) == {Color.RED, Color.GREEN, Color.RESET}
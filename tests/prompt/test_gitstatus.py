@@ -2,7 +2,7 @@ import os
 
 import pytest
 
-from deepsh.prompt import gitstatus
+from deepsh.prompt import base, gitstatus
 from deepsh.prompt.base import _format_value
 
 
@@ -11,6 +11,12 @@ def git_no_stash(mocker):
     return mocker.patch.object(gitstatus, "get_stash_count", return_value=0)
 
 
+@pytest.fixture(autouse=True)
+def git_version(monkeypatch):
+    monkeypatch.setattr(gitstatus, "_GIT_VERSION", (2, 39))
+    monkeypatch.setattr(gitstatus.porcelain, "_stamp", None)
+
+
 @pytest.fixture
 def prompts(xession):
     fields = xession.env["PROMPT_FIELDS"]
@@ -45,11 +51,14 @@ def fake_proc(fake_process):
 def test_gitstatus_dirty(prompts, fake_proc, hidden, exp, xession):
     prompts["gitstatus"].hidden = hidden
     dirty = {
-        "git status --porcelain --branch": b"""\
-## gitstatus-opt...origin/gitstatus-opt [ahead 7, behind 2]
- M requirements/tests.txt
-AM tests/prompt/test_gitstatus.py
- M tests/prompt/test_vc.py""",
+        "git status --porcelain=v2 --branch --show-stash": b"""\
+# branch.oid 2b7ee1d3f3b0d7e4a1c0a3e1b2c4d5e6f7a8b9c0
+# branch.head gitstatus-opt
+# branch.upstream origin/gitstatus-opt
+# branch.ab +7 -2
+1 .M N... 100644 100644 100644 3e1b2c4 3e1b2c4 requirements/tests.txt
+1 AM N... 000000 100644 100644 0000000 d5e6f7a tests/prompt/test_gitstatus.py
+1 .M N... 100644 100644 100644 a8b9c0d a8b9c0d tests/prompt/test_vc.py""",
         "git rev-parse --git-dir": b".git",
         "git diff --numstat": b"""\
 1       0       requirements/tests.txt
@@ -64,7 +73,11 @@ AM tests/prompt/test_gitstatus.py
 
 def test_gitstatus_clean(prompts, fake_proc):
     clean = {
-        "git status --porcelain --branch": b"## gitstatus-opt...origin/gitstatus-opt [ahead 7, behind 2]",
+        "git status --porcelain=v2 --branch --show-stash": b"""\
+# branch.oid 2b7ee1d3f3b0d7e4a1c0a3e1b2c4d5e6f7a8b9c0
+# branch.head gitstatus-opt
+# branch.upstream origin/gitstatus-opt
+# branch.ab +7 -2""",
         "git rev-parse --git-dir": b".git",
         "git diff --numstat": b"",
     }
@@ -76,6 +89,91 @@ def test_gitstatus_clean(prompts, fake_proc):
     assert _format_value(prompts.pick("gitstatus"), "{}", None) == exp
 
 
+def test_gitstatus_old_git(prompts, fake_proc, monkeypatch):
+    monkeypatch.setattr(gitstatus, "_GIT_VERSION", (2, 30))
+    fake_proc(
+        {
+            "git status --porcelain --branch": b"""\
+## main...origin/main [behind 1]
+UU conflicted.txt
+?? new.txt""",
+            "git rev-parse --git-dir": b".git",
+        }
+    )
+    exp = "{CYAN}main↓·1{RESET}|{RED}×1{RESET}…1"
+    assert format(prompts.pick("gitstatus")) == exp
+
+
+def test_porcelain_v2(prompts, fake_proc, git_no_stash):
+    fake_proc(
+        {
+            "git status --porcelain=v2 --branch --show-stash": b"""\
+# branch.oid (initial)
+# branch.head main
+# stash 3
+1 M. N... 100644 100644 100644 3e1b2c4 d5e6f7a staged.txt
+1 MD N... 100644 100644 000000 3e1b2c4 d5e6f7a deleted.txt
+2 R. N... 100644 100644 100644 3e1b2c4 3e1b2c4 R100 new.txt	old.txt
+u UU N... 100644 100644 100644 100644 3e1b2c4 d5e6f7a a8b9c0d both.txt
+? untracked.txt
+! ignored.txt""",
+            "git rev-parse --git-dir": b".git",
+        }
+    )
+    assert prompts.pick_val("gitstatus.porcelain") == {
+        "branch": "main",
+        "ahead": 0,
+        "behind": 0,
+        "untracked": 1,
+        "changed": 0,
+        "deleted": 1,
+        "conflicts": 1,
+        "staged": 3,
+        "stash": 3,
+    }
+    git_no_stash.assert_not_called()
+
+
+def test_porcelain_v2_detached(prompts, fake_proc):
+    proc = fake_proc(
+        {
+            "git status --porcelain=v2 --branch --show-stash": b"""\
+# branch.oid 2b7ee1d3f3b0d7e4a1c0a3e1b2c4d5e6f7a8b9c0
+# branch.head (detached)""",
+            "git rev-parse --git-dir": b".git",
+        }
+    )
+    assert prompts.pick_val("gitstatus.porcelain")["branch"] == "2b7ee1d"
+    assert proc.call_count(["git", "describe", "--always"]) == 0
+
+
+def test_porcelain_cached(prompts, fake_proc, tmp_path, monkeypatch):
+    gitdir = tmp_path / ".git"
+    (gitdir / "refs" / "heads").mkdir(parents=True)
+    (gitdir / "HEAD").write_text("ref: refs/heads/main\n")
+    monkeypatch.chdir(tmp_path)
+    status = "git status --porcelain=v2 --branch --show-stash"
+    proc = fake_proc(
+        {"git rev-parse --git-dir": b".git", status: b"# branch.head main"}
+    )
+    proc.keep_last_process(True)
+    assert prompts.pick_val("gitstatus.porcelain")["branch"] == "main"
+
+    prompts.reset()
+    assert prompts.pick_val("gitstatus.porcelain")["branch"] == "main"
+    assert proc.call_count(status.split()) == 1  # nothing changed
+
+    (gitdir / "index").write_bytes(b"")
+    prompts.reset()
+    prompts.pick_val("gitstatus.porcelain")
+    assert proc.call_count(status.split()) == 2
+
+    base._count_command()
+    prompts.reset()
+    prompts.pick_val("gitstatus.porcelain")
+    assert proc.call_count(status.split()) == 3
+
+
 def test_no_git(prompts, fake_process, tmp_path):
     os.chdir(tmp_path)
     err = b"fatal: not a git repository (or any of the parent directories): .git"
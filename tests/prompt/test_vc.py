@@ -1,4 +1,5 @@
 import os
+import sqlite3
 import subprocess as sp
 import textwrap
 from pathlib import Path
@@ -23,6 +24,12 @@ VC_INIT: dict[str, list[list[str]]] = {
 }
 
 
+@pytest.fixture(autouse=True)
+def clear_vc_caches(monkeypatch):
+    monkeypatch.setattr(vc, "_VC_ROOTS", {})
+    monkeypatch.setattr(vc, "_GIT_DIRTY", {})
+
+
 @pytest.fixture(params=VC_BRANCH.keys())
 def repo(request, tmpdir_factory):
     """Return a dict with vc and a temporary dir
@@ -148,3 +155,76 @@ def test_git_dirty_working_directory_includes_untracked(
         )
 
     assert vc.git_dirty_working_directory() == include_untracked
+
+
+def test_find_vc_root(tmp_path, monkeypatch):
+    sub = tmp_path / "a" / "b"
+    sub.mkdir(parents=True)
+    assert vc.find_vc_root(sub, ".hg") is None
+    (tmp_path / "a" / ".hg").mkdir()
+    # cached until the next command is run
+    assert vc.find_vc_root(sub, ".hg") is None
+    run = vc.commands_run() + 1
+    monkeypatch.setattr(vc, "commands_run", lambda: run)
+    assert vc.find_vc_root(sub, ".hg") == (str(tmp_path / "a"), ".hg")
+
+
+def test_hg_branch_from_files(tmp_path, set_xenv):
+    set_xenv(str(tmp_path / "sub"))
+    (tmp_path / "sub").mkdir()
+    dot_hg = tmp_path / ".hg"
+    dot_hg.mkdir()
+    assert vc.get_hg_branch() == "default"
+    (dot_hg / "branch").write_text("stable\n")
+    (dot_hg / "bookmarks.current").write_text("feature")
+    assert vc.get_hg_branch() == "stable, feature"
+
+
+def _fossil_checkout(path, branch):
+    with sqlite3.connect(path / "test.fossil") as db:
+        db.execute("CREATE TABLE tag(tagid INTEGER PRIMARY KEY, tagname TEXT)")
+        db.execute(
+            "CREATE TABLE tagxref(tagid INTEGER, tagtype INTEGER, value TEXT, "
+            "rid INTEGER)"
+        )
+        db.execute("INSERT INTO tag VALUES (8, 'branch'), (9, 'sym-trunk')")
+        db.execute("INSERT INTO tagxref VALUES (9, 2, NULL, 1)")
+        db.execute("INSERT INTO tagxref VALUES (8, 2, ?, 1)", (branch,))
+    with sqlite3.connect(path / ".fslckout") as db:
+        db.execute("CREATE TABLE vvar(name TEXT PRIMARY KEY, value CLOB)")
+        db.execute(
+            "INSERT INTO vvar VALUES ('checkout', 1), ('repository', ?)",
+            (str(path / "test.fossil"),),
+        )
+
+
+def test_fossil_branch_from_checkout_db(tmp_path, set_xenv, fake_process):
+    _fossil_checkout(tmp_path, "trunk")
+    set_xenv(str(tmp_path))
+    assert vc.get_fossil_branch() == "trunk"
+    assert not fake_process.calls
+
+
+def test_fossil_branch_falls_back_to_command(tmp_path, set_xenv, fake_process):
+    (tmp_path / ".fslckout").write_bytes(b"not a database")
+    fake_process.register_subprocess(
+        command="fossil branch current".split(), stdout=b"trunk\n"
+    )
+    set_xenv(str(tmp_path))
+    assert vc.get_fossil_branch() == "trunk"
+
+
+def test_git_dirty_working_directory_cached(tmp_path, set_xenv, fake_process):
+    gitdir = tmp_path / ".git"
+    gitdir.mkdir()
+    (gitdir / "index").write_bytes(b"")
+    set_xenv(str(tmp_path)).env["VC_GIT_INCLUDE_UNTRACKED"] = True
+    cmd = "git status --porcelain --untracked-files=normal".split()
+    fake_process.register_subprocess(command=cmd, stdout=b" M file")
+    assert vc.git_dirty_working_directory()
+    assert vc.git_dirty_working_directory()
+    assert fake_process.call_count(cmd) == 1
+
+    (gitdir / "index").write_bytes(b"changed")
+    fake_process.register_subprocess(command=cmd, stdout=b"")
+    assert not vc.git_dirty_working_directory()
@@ -20,3 +20,125 @@ def test_obj(history_obj):
     assert ["line10"] == history_obj.get_strings()
     assert len(history_obj) == 1
     assert ["line10"] == [x for x in history_obj]
+
+
+def test_cust_history_matches(xession):
+    from types import SimpleNamespace
+
+    from deepsh.history.dummy import DummyHistory
+    from deepsh.shells.ptk_shell.history import (
+        PromptToolkitHistory,
+        _cust_history_matches,
+    )
+
+    class IndexedHistory(DummyHistory):
+        def search(self, query, newest_first=False, limit=None):
+            searched.append(query)
+            return [{"inp": "git status"}]
+
+    searched = []
+    xession.history = IndexedHistory()
+    history = PromptToolkitHistory(load_prev=False)
+    for line in ["git status", "ls", "git log"]:
+        history.append_string(line)
+    buffer = SimpleNamespace(
+        history=history,
+        history_search_text="git",
+        _working_lines=[*history.get_strings(), "git"],
+    )
+    assert [_cust_history_matches(buffer, i) for i in range(4)] == [
+        True,
+        False,
+        False,  # not found by the search of the history
+        True,  # the current line
+    ]
+    assert searched == ["git"]
+
+
+@pytest.mark.parametrize(
+    "text, found",
+    [
+        ("gi", [{"inp": "git status"}]),  # too short for the index
+        ("git", [{"inp": "git status"}] * 3),  # too many matches
+    ],
+)
+def test_cust_history_matches_scans_lines(xession, monkeypatch, text, found):
+    from types import SimpleNamespace
+
+    from deepsh.history.dummy import DummyHistory
+    from deepsh.shells.ptk_shell import history as ptk_history
+
+    class IndexedHistory(DummyHistory):
+        def search(self, query, newest_first=False, limit=None):
+            searched.append(limit)
+            return found[:limit]
+
+    searched = []
+    monkeypatch.setattr(ptk_history, "MAX_INDEXED_MATCHES", 2)
+    xession.history = IndexedHistory()
+    buffer = SimpleNamespace(
+        history_search_text=text,
+        _working_lines=["git status", "ls", "git log", text],
+    )
+    matches = [ptk_history._cust_history_matches(buffer, i) for i in range(4)]
+    assert matches == [True, False, True, True]
+    assert searched == ([] if len(text) < 3 else [3])
+
+
+def test_load_history_strings_dedupes(xession):
+    from deepsh.history.dummy import DummyHistory
+    from deepsh.shells.ptk_shell.history import PromptToolkitHistory
+
+    class ListHistory(DummyHistory):
+        def all_items(self, newest_first=False, **kwargs):
+            for inp in ["ls", "git status", "ls ", "make", "git status"]:
+                yield {"inp": inp}
+
+    xession.history = ListHistory()
+    history = PromptToolkitHistory()
+    assert list(history.load_history_strings()) == ["ls", "git status", "make"]
+
+
+def test_paged_threaded_history():
+    import asyncio
+    import threading
+
+    import prompt_toolkit.history
+
+    from deepsh.shells.ptk_shell.history import PagedThreadedHistory
+
+    first_page_read = threading.Event()
+
+    class SlowHistory(prompt_toolkit.history.History):
+        def load_history_strings(self):
+            for i in range(5):
+                yield f"echo {i}"
+            # the rest only loads once the first page was used
+            assert first_page_read.wait(timeout=10)
+            for i in range(5, 12):
+                yield f"echo {i}"
+
+        def store_string(self, string):
+            pass
+
+    history = PagedThreadedHistory(SlowHistory())
+    history.page_size = 5
+    pages = []
+    add_page = history._add_page
+
+    def record_page(page):
+        pages.append(len(page))
+        add_page(page)
+
+    history._add_page = record_page
+
+    async def load():
+        loaded = []
+        async for item in history.load():
+            loaded.append(item)
+            if len(loaded) == 5:
+                first_page_read.set()
+        return loaded
+
+    assert asyncio.run(load()) == [f"echo {i}" for i in range(12)]
+    assert pages == [5, 5, 2]
@@ -0,0 +1,111 @@
+"""Tests the asynchronous prompt updates."""
+
+import concurrent.futures
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from deepsh.prompt.base import ParsedTokens, _ParsedToken
+from deepsh.shells.ptk_shell.updator import TIMED_OUT, AsyncPrompt, Executor
+
+
+@pytest.fixture
+def executor(deepsh_session):
+    executor = Executor()
+    yield executor
+    executor.thread_pool.shutdown(wait=True)
+
+
+def test_executor_runs_field_once_per_generation(executor):
+    calls = []
+
+    def func():
+        calls.append(1)
+        return "main"
+
+    fut1, intermediate, placeholder = executor.submit(func, "curr_branch")
+    fut2, _, _ = executor.submit(func, "curr_branch")
+    assert fut1 is fut2
+    assert (intermediate, placeholder) == ("{curr_branch}", "{curr_branch}")
+    assert fut1.result() == "main"
+    assert calls == [1]
+
+    executor.new_generation()
+    fut3, intermediate, _ = executor.submit(func, "curr_branch")
+    assert fut3 is not fut1
+    assert fut3.result() == "main"
+    assert calls == [1, 1]
+    assert "main" in intermediate  # the previous result, faded
+
+
+def test_executor_skips_outdated_generations(executor):
+    calls = []
+    executor.new_generation()
+    with pytest.raises(concurrent.futures.CancelledError):
+        executor._run_func(lambda: calls.append(1), "user", generation=0)
+    assert calls == []
+
+
+def test_executor_keeps_newest_result(executor):
+    executor.generation = 2
+    executor._run_func(lambda: "new", "user", generation=2)
+    executor.generation = 1
+    executor._run_func(lambda: "old", "user", generation=1)
+    assert "new" in executor.thread_results["user"]
+
+
+def test_stop_keeps_futures_shared_with_other_prompts(executor):
+    release = threading.Event()
+    left = AsyncPrompt("message", MagicMock(), executor)
+    right = AsyncPrompt("rprompt", MagicMock(), executor)
+    left.submit_section(lambda: release.wait(5) and "main", "curr_branch", 0)
+    right.submit_section(lambda: release.wait(5) and "main", "curr_branch", 0)
+    (future,) = right.futures
+    left.stop()
+    release.set()
+    assert future.result() == "main"
+
+
+def test_start_update_times_out(executor, deepsh_session, monkeypatch):
+    monkeypatch.setitem(deepsh_session.env, "ASYNC_PROMPT_FIELD_TIMEOUT", 0.05)
+    release = threading.Event()
+    prompt = AsyncPrompt("message", MagicMock(), executor)
+    prompt.invalidate = lambda: None
+    tokens = [
+        _ParsedToken("{slow}", "slow"),
+        _ParsedToken(" ", None),
+        _ParsedToken("{fast}", "fast"),
+    ]
+    prompt.tokens = ParsedTokens(tokens, "{slow} {fast}")
+    prompt.submit_section(lambda: release.wait(5) and "done", "slow", 0)
+    prompt.submit_section(lambda: "fast", "fast", 2)
+    completed = []
+    prompt.start_update(completed.append)
+    release.set()
+    assert completed == ["message"]
+    assert prompt.tokens.process() == TIMED_OUT + " fast"
+
+
+def test_start_update_times_fields_from_their_start(
+    executor, deepsh_session, monkeypatch
+):
+    monkeypatch.setitem(deepsh_session.env, "ASYNC_PROMPT_FIELD_TIMEOUT", 0.2)
+    executor.thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    prompt = AsyncPrompt("message", MagicMock(), executor)
+    prompt.invalidate = lambda: None
+    tokens = [
+        _ParsedToken("{slow}", "slow"),
+        _ParsedToken(" ", None),
+        _ParsedToken("{queued}", "queued"),
+    ]
+    prompt.tokens = ParsedTokens(tokens, "{slow} {queued}")
+    prompt.submit_section(lambda: time.sleep(0.3) or "done", "slow", 0)
+    # waits for the only thread, longer than the timeout, before it starts
+    prompt.submit_section(lambda: "queued", "queued", 2)
+    completed = []
+    prompt.start_update(completed.append)
+    executor.thread_pool.shutdown(wait=True)
+    assert completed == ["message"]
+    assert prompt.tokens.process() == TIMED_OUT + " queued"
@@ -220,6 +220,41 @@ def test_exec_alias_return_value(exp_rtn, deepsh_session, monkeypatch):
     assert rtn == exp_rtn
 
 
+def test_exec_alias_compiles_once(deepsh_session, monkeypatch):
+    monkeypatch.setitem(deepsh_session.env, "RAISE_SUBPROC_ERROR", False)
+    compiled = []
+    compile = deepsh_session.execer.compile
+
+    def counting_compile(*args, **kwargs):
+        compiled.append(args)
+        return compile(*args, **kwargs)
+
+    monkeypatch.setattr(deepsh_session.execer, "compile", counting_compile)
+    alias = ExecAlias("myargs = $args")
+    stack = inspect.stack()
+    for i in range(3):
+        alias([str(i)], stack=stack)
+        assert stack[0][0].f_locals["myargs"] == [str(i)]
+    assert len(compiled) == 1
+
+    alias.src = "myargs = $args + ['x']"
+    alias(["3"], stack=stack)
+    assert stack[0][0].f_locals["myargs"] == ["3", "x"]
+    assert len(compiled) == 2
+
+
+def test_exec_alias_follows_call_site(deepsh_session):
+    alias = ExecAlias("ls -l")
+    execer = deepsh_session.execer
+    cmd = alias._compile(execer, {}, {})
+    assert alias._compile(execer, {"x": 1}, {}) is cmd
+    # ls is a Python name at this call site, so the alias is a subtraction
+    pycode = alias._compile(execer, {"ls": 1}, {"l": 1})
+    assert pycode is not cmd
+    assert alias._compile(execer, {}, {}) is cmd
+    assert alias._compile(execer, {"ls": 2}, {"l": 2}) is pycode
+
+
 def test_register_decorator(xession):
     aliases = Aliases()
 
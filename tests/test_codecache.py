@@ -0,0 +1,90 @@
+"""Tests the code cache."""
+
+import marshal
+
+import pytest
+
+from deepsh import codecache
+from deepsh.codecache import CodeStore, run_script_with_cache
+
+
+@pytest.fixture
+def store(deepsh_session, monkeypatch, tmp_path):
+    monkeypatch.setitem(deepsh_session.env, "DEEPSH_CODE_CACHE_SIZE", 10_000)
+    store = CodeStore(str(tmp_path / "code-cache.sqlite"))
+    yield store
+    store.close()
+
+
+def test_code_store_roundtrip(store):
+    key = store.key("x = 1\n", "<test>", "exec")
+    assert store.get(key) is None
+    code = compile("x = 1\n", "<test>", "exec")
+    store.put(key, code)
+    assert store.get(key) == code
+    assert len(store) == 1
+
+
+def test_code_store_key():
+    key = CodeStore.key("x = 1\n", "a.xsh", "exec")
+    assert key == CodeStore.key(b"x = 1\n", "a.xsh", "exec")
+    assert key != CodeStore.key("x = 2\n", "a.xsh", "exec")
+    assert key != CodeStore.key("x = 1\n", "b.xsh", "exec")
+    assert key != CodeStore.key("x = 1\n", "a.xsh", "single")
+
+
+def test_code_store_evicts_least_recently_used(store, deepsh_session):
+    store.ATIME_RESOLUTION = 0.0
+    codes = {}
+    for i in range(3):
+        src = f"x = {'1' * 100 * (i + 1)}\n"
+        codes[i] = (store.key(src, "<test>", "exec"), compile(src, "<test>", "exec"))
+        store.put(*codes[i])
+    store.get(codes[0][0])  # 0 is now more recently used than 1
+    deepsh_session.env["DEEPSH_CODE_CACHE_SIZE"] = len(marshal.dumps(codes[0][1])) * 2
+    src = "y = 1\n"
+    store.put(store.key(src, "<test>", "exec"), compile(src, "<test>", "exec"))
+    assert store.get(codes[1][0]) is None
+    assert store.get(codes[2][0]) is None
+    assert store.get(codes[0][0]) == codes[0][1]
+    assert len(store) == 2
+
+
+def test_code_store_disabled(store, deepsh_session):
+    deepsh_session.env["DEEPSH_CODE_CACHE_SIZE"] = 0
+    key = store.key("x = 1\n", "<test>", "exec")
+    store.put(key, compile("x = 1\n", "<test>", "exec"))
+    assert store.get(key) is None
+
+
+def test_code_store_atime_updated_once_in_a_while(store, monkeypatch):
+    key = store.key("x = 1\n", "<test>", "exec")
+    store.put(key, compile("x = 1\n", "<test>", "exec"))
+    conn = store._connect()
+    conn.execute("UPDATE code SET atime = 1.0")
+    conn.commit()
+    assert store.get(key) is not None
+    (atime,) = conn.execute("SELECT atime FROM code").fetchone()
+    assert atime > 1.0
+    monkeypatch.setattr(codecache.time, "time", lambda: atime + 1.0)
+    assert store.get(key) is not None
+    assert conn.execute("SELECT atime FROM code").fetchone()[0] == atime
+
+
+def test_run_script_with_cache(
+    store, deepsh_session, deepsh_execer, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(codecache, "CODE_STORE", store)
+    monkeypatch.setitem(deepsh_session.env, "DEEPSH_CACHE_SCRIPTS", True)
+    monkeypatch.setattr(deepsh_execer, "scriptcache", True, raising=False)
+    script = tmp_path / "script.xsh"
+    script.write_text("x = 1\n")
+    glb = {}
+    assert run_script_with_cache(str(script), deepsh_execer, glb) == (None,) * 3
+    assert glb["x"] == 1
+    assert len(store) == 1
+
+    script.write_text("x = 2\n")
+    run_script_with_cache(str(script), deepsh_execer, glb)
+    assert glb["x"] == 2
+    assert len(store) == 2
@@ -1,15 +1,20 @@
 import os
 import pickle
 import stat
+import threading
 import time
 from tempfile import TemporaryDirectory
 
 import pytest
 
+from deepsh import commands_cache
 from deepsh.commands_cache import (
     SHELL_PREDICTOR_PARSER,
     CaseInsensitiveDict,
+    CommandNames,
     CommandsCache,
+    CommandsIndex,
+    ThreadablePredictions,
     _Commands,
     executables_in,
     predict_false,
@@ -381,3 +386,286 @@ def test_caseinsdict_copy():
     actual = initial.copy()
     assert actual == initial
     assert id(actual) != id(initial)
+
+
+@skip_if_on_windows
+def test_update_cache_watched_paths(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    path = os.path.realpath(bindir)
+    cache = CommandsCache({"PATH": [str(bindir)], "COMMANDS_CACHE_WATCH_PATHS": True})
+    assert "mycmd" not in cache
+
+    stats = []
+    getmtime = os.path.getmtime
+    monkeypatch.setattr("os.path.getmtime", lambda p: stats.append(p) or getmtime(p))
+    assert "mycmd" not in cache
+    assert stats == []  # unchanged paths are not checked again
+
+    exe = bindir / "mycmd"
+    exe.touch()
+    exe.chmod(0o755)
+    deadline = time.monotonic() + 5
+    while "mycmd" not in cache and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "mycmd" in cache
+    assert stats[-1] == path
+    assert path in cache._paths_counts
+
+
+@skip_if_on_windows
+def test_update_cache_watched_paths_chmod(tmp_path):
+    from deepsh.lib.dirwatch import InotifyWatcher, get_dir_watcher
+
+    if not isinstance(get_dir_watcher(), InotifyWatcher):
+        pytest.skip("inotify is not available")
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    exe = bindir / "mycmd"
+    exe.touch()
+    cache = CommandsCache({"PATH": [str(bindir)], "COMMANDS_CACHE_WATCH_PATHS": True})
+    assert "mycmd" not in cache
+    mtime = os.stat(bindir).st_mtime_ns
+    exe.chmod(0o755)  # the mtime of the directory stays the same
+    assert os.stat(bindir).st_mtime_ns == mtime
+    deadline = time.monotonic() + 5
+    while "mycmd" not in cache and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "mycmd" in cache
+
+
+@skip_if_on_windows
+def test_update_cache_path_removed(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    exe = bindir / "mycmd"
+    exe.touch()
+    exe.chmod(0o755)
+    cache = CommandsCache({"PATH": [str(bindir)], "COMMANDS_CACHE_WATCH_PATHS": True})
+    assert "mycmd" in cache
+    path = os.path.realpath(bindir)
+    cache._paths_counts[path] = -1  # changed, as seen by the watcher
+
+    def getmtime(p):
+        raise FileNotFoundError(p)
+
+    monkeypatch.setattr("os.path.getmtime", getmtime)
+    assert "mycmd" not in cache
+    assert path not in cache._paths_cache
+
+
+@skip_if_on_windows
+def test_update_cache_scans_paths_concurrently(tmp_path, monkeypatch):
+    paths = []
+    for i in range(4):
+        bindir = tmp_path / f"bin{i}"
+        bindir.mkdir()
+        exe = bindir / f"cmd{i}"
+        exe.touch()
+        exe.chmod(0o755)
+        (bindir / f"data{i}").touch()
+        paths.append(str(bindir))
+    threads = set()
+    scan = commands_cache.executables_in
+
+    def exin(path):
+        threads.add(threading.current_thread().name)
+        time.sleep(0.05)  # keep the threads busy, so each scans one path
+        return scan(path)
+
+    monkeypatch.setattr(commands_cache, "executables_in", exin)
+    cache = CommandsCache({"PATH": paths, "ENABLE_COMMANDS_CACHE": False})
+    cached = cache.update_cache()
+    assert {f"cmd{i}" for i in range(4)} <= set(cached)
+    assert not any(f"data{i}" in cached for i in range(4))
+    assert len(threads) > 1
+    assert set(cache.scan_timings) == {os.path.realpath(p) for p in paths}
+    assert all(t >= 0.05 for t in cache.scan_timings.values())
+    # the threads are reused by the next scan
+    threads.clear()
+    CommandsCache({"PATH": paths, "ENABLE_COMMANDS_CACHE": False}).update_cache()
+    assert threads and threads <= {t.name for t in threading.enumerate()}
+
+
+def test_commands_index(tmp_path):
+    index = CommandsIndex(str(tmp_path / "index"))
+    assert index.get("/usr/bin", 1.5) is None
+    index.put("/usr/bin", 1.5, ("ls", "cat", "\udcff-bytes"))
+    assert index.get("/usr/bin", 1.5) == ("ls", "cat", "\udcff-bytes")
+    assert index.get("/usr/bin", 2.5) is None
+    assert index.get("/bin", 1.5) is None
+    index.put("/usr/bin", 2.5, ())
+    assert index.get("/usr/bin", 2.5) == ()
+    assert [p.suffix for p in (tmp_path / "index").iterdir()] == [".idx"]
+
+
+def test_commands_index_invalid(tmp_path):
+    index = CommandsIndex(str(tmp_path))
+    index.put("/usr/bin", 1.5, ("ls",))
+    fname = index.filename("/usr/bin")
+    with open(fname, "rb") as f:
+        data = f.read()
+    for corrupt in (b"", data[:-1], data[: CommandsIndex.HEADER.size - 1]):
+        with open(fname, "wb") as f:
+            f.write(corrupt)
+        assert index.get("/usr/bin", 1.5) is None
+    with open(fname, "wb") as f:
+        f.write(data.replace(b"DSHCMD\x02", b"DSHCMD\x03"))
+    assert index.get("/usr/bin", 1.5) is None
+
+
+def test_commands_index_untrusted_entries(tmp_path, monkeypatch):
+    index = CommandsIndex(str(tmp_path))
+    now = time.time()
+    index.put("/usr/bin", now - 0.5, ("ls",))
+    # modified just before the scan, later changes may have kept the mtime
+    assert index.get("/usr/bin", now - 0.5) is None
+    index.put("/usr/bin", 1.5, ("ls",))
+    assert index.get("/usr/bin", 1.5) == ("ls",)
+    monkeypatch.setattr(CommandsIndex, "MAX_AGE", -1.0)
+    assert index.get("/usr/bin", 1.5) is None
+
+
+@skip_if_on_windows
+def test_commands_index_shared_between_caches(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    exe = bindir / "mycmd"
+    exe.touch()
+    exe.chmod(0o755)
+    os.utime(bindir, (time.time() - 10,) * 2)
+    env = {"PATH": [str(bindir)], "DEEPSH_CACHE_DIR": str(tmp_path / "cache")}
+    assert "mycmd" in CommandsCache(env).update_cache()
+
+    scanned = []
+    scan = commands_cache.executables_in
+    monkeypatch.setattr(
+        commands_cache, "executables_in", lambda p: scanned.append(p) or scan(p)
+    )
+    assert "mycmd" in CommandsCache(env).update_cache()
+    assert scanned == []
+
+    os.utime(bindir, ns=(0, 0))  # the directory changed since it was indexed
+    assert "mycmd" in CommandsCache(env).update_cache()
+    assert scanned == [os.path.realpath(bindir)]
+
+
+@skip_if_on_windows
+def test_commands_index_chmod(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    exe = bindir / "mycmd"
+    exe.touch()
+    os.utime(bindir, (time.time() - 10,) * 2)
+    env = {"PATH": [str(bindir)], "DEEPSH_CACHE_DIR": str(tmp_path / "cache")}
+    assert "mycmd" not in CommandsCache(env).update_cache()
+
+    mtime = os.stat(bindir).st_mtime_ns
+    exe.chmod(0o755)  # the mtime of the directory stays the same
+    assert os.stat(bindir).st_mtime_ns == mtime
+    assert "mycmd" not in CommandsCache(env).update_cache()  # until it expires
+    monkeypatch.setattr(CommandsIndex, "MAX_AGE", -1.0)
+    assert "mycmd" in CommandsCache(env).update_cache()
+
+
+def test_command_names_startswith():
+    names = CommandNames()
+    names.update(["git", "Gitk", "gcc", "grep", "ls", "gi"])
+    assert list(names.startswith("gi")) == ["gi", "git"]
+    assert list(names.startswith("gi", ignore_case=True)) == ["gi", "git", "Gitk"]
+    assert list(names.startswith("GI", ignore_case=True)) == ["gi", "git", "Gitk"]
+    assert list(names.startswith("x")) == []
+    assert len(list(names.startswith(""))) == 6
+
+
+def test_command_names_update():
+    names = CommandNames()
+    initial = [f"cmd{i}" for i in range(100)]
+    names.update(initial)
+    names.update(initial[1:] + ["cmd5x"])  # few changes are applied in place
+    expected = ["cmd5"] + [f"cmd5{i}" for i in range(10)] + ["cmd5x"]
+    assert list(names.startswith("cmd5")) == expected
+    assert list(names.startswith("cmd0")) == []
+    names.update(["ls"])
+    assert list(names.startswith("")) == ["ls"]
+
+
+def test_iter_commands_with_prefix(xession, monkeypatch):
+    cache = xession.commands_cache
+    monkeypatch.setattr(cache, "update_cache", lambda: cache._cmds_cache)
+    cache._cmds_cache = {"git": ("/bin/git", None), "gitk": ("gitk", True)}
+    assert list(cache.iter_commands_with_prefix("git")) == [
+        ("git", ("/bin/git", None)),
+        ("gitk", ("gitk", True)),
+    ]
+    cache._cmds_cache = {"git": ("/bin/git", None), "ls": ("/bin/ls", None)}
+    assert [n for n, _ in cache.iter_commands_with_prefix("")] == ["git", "ls"]
+
+
+def test_threadable_predictions(tmp_path):
+    binary = tmp_path / "bin"
+    binary.write_bytes(b"isatty")
+    store = ThreadablePredictions(str(tmp_path / "predictions.json"))
+    assert store.get(str(binary)) is None
+    store.put(str(binary), False)
+    assert store.get(str(binary)) is False
+    assert not os.path.exists(store.filename)  # until it is saved
+    store.save()
+    assert ThreadablePredictions(store.filename).get(str(binary)) is False
+
+    binary.write_bytes(b"isatty tcgetattr")  # the size changed
+    assert store.get(str(binary)) is None
+    assert store.get(str(tmp_path / "missing")) is None
+
+
+def test_threadable_predictions_save_merges(tmp_path):
+    binaries = [tmp_path / "tui", tmp_path / "cli"]
+    for binary in binaries:
+        binary.write_bytes(b"")
+    filename = str(tmp_path / "predictions.json")
+    # two shells predict a binary each before either saves
+    stores = [ThreadablePredictions(filename) for _ in binaries]
+    for store, binary in zip(stores, binaries):
+        store.put(str(binary), binary.name == "cli")
+    for store in stores:
+        store.save()
+    saved = ThreadablePredictions(filename)
+    assert [saved.get(str(binary)) for binary in binaries] == [False, True]
+
+
+@skip_if_on_windows
+def test_predictor_readbin_uses_saved_predictions(xession, tmp_path, monkeypatch):
+    binary = tmp_path / "tui"
+    binary.write_bytes(b"ncurses")
+    cache = xession.commands_cache
+    args = ("", str(binary))
+    kwargs = {"timeout": 1, "failure": None}
+    assert cache.default_predictor_readbin(*args, **kwargs) is predict_false
+    cache.save_predictions()
+    assert (tmp_path / CommandsCache.PREDICTIONS_FILE).exists()
+
+    monkeypatch.setattr(cache, "_read_threadable", lambda *a: pytest.fail())
+    new_cache = CommandsCache(xession.env)
+    assert new_cache.default_predictor_readbin(*args, **kwargs) is predict_false
+
+
+@skip_if_on_windows
+def test_restore_predictions(tmp_path):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    for name in ("tui", "cli"):
+        exe = bindir / name
+        exe.write_bytes(b"ncurses" if name == "tui" else b"plain")
+        exe.chmod(0o755)
+    env = {"PATH": [str(bindir)], "DEEPSH_CACHE_DIR": str(tmp_path)}
+    store = ThreadablePredictions(str(tmp_path / CommandsCache.PREDICTIONS_FILE))
+    store.put(str(bindir / "tui"), False)
+    store.save()
+
+    cache = CommandsCache(env, aliases={})
+    cache.update_cache()
+    deadline = time.monotonic() + 5
+    while "tui" not in cache.threadable_predictors and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.threadable_predictors["tui"] is predict_false
+    assert "cli" not in cache.threadable_predictors
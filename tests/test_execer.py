@@ -194,3 +194,126 @@ def test_exec_scope_reuse(deepsh_execer_exec):
     assert deepsh_execer_exec("x = 0")
     with pytest.raises(NameError):
         deepsh_execer_exec("print(x)")
+
+
+@pytest.fixture
+def parse_cache(deepsh_execer, deepsh_session, monkeypatch, tmp_path):
+    monkeypatch.setitem(deepsh_session.env, "DEEPSH_PARSE_CACHE_SIZE", 2)
+    monkeypatch.setitem(deepsh_session.env, "DEEPSH_CACHE_DIR", str(tmp_path))
+    deepsh_execer.parse_cache.clear()
+    yield deepsh_execer.parse_cache
+    deepsh_execer.parse_cache.clear()
+
+
+def test_parse_cache_reuses_code(deepsh_execer, parse_cache):
+    code = deepsh_execer.compile("ls -l\n", glbs={}, locs={})
+    assert deepsh_execer.compile("ls -l\n", glbs={}, locs={}) is code
+    assert deepsh_execer.compile("ls -l\n", glbs={"x": 1}, locs={}) is code
+
+
+def test_parse_cache_follows_context(deepsh_execer, parse_cache):
+    code = deepsh_execer.compile("ls -l\n", glbs={}, locs={})
+    # ls is now a Python name, so the line is no longer a subprocess
+    pycode = deepsh_execer.compile("ls -l\n", glbs={"ls": 1}, locs={})
+    assert pycode is not code
+    assert deepsh_execer.eval("ls -l", glbs={"ls": 1}, locs={"l": 1}) == 0
+    assert deepsh_execer.compile("ls -l\n", glbs={}, locs={}) is code
+    assert deepsh_execer.compile("ls -l\n", glbs={"ls": 2}, locs={}) is pycode
+
+
+def test_parse_cache_lru(deepsh_execer, parse_cache):
+    for cmd in ("x = 1\n", "y = 2\n", "z = 3\n"):
+        deepsh_execer.compile(cmd, glbs={}, locs={})
+    assert len(parse_cache) == 2
+    assert parse_cache.get(("x = 1\n", "exec", "<deepsh-code>"), {}, {}) is None
+
+
+def test_parse_cache_persist(deepsh_execer, deepsh_session, parse_cache, monkeypatch):
+    from deepsh.codecache import ParseCache
+
+    monkeypatch.setitem(deepsh_session.env, "DEEPSH_PARSE_CACHE_PERSIST", True)
+    code = deepsh_execer.compile("echo hi\n", glbs={}, locs={})
+    parse_cache.save()
+    loaded = ParseCache()
+    assert loaded.get(("echo hi\n", "exec", "<deepsh-code>"), {}, {}) == code
+
+
+def test_parse_cache_save_replaces_file(
+    deepsh_execer, deepsh_session, parse_cache, monkeypatch, tmp_path
+):
+    monkeypatch.setitem(deepsh_session.env, "DEEPSH_PARSE_CACHE_PERSIST", True)
+    replaced = []
+    replace = os.replace
+    monkeypatch.setattr(
+        os, "replace", lambda src, dst: replaced.append(dst) or replace(src, dst)
+    )
+    deepsh_execer.compile("echo hi\n", glbs={}, locs={})
+    parse_cache.save()
+    assert replaced == [parse_cache.cache_file]
+    assert os.listdir(tmp_path) == [parse_cache.CACHE_FILE]
+
+
+def test_parse_ctx_free_wraps_statements(deepsh_execer):
+    src = "x = 1\nls -l /\nif x:\n    echo hi\nelse:\n    echo bye\n@dec\ndef f():\n    pass\nls .\n"
+    _, wrapped = deepsh_execer._parse_ctx_free(src)
+    assert wrapped == (
+        "x = 1\n![ls -l /]\nif x:\n    ![echo hi]\nelse:\n    ![echo bye]\n"
+        "@dec\ndef f():\n    pass\n![ls .]\n"
+    )
+
+
+def test_parse_ctx_free_error_lineno(deepsh_execer):
+    src = "ls -l\nx = 1\necho hi\ndef f(:\n    pass\n"
+    with pytest.raises(SyntaxError) as exc:
+        deepsh_execer._parse_ctx_free(src)
+    assert exc.value.lineno == 4
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "git status",
+        "ls -la /tmp",
+        "cd ~/src",
+        "make -j8",
+        "ls",
+        "x.y --foo=bar 1e5",
+        "./run.sh -v",
+    ],
+)
+@pytest.mark.parametrize("mode", ["single", "exec"])
+def test_parse_command_line_matches_parser(deepsh_execer, monkeypatch, line, mode):
+    import ast
+    import builtins
+
+    ctx = set(dir(builtins)) | {"__deepsh__"}
+    tree = deepsh_execer._parse_command_line(line + "\n", set(ctx), mode=mode)
+    assert tree is not None
+    monkeypatch.setattr(deepsh_execer, "_parse_command_line", lambda *a, **kw: None)
+    expected = deepsh_execer.parse(line + "\n", set(ctx), mode=mode)
+    assert ast.dump(tree, include_attributes=True) == ast.dump(
+        expected, include_attributes=True
+    )
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "x = 1",
+        "ls | grep x",
+        "echo $HOME",
+        "ls *.py",
+        "echo 'hi'",
+        "ls # c",
+        "ls -l -n",
+    ],
+)
+def test_parse_command_line_falls_back(deepsh_execer, line):
+    assert deepsh_execer._parse_command_line(line + "\n", {"__deepsh__"}) is None
+
+
+def test_parse_command_line_python_names(deepsh_execer):
+    # all names defined, so this is a subtraction
+    ctx = {"__deepsh__", "ls", "l"}
+    assert deepsh_execer._parse_command_line("ls -l\n", ctx) is None
+    assert deepsh_execer._parse_command_line("ls -l\n", ctx - {"l"}) is not None
@@ -1,11 +1,12 @@
 """Testing deepsh import hooks"""
 
 import os
+import sys
 from importlib import import_module
 
 import pytest
 
-from deepsh import imphooks
+from deepsh import codecache, imphooks
 
 
 @pytest.fixture(autouse=True)
@@ -69,3 +70,35 @@ def test_get_source():
     source = loader.get_source("sample")
     with open(os.path.join(TEST_DIR, "sample.xsh")) as srcfile:
         assert source == srcfile.read()
+
+
+@pytest.fixture
+def cached_module(tmp_path, monkeypatch):
+    monkeypatch.setattr("sys.dont_write_bytecode", False)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    src = tmp_path / "cached_xsh.xsh"
+    src.write_text("x = $(echo cached)\n")
+    yield src
+    sys.modules.pop("cached_xsh", None)
+
+
+def test_module_bytecode_cache(cached_module, monkeypatch):
+    mod = import_module("cached_xsh")
+    assert mod.x == "cached\n"
+    cachefname = codecache.module_cache_filename(str(cached_module))
+    assert os.path.isfile(cachefname)
+    assert os.path.basename(cachefname).startswith("cached_xsh.deepsh.")
+
+    # the cached code is used without compiling the source again
+    del sys.modules["cached_xsh"]
+    monkeypatch.setattr(mod.__loader__._execer, "compile", None)
+    assert import_module("cached_xsh").x == "cached\n"
+
+
+def test_module_bytecode_cache_invalidated(cached_module):
+    import_module("cached_xsh")
+    del sys.modules["cached_xsh"]
+    cached_module.write_text("x = $(echo changed)\n")
+    st = cached_module.stat()
+    os.utime(cached_module, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert import_module("cached_xsh").x == "changed\n"
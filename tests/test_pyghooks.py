@@ -7,6 +7,7 @@ from tempfile import TemporaryDirectory
 
 import pytest
 
+from deepsh import style_tools
 from deepsh.environ import LsColors
 from deepsh.platform import ON_WINDOWS
 from deepsh.pyghooks import (
@@ -20,6 +21,7 @@ from deepsh.pyghooks import (
     color_name_to_pygments_code,
     file_color_tokens,
     get_style_by_name,
+    partial_color_tokenize,
     register_custom_pygments_style,
 )
 
@@ -67,6 +69,17 @@ DEFAULT_STYLES = {
 }
 
 
+def test_partial_color_tokenize_shares_style_tools_cache(xs_LS_COLORS):
+    style_tools.compile_color_template.cache_clear()
+    template = "{RED}my {GREEN}cat"
+    toks = partial_color_tokenize(template)
+    assert toks == [(Color.RED, "my "), (Color.GREEN, "cat")]
+    assert partial_color_tokenize(template) == toks
+    assert style_tools.compile_color_template.cache_info().hits == 1
+    # the tokens of style_tools are kept apart from the pygments ones
+    assert style_tools.partial_color_tokenize(template)[0][0] is not Color.RED
+
+
 @pytest.mark.parametrize(
     "name, exp",
     [